@@ -0,0 +1,123 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from .scenarios import SCENARIOS, run_isolated
+from .startup import STARTUP_MODULES, measure_startup
+
+
+def _op_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(','):
+        op, weight = part.split('=')
+        mix[op.strip()] = float(weight)
+    return mix
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float, startup_tolerance: float = 0.5) -> list:
+    """
+    Compares end-to-end throughput and startup time against a baseline run.
+
+    :param results: dict. Current results
+    :param baseline: dict. Results of a previous run
+    :param tolerance: float. Allowed relative drop in docs/s, e.g. 0.1 for 10%
+    :param startup_tolerance: float. Allowed relative increase in import time. Default: 0.5
+    :return: list of str. One message per regressed scenario or entry point
+    """
+    previous = {s['name']: s for s in baseline.get('scenarios', []) if 'stages' in s}
+    regressions = []
+    for scenario in results['scenarios']:
+        before = previous.get(scenario['name'])
+        if not before or 'stages' not in scenario:
+            continue
+        old, new = before['stages']['tail']['docs_per_s'], scenario['stages']['tail']['docs_per_s']
+        if old and new < old * (1 - tolerance):
+            regressions.append(f"{scenario['name']}: {new} docs/s, baseline {old} docs/s")
+    previous = {s['module']: s for s in baseline.get('startup', [])}
+    for startup in results.get('startup', []):
+        before = previous.get(startup['module'])
+        if not before:
+            continue
+        old, new = before['import_ms']['median'], startup['import_ms']['median']
+        if new > old * (1 + startup_tolerance):
+            regressions.append(f"{startup['module']}: imports in {new} ms, baseline {old} ms")
+        loaded = sorted(set(startup['loaded']) - set(before['loaded']))
+        if loaded:
+            regressions.append(f"{startup['module']}: imports {', '.join(loaded)}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='pyTails throughput benchmarks')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run. Repeat for more. Default: all')
+    parser.add_argument('--count', type=int, default=100000, help='Oplog entries per scenario')
+    parser.add_argument('--doc-size', type=int, default=512, help='Approximate size of inserted documents in bytes')
+    parser.add_argument('--namespaces', type=int, default=10, help='Number of namespaces')
+    parser.add_argument('--op-mix', type=_op_mix, default='i=6,u=3,d=1', help='Weights of op types, e.g. i=6,u=3,d=1')
+    parser.add_argument('--mongo-host', help='Tail a local mongod replica set instead of the synthetic oplog')
+    parser.add_argument('--mongo-port', type=int, default=27017)
+    parser.add_argument('--replica-set', default='rs0')
+    parser.add_argument('--output', help='Write JSON results to this file. Default: stdout')
+    parser.add_argument('--baseline', help='JSON results of a previous run. Exits with 1 if throughput regressed')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative throughput drop. Default: 0.1')
+    parser.add_argument('--startup-runs', type=int, default=5,
+                        help='Fresh interpreters timed per entry point import. 0 skips startup. Default: 5')
+    parser.add_argument('--startup-tolerance', type=float, default=0.5,
+                        help='Allowed relative increase in import time. Default: 0.5')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    mongo = None
+    if args.mongo_host:
+        mongo = dict(host=args.mongo_host, port=args.mongo_port, replica_set=args.replica_set)
+
+    results = dict(meta=dict(started=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), revision=_git_revision(),
+                             python=platform.python_version(), platform=platform.platform(), cpus=os.cpu_count()),
+                   scenarios=[], startup=[])
+    for module in STARTUP_MODULES if args.startup_runs > 0 else []:
+        startup = measure_startup(module, runs=args.startup_runs)
+        results['startup'].append(startup)
+        print(f"{module}: imports in {startup['import_ms']['median']} ms"
+              f"{', loads ' + ', '.join(startup['loaded']) if startup['loaded'] else ''}", file=sys.stderr)
+    for name in args.scenario or sorted(SCENARIOS):
+        result = run_isolated(name, SCENARIOS[name], count=args.count, doc_size=args.doc_size,
+                              namespaces=args.namespaces, op_mix=args.op_mix, mongo=mongo)
+        results['scenarios'].append(result)
+        tail = result.get('stages', {}).get('tail', {})
+        print(f"{name}: {tail.get('docs_per_s')} docs/s, p99 {result.get('latency_ms', {}).get('p99')} ms"
+              f"{', error ' + result['error'] if 'error' in result else ''}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    failed = any('error' in s for s in results['scenarios'])
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.startup_tolerance)
+        for message in regressions:
+            print(f'regression: {message}', file=sys.stderr)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+In-process stand-ins for Kinesis, Firehose, DynamoDB and MongoDB with injectable latency and throttling.
+"""
+import bisect
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+from bson import BSON
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+
+from pytails.helpers.bson_utils import bson_timestamp_to_int
+from pytails.sinks.kpl import deaggregate
+
+
+class _FakeService:
+    def __init__(self, latency: float = 0.0, throttle_rate: float = 0.0, seed: int = 0):
+        """
+        :param latency: float. Seconds every call takes
+        :param throttle_rate: float. Probability that a record in a batch is rejected
+        :param seed: int. Random seed for throttling
+        """
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.records = 0
+        self.bytes = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, records: list, error_code: str) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        with self._lock:
+            self.calls += 1
+            for record in records:
+                if self.throttle_rate and self._random.random() < self.throttle_rate:
+                    self.throttled += 1
+                    results.append({'ErrorCode': error_code, 'ErrorMessage': 'Rate exceeded'})
+                    continue
+                self.records += self._count(record)
+                self.bytes += len(record['Data'])
+                results.append({'RecordId': str(self.records)})
+        return results
+
+    def _count(self, record: dict) -> int:
+        return 1
+
+    def stats(self) -> dict:
+        return dict(calls=self.calls, records=self.records, bytes=self.bytes, throttled=self.throttled)
+
+
+class FakeKinesis(_FakeService):
+    """
+    Kinesis client accepting `put_records` and `list_shards`. Aggregated records are counted as their user records.
+    """
+
+    def __init__(self, shards: int = 4, **kwargs):
+        super().__init__(**kwargs)
+        self.shards = shards
+
+    def _count(self, record: dict) -> int:
+        return len(deaggregate(record['Data']))
+
+    def put_records(self, StreamName: str, Records: list) -> dict:
+        results = self._call(Records, 'ProvisionedThroughputExceededException')
+        failed = sum(1 for r in results if 'ErrorCode' in r)
+        return {'FailedRecordCount': failed, 'Records': results}
+
+    def list_shards(self, **kwargs) -> dict:
+        width = 2 ** 128 // self.shards
+        shards = []
+        for n in range(self.shards):
+            end = 2 ** 128 - 1 if n == self.shards - 1 else (n + 1) * width - 1
+            shards.append({'ShardId': f'shardId-{n:012d}',
+                           'HashKeyRange': {'StartingHashKey': str(n * width), 'EndingHashKey': str(end)},
+                           'SequenceNumberRange': {'StartingSequenceNumber': '0'}})
+        return {'Shards': shards}
+
+
+class FakeFirehose(_FakeService):
+    """
+    Firehose client accepting `put_record_batch`.
+    """
+
+    def put_record_batch(self, DeliveryStreamName: str, Records: list) -> dict:
+        results = self._call(Records, 'ServiceUnavailableException')
+        failed = sum(1 for r in results if 'ErrorCode' in r)
+        return {'FailedPutCount': failed, 'RequestResponses': results}
+
+
+class FakeDynamoTable:
+    """
+    DynamoDB Table resource accepting the calls made by `DynamoDbStore`.
+    """
+
+    def __init__(self, latency: float = 0.0, page_size: int = 100):
+        self.latency = latency
+        self.page_size = page_size
+        self.items = {}
+        self.writes = 0
+        self.scans = 0
+        self._lock = threading.Lock()
+
+    def update_item(self, Key: dict, UpdateExpression: str, ExpressionAttributeValues: dict,
+                    ConditionExpression: str = None) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        key = tuple(sorted(Key.items()))
+        with self._lock:
+            item = self.items.get(key, dict(Key))
+            if ConditionExpression and not self._matches(item, ConditionExpression, ExpressionAttributeValues):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException',
+                                             'Message': 'The conditional request failed'}}, 'UpdateItem')
+            action, _, assignments = UpdateExpression.partition(' ')
+            for assignment in assignments.split(','):
+                if action == 'REMOVE':
+                    item.pop(assignment.strip(), None)
+                    continue
+                name, value = assignment.strip().split('=')
+                item[name] = ExpressionAttributeValues[value]
+            self.items[key] = item
+            self.writes += 1
+        return {}
+
+    @staticmethod
+    def _matches(item: dict, expression: str, values: dict) -> bool:
+        # `OR` of `attribute_not_exists(a)`, `a = :v` and `a < :v` clauses
+        for clause in expression.split(' OR '):
+            clause = clause.strip()
+            if clause.startswith('attribute_not_exists('):
+                if clause[len('attribute_not_exists('):-1] not in item:
+                    return True
+                continue
+            name, op, value = clause.split()
+            if name in item and (item[name] == values[value] if op == '=' else item[name] < values[value]):
+                return True
+        return False
+
+    def get_item(self, Key: dict, ConsistentRead: bool = False) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        item = self.items.get(tuple(sorted(Key.items())))
+        return {'Item': item} if item else {}
+
+    def scan(self, Segment: int = 0, TotalSegments: int = 1, ExclusiveStartKey: dict = None, **kwargs) -> dict:
+        # pages of `page_size` items, segments split the key space by position
+        keys = sorted(self.items)[Segment::TotalSegments]
+        start = keys.index(tuple(sorted(ExclusiveStartKey.items()))) + 1 if ExclusiveStartKey else 0
+        page = keys[start:start + self.page_size]
+        self.scans += 1
+        resp = {'Items': [dict(self.items[k]) for k in page]}
+        if start + self.page_size < len(keys):
+            resp['LastEvaluatedKey'] = dict(page[-1])
+        return resp
+
+
+class FakeCursor:
+    """
+    Tailable cursor over BSON oplog entries. Entries are decoded while iterating, as the driver would.
+    """
+
+    def __init__(self, entries: list, codec_options, ops: list = None):
+        self._entries = entries
+        self._codec_options = codec_options
+        self._ops = set(ops) if ops else None
+        self.alive = True
+
+    def __iter__(self):
+        for data in self._entries:
+            if not self.alive:
+                return
+            doc = BSON(data).decode(self._codec_options)
+            if self._ops is None or doc['op'] in self._ops:
+                yield doc
+        self.alive = False
+
+    def close(self):
+        self.alive = False
+
+
+class FakeOplogCollection:
+    def __init__(self, entries: list, codec_options=DEFAULT_CODEC_OPTIONS, ts: list = None):
+        self._entries = entries
+        self._codec_options = codec_options
+        self._ts = ts or [bson_timestamp_to_int(BSON(e).decode()['ts']) for e in entries]
+
+    def with_options(self, codec_options=None, **kwargs):
+        return FakeOplogCollection(self._entries, codec_options or self._codec_options, self._ts)
+
+    def find(self, query: dict = None, projection: dict = None, **kwargs) -> FakeCursor:
+        start, end = 0, len(self._entries)
+        if query and 'ts' in query:
+            start = bisect.bisect_left(self._ts, bson_timestamp_to_int(query['ts']['$gte']))
+            if '$lt' in query['ts']:
+                end = bisect.bisect_left(self._ts, bson_timestamp_to_int(query['ts']['$lt']))
+        ops = query.get('op', {}).get('$in') if query else None
+        return FakeCursor(self._entries[start:end], self._codec_options, ops)
+
+
+class FakeMongoClient:
+    """
+    MongoClient serving a synthetic `local.oplog.rs`. Only supports what `OplogClient` uses while tailing.
+    """
+    address = ('synthetic', 27017)
+
+    def __init__(self, entries: list):
+        self.local = SimpleNamespace(oplog=SimpleNamespace(rs=FakeOplogCollection(entries)))
+
+    def server_info(self) -> dict:
+        return {'version': '4.0.0'}
+
+    def close(self):
+        pass
@@ -0,0 +1,61 @@
+import random
+import time
+
+from bson import BSON, ObjectId, Timestamp
+
+
+class SyntheticOplog:
+    """
+    Generates oplog entries with a configurable op mix, document size and number of namespaces. Entries are
+    generated once, as BSON, so every scenario replays the same bytes.
+    """
+
+    def __init__(self, count: int, op_mix: dict = None, doc_size: int = 512, namespaces: int = 10,
+                 ids_per_namespace: int = 1000, seed: int = 0):
+        """
+        :param count: int. Number of oplog entries
+        :param op_mix: dict. op type -> weight. Default: `{'i': 6, 'u': 3, 'd': 1}`
+        :param doc_size: int. Approximate BSON size of inserted documents
+        :param namespaces: int. Number of `db.collection` namespaces
+        :param ids_per_namespace: int. Distinct `_id`s updated and deleted per namespace
+        :param seed: int. Random seed
+        """
+        self.count = count
+        self.op_mix = op_mix or {'i': 6, 'u': 3, 'd': 1}
+        self.doc_size = doc_size
+        self.namespaces = [f'bench.coll{n}' for n in range(namespaces)]
+        self.ids_per_namespace = ids_per_namespace
+        self.seed = seed
+        self.entries = []
+
+    def generate(self) -> list:
+        """
+        Builds the oplog entries.
+
+        :return: list of bytes. BSON encoded oplog entries in `ts` order
+        """
+        rnd = random.Random(self.seed)
+        ops, weights = zip(*self.op_mix.items())
+        base = int(time.time()) - self.count // 1000 - 1
+        padding = 'x' * max(self.doc_size - 120, 0)
+        self.entries = []
+        for i in range(self.count):
+            ns = rnd.choice(self.namespaces)
+            _id = ObjectId(f'{rnd.randrange(self.ids_per_namespace):024x}')
+            op = rnd.choices(ops, weights)[0]
+            entry = {'ts': Timestamp(base + i // 1000, i % 1000 + 1), 't': 1, 'h': rnd.getrandbits(63),
+                     'v': 2, 'op': op, 'ns': ns}
+            if op == 'i':
+                entry['o'] = {'_id': _id, 'seq': i, 'status': rnd.choice(('new', 'paid', 'shipped')),
+                              'amount': rnd.random() * 1000, 'payload': padding}
+            elif op == 'u':
+                entry['o2'] = {'_id': _id}
+                entry['o'] = {'$set': {'status': rnd.choice(('new', 'paid', 'shipped')), 'seq': i}}
+            else:
+                entry['o'] = {'_id': _id}
+            self.entries.append(BSON.encode(entry))
+        return self.entries
+
+    @property
+    def bytes(self) -> int:
+        return sum(len(e) for e in self.entries)
@@ -0,0 +1,274 @@
+import logging
+import multiprocessing
+import resource
+import sys
+import threading
+import time
+
+from bson import BSON
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import DESCENDING, MongoClient
+
+from pytails.helpers.bson_utils import bson_timestamp_to_int
+from pytails.helpers.codecs import get_codec
+from pytails.helpers.oplog_utils import oplog_doc_key
+from pytails.mongo.oplog_client import OplogClient
+from pytails.sinks import Record, Sink
+from pytails.sinks.firehose import FirehoseSink
+from pytails.sinks.kinesis import KinesisSink
+from pytails.state.ddb_store import DynamoDbStore
+from pytails.state.committer import CheckpointCommitter
+
+from .fakes import FakeDynamoTable, FakeFirehose, FakeKinesis, FakeMongoClient
+from .oplog_gen import SyntheticOplog
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = {
+    'json-null': dict(codec='json', sink='null'),
+    'fastjson-null': dict(codec='fastjson', sink='null'),
+    'raw-bson-null': dict(codec='bson', raw_bson=True, sink='null'),
+    'json-kinesis': dict(codec='json', sink='kinesis', sink_latency=0.02),
+    'json-kinesis-throttled': dict(codec='json', sink='kinesis', sink_latency=0.02, throttle_rate=0.05),
+    'json-kinesis-aggregated': dict(codec='json', sink='kinesis', sink_latency=0.02, aggregate=True),
+    'json-kinesis-workers': dict(codec='json', sink='kinesis', sink_latency=0.02, sink_workers=4),
+    'json-firehose': dict(codec='json', sink='firehose', sink_latency=0.02),
+    'json-null-catch-up': dict(codec='json', sink='null', catch_up_workers=4),
+}
+
+
+class NullSink(Sink):
+    """
+    Acknowledges every record immediately. Measures pyTails without any sink cost.
+    """
+
+    def write_record(self, record: Record, ack=None) -> None:
+        if ack:
+            ack()
+
+
+class TimedCommitter(CheckpointCommitter):
+    """
+    Records the time from reading an oplog entry until every sink acknowledged it.
+    """
+
+    def __init__(self, store, conn, read_times: dict, interval: float = 5.0, count: int = 500):
+        super().__init__(store, conn, interval, count)
+        self.read_times = read_times
+        self.latencies = []
+        self.__lock = threading.Lock()
+
+    def track(self, ts, sinks: int, resume_token: dict = None):
+        ack = super().track(ts, sinks, resume_token)
+        started = self.read_times.pop(bson_timestamp_to_int(ts), None)
+        remaining = [sinks]
+
+        def timed_ack():
+            ack()
+            with self.__lock:
+                remaining[0] -= 1
+                if remaining[0] == 0 and started is not None:
+                    self.latencies.append(time.perf_counter() - started)
+        return timed_ack
+
+
+class BenchOplogClient(OplogClient):
+    """
+    OplogClient that records when each entry is read and stops after `expected` entries. Tails the synthetic oplog
+    if `entries` is set, or a real `mongod` otherwise.
+    """
+
+    def __init__(self, mongo_host: str, mongo_port: int, replica_set: str, expected: int, entries: list = None,
+                 **kwargs):
+        self._entries = entries
+        self.expected = expected
+        self.processed = 0
+        self.read_times = {}
+        super().__init__(mongo_host, mongo_port, 'bench', replica_set, **kwargs)
+
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        if self._entries is None:
+            return super()._connect(mongo_host, mongo_port, replica_set)
+        self._client = FakeMongoClient(self._entries)
+
+    def get_last_write_ts(self):
+        if self._entries is None:
+            return super().get_last_write_ts()
+        return BSON(self._entries[-1]).decode()['ts']
+
+    def process_doc(self, doc):
+        self.read_times[bson_timestamp_to_int(doc['ts'])] = time.perf_counter()
+        super().process_doc(doc)
+        self.processed += 1
+        if self.processed >= self.expected:
+            self.stop_tail()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB on Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class _Stage:
+    def __init__(self, results: dict, name: str, docs: int):
+        self.results = results
+        self.name = name
+        self.docs = docs
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.wall
+        self.results[self.name] = dict(docs=self.docs, seconds=round(seconds, 4),
+                                       docs_per_s=round(self.docs / seconds, 1) if seconds else None,
+                                       cpu_seconds=round(time.process_time() - self.cpu, 4),
+                                       peak_rss_mb=_peak_rss_mb())
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def _build_sink(params: dict):
+    kind = params.get('sink', 'null')
+    fake_args = dict(latency=params.get('sink_latency', 0.0), throttle_rate=params.get('throttle_rate', 0.0))
+    if kind == 'kinesis':
+        fake = FakeKinesis(**fake_args)
+        return KinesisSink('bench', 'bench-stream', linger=params.get('linger', 0.2),
+                           aggregate=params.get('aggregate', False), client=fake), fake
+    if kind == 'firehose':
+        fake = FakeFirehose(**fake_args)
+        return FirehoseSink('bench', 'bench-stream', linger=params.get('linger', 0.2), client=fake), fake
+    return NullSink('bench'), None
+
+
+def run_scenario(name: str, params: dict, count: int = 100000, doc_size: int = 512, namespaces: int = 10,
+                 op_mix: dict = None, mongo: dict = None) -> dict:
+    """
+    Runs one scenario and returns its results. Stages:
+
+    - `generate`: building the synthetic oplog
+    - `decode`: decoding every BSON entry as the driver does
+    - `encode`: serializing every entry with the scenario codec
+    - `tail`: `OplogClient.tail` -> `process_doc` -> sinks, until every record is acknowledged
+
+    :param name: str. Scenario name
+    :param params: dict. Scenario parameters, see `SCENARIOS`
+    :param count: int. Oplog entries
+    :param doc_size: int. Approximate size of inserted documents
+    :param namespaces: int. Number of namespaces
+    :param op_mix: dict. op type -> weight
+    :param mongo: dict. `host`, `port` and `replica_set` of a local mongod replica set. Optional.
+    :return: dict
+    """
+    # expected retries in throttled scenarios are counted in the results instead
+    logging.getLogger('pytails').setLevel(logging.ERROR)
+    stages = {}
+    oplog = SyntheticOplog(count, op_mix=op_mix, doc_size=doc_size, namespaces=namespaces)
+    with _Stage(stages, 'generate', count):
+        entries = oplog.generate()
+
+    raw = params.get('raw_bson', False)
+    codec_options = CodecOptions(document_class=RawBSONDocument) if raw else CodecOptions()
+    with _Stage(stages, 'decode', count):
+        docs = [BSON(e).decode(codec_options) for e in entries]
+    codec = get_codec(params.get('codec', 'json'))
+    with _Stage(stages, 'encode', count):
+        for doc in docs:
+            Record(doc if raw else {'doc': doc}, codec, oplog_doc_key(doc), doc['ts'])
+    del docs
+
+    table = FakeDynamoTable(latency=params.get('store_latency', 0.005))
+    store = DynamoDbStore('bench', 'rs0', table=table)
+    if mongo:
+        start_ts = _insert_into_mongod(mongo, entries)
+        client = BenchOplogClient(mongo['host'], mongo['port'], mongo['replica_set'], count, start_ts=start_ts,
+                                  checkpoint_store=store)
+    else:
+        client = BenchOplogClient('synthetic', 27017, 'rs0', count, entries=entries,
+                                  start_ts=BSON(entries[0]).decode()['ts'], checkpoint_store=store)
+    committer = TimedCommitter(client._checkpoint_store, lambda: str(client._client.address), client.read_times)
+    client._committer = committer
+    client.set_codec(params.get('codec', 'json'))
+    if raw:
+        client.set_raw_bson()
+    if params.get('sink_workers'):
+        client.set_sink_workers(params['sink_workers'])
+    if params.get('catch_up_workers'):
+        client.set_parallel_catch_up(workers=params['catch_up_workers'], slice_seconds=1, min_lag=0)
+    sink, fake = _build_sink(params)
+    client.register_data_sink(sink)
+
+    with _Stage(stages, 'tail', count):
+        client.tail()
+
+    latencies = committer.latencies
+    result = dict(name=name, params=params, count=count, doc_size=doc_size, namespaces=namespaces,
+                  oplog_bytes=oplog.bytes, source='mongod' if mongo else 'synthetic', stages=stages,
+                  latency_ms=dict(p50=_ms(_percentile(latencies, 0.5)), p99=_ms(_percentile(latencies, 0.99)),
+                                  max=_ms(max(latencies) if latencies else None)),
+                  acknowledged=len(latencies), checkpoint_writes=table.writes)
+    if fake is not None:
+        result['sink'] = fake.stats()
+    return result
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def _insert_into_mongod(mongo: dict, entries: list):
+    """
+    Writes one insert per synthetic entry into `bench.coll*` and returns the oplog timestamp to tail from. The
+    synthetic `_id`s repeat, so the server assigns new ones, and updates and deletes become small inserts.
+    """
+    client = MongoClient(host=mongo['host'], port=mongo['port'], replicaset=mongo['replica_set'])
+    try:
+        head = client.local.oplog.rs.find().sort('$natural', DESCENDING).limit(-1).next()['ts']
+        by_ns = {}
+        for data in entries:
+            entry = BSON(data).decode()
+            if entry['op'] == 'i':
+                doc = {k: v for k, v in entry['o'].items() if k != '_id'}
+            else:
+                doc = {'op': entry['op'], 'ts': bson_timestamp_to_int(entry['ts'])}
+            by_ns.setdefault(entry['ns'], []).append(doc)
+        for ns, docs in by_ns.items():
+            db, coll = ns.split('.', 1)
+            client[db][coll].insert_many(docs, ordered=False)
+    finally:
+        client.close()
+    return head
+
+
+def _child(conn, name, params, kwargs):
+    try:
+        conn.send(run_scenario(name, params, **kwargs))
+    except Exception as ex:
+        logger.exception(ex, extra=dict(Func='Run', Op='Benchmark'))
+        conn.send(dict(name=name, params=params, error=repr(ex)))
+    finally:
+        conn.close()
+
+
+def run_isolated(name: str, params: dict, **kwargs) -> dict:
+    """
+    Runs a scenario in a fresh process, so CPU time and peak RSS are not shared between scenarios.
+
+    :return: dict. See `run_scenario`
+    """
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_child, args=(child, name, params, kwargs), name=f'bench-{name}')
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    return result
@@ -0,0 +1,41 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# entry points whose import time is measured
+STARTUP_MODULES = ['pytails.pytails', 'pytails.mongo.oplog_client', 'pytails.mongo.cdc_client']
+# SDKs that must only be imported for the backends that are configured
+HEAVY_MODULES = ['boto3', 'botocore', 'msgpack', 'zstandard']
+
+_CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(seconds=elapsed, loaded=[m for m in {heavy!r} if m in sys.modules])))
+'''
+
+
+def measure_startup(module: str, runs: int = 5) -> dict:
+    """
+    Imports `module` in fresh interpreters and reports the import time and the heavy SDKs it loaded.
+
+    The first run is discarded, so compiling bytecode is not counted.
+
+    :param module: str. Module to import, e.g. `pytails.pytails`
+    :param runs: int. Number of measured imports. Default: 5
+    :return: dict. `{module, import_ms: {median, min}, loaded}`
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _CHILD.format(module=module, heavy=HEAVY_MODULES)
+    samples, loaded = [], []
+    for run in range(runs + 1):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        if run:
+            samples.append(result['seconds'] * 1000)
+            loaded = result['loaded']
+    return dict(module=module, import_ms=dict(median=round(statistics.median(samples), 1),
+                                              min=round(min(samples), 1)), loaded=loaded)
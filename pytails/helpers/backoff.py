@@ -0,0 +1,35 @@
+import random
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter. Delay `n` is drawn from `[0, min(initial * factor ** n, maximum)]`, so
+    several tailers reconnecting to the same server do not retry in lockstep.
+    """
+
+    def __init__(self, initial: float = 0.1, maximum: float = 30.0, factor: float = 2.0):
+        """
+        :param initial: float. Upper bound of the first delay in seconds
+        :param maximum: float. Upper bound of any delay in seconds
+        :param factor: float. Growth of the upper bound per attempt
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempt = 0
+
+    def next(self) -> float:
+        """
+        Returns the next delay in seconds.
+
+        :return: float
+        """
+        delay = random.uniform(0, min(self.initial * self.factor ** self.attempt, self.maximum))
+        self.attempt += 1
+        return delay
+
+    def reset(self) -> None:
+        """
+        Starts over from `initial` after a successful attempt.
+        """
+        self.attempt = 0
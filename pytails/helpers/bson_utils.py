@@ -11,3 +11,20 @@ def int_to_bson_timestamp(ts: int):
     t = ts >> 32
     i = ts & (2 ** 32 - 1)
     return Timestamp(time=t, inc=i)
+
+
+def parse_timestamp(value: str) -> Timestamp:
+    """
+    Parses a timestamp given as `seconds:increment`, as the 64 bit integer stored in checkpoints, or as seconds since
+    the epoch.
+
+    :param value: str
+    :return: Timestamp
+    """
+    if ':' in value:
+        t, i = value.split(':', 1)
+        return Timestamp(int(t), int(i))
+    ts = int(value)
+    if ts >= 2 ** 32:
+        return int_to_bson_timestamp(ts)
+    return Timestamp(ts, 0)
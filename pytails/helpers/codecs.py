@@ -0,0 +1,135 @@
+import abc
+import json
+
+from bson import BSON, json_util
+from bson.raw_bson import RawBSONDocument
+from bson.json_util import JSONOptions, JSONMode, DatetimeRepresentation
+
+
+class Codec(metaclass=abc.ABCMeta):
+    """
+    Serializes a record to bytes.
+    """
+    name = None
+    # True if the output is not UTF-8 text
+    binary = False
+
+    @abc.abstractmethod
+    def encode(self, obj) -> bytes:
+        pass
+
+    def decode(self, data: bytes):
+        """
+        Returns the document encoded in `data`. Extended JSON types are restored where the encoding keeps them.
+        """
+        raise NotImplementedError(f'{self.name} codec cannot decode records')
+
+
+class ExtendedJsonCodec(Codec):
+    """
+    MongoDB Extended JSON via `bson.json_util`. Without `json_options` the output matches `json_util.dumps(obj)`.
+    """
+
+    def __init__(self, name: str = 'json', json_options: JSONOptions = None):
+        self.name = name
+        self.json_options = json_options
+
+    def encode(self, obj) -> bytes:
+        if self.json_options:
+            return json_util.dumps(obj, json_options=self.json_options).encode('utf-8')
+        return json_util.dumps(obj).encode('utf-8')
+
+    def decode(self, data: bytes):
+        return json_util.loads(data.decode('utf-8'), json_options=self.json_options or json_util.DEFAULT_JSON_OPTIONS)
+
+
+class FastJsonCodec(Codec):
+    """
+    Compact JSON encoded by `orjson` if it is installed, or the standard library otherwise. Only BSON types the
+    encoder does not know are converted to relaxed Extended JSON. Dates are passed through to the same conversion,
+    so both encoders write the same bytes, except for `uuid.UUID` values, which orjson always writes as strings.
+    """
+    name = 'fastjson'
+    json_options = JSONOptions(json_mode=JSONMode.RELAXED, datetime_representation=DatetimeRepresentation.ISO8601)
+
+    def __init__(self):
+        try:
+            import orjson
+            self.__dumps = lambda obj: orjson.dumps(obj, default=self._default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except ImportError:
+            encoder = json.JSONEncoder(default=self._default, separators=(',', ':'))
+            self.__dumps = lambda obj: encoder.encode(obj).encode('utf-8')
+
+    def _default(self, obj):
+        return json_util.default(obj, json_options=self.json_options)
+
+    def encode(self, obj) -> bytes:
+        return self.__dumps(obj)
+
+    def decode(self, data: bytes):
+        return json_util.loads(data.decode('utf-8'), json_options=self.json_options)
+
+
+class MsgPackCodec(Codec):
+    """
+    MessagePack encoded by `msgpack`. BSON types are converted to relaxed Extended JSON documents.
+    """
+    name = 'msgpack'
+    binary = True
+    json_options = JSONOptions(json_mode=JSONMode.RELAXED, datetime_representation=DatetimeRepresentation.ISO8601)
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError('msgpack codec requires the msgpack package: pip install msgpack')
+        self.__packer = msgpack.Packer(default=self._default, use_bin_type=True, datetime=False)
+
+    def _default(self, obj):
+        return json_util.default(obj, json_options=self.json_options)
+
+    def encode(self, obj) -> bytes:
+        return self.__packer.pack(obj)
+
+    def decode(self, data: bytes):
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+
+
+class RawBsonCodec(Codec):
+    """
+    BSON. `RawBSONDocument` records are passed through as their original bytes without being decoded.
+    """
+    name = 'bson'
+    binary = True
+
+    def encode(self, obj) -> bytes:
+        if isinstance(obj, RawBSONDocument):
+            return obj.raw
+        return BSON.encode(obj)
+
+    def decode(self, data: bytes):
+        return RawBSONDocument(data)
+
+
+CODECS = {
+    'json': lambda: ExtendedJsonCodec(),
+    'relaxed': lambda: ExtendedJsonCodec('relaxed', JSONOptions(json_mode=JSONMode.RELAXED)),
+    'canonical': lambda: ExtendedJsonCodec('canonical', JSONOptions(json_mode=JSONMode.CANONICAL)),
+    'fastjson': FastJsonCodec,
+    'msgpack': MsgPackCodec,
+    'bson': RawBsonCodec,
+}
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Returns the codec registered under `name`.
+
+    :param name: str. One of `CODECS`
+    :return: Codec
+    """
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f'Unknown codec {name}. Available: {", ".join(CODECS)}')
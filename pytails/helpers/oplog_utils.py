@@ -0,0 +1,109 @@
+import re
+from collections.abc import Mapping
+
+from bson import BSON, Timestamp
+from bson.regex import Regex
+
+
+def oplog_doc_key(doc: dict):
+    """
+    Returns the `(namespace, _id)` of the document an oplog entry changes, or None for entries that do not target a
+    single document (noop and command entries).
+
+    :param doc: dict. oplog entry
+    :return: tuple or None
+    """
+    op = doc.get('op')
+    if op in ('i', 'd'):
+        return doc['ns'], doc['o'].get('_id')
+    elif op == 'u':
+        return doc['ns'], doc['o2'].get('_id')
+    return None
+
+
+def hashable_doc_key(key: tuple) -> tuple:
+    """
+    Returns a form of a `(namespace, _id)` key that can be used in dicts and sets. An embedded document `_id` is
+    replaced by its BSON encoding, other `_id` values are kept.
+
+    :param key: tuple. See `oplog_doc_key`
+    :return: tuple
+    """
+    ns, _id = key
+    if isinstance(_id, Mapping):
+        return ns, BSON.encode({'_id': _id})
+    return key
+
+
+def build_oplog_query(ts: Timestamp, include_ns: list = None, include_ns_regex: list = None,
+                      exclude_ns: list = None, exclude_ns_regex: list = None, ops: list = None,
+                      end_ts: Timestamp = None) -> dict:
+    """
+    Builds the `local.oplog.rs` query for entries from `ts` onwards, with namespace and operation filters evaluated
+    by the server.
+
+    :param ts: Timestamp. First oplog timestamp to read
+    :param include_ns: list. Only read these namespaces (`db.collection`). Optional.
+    :param include_ns_regex: list. Only read namespaces matching any of these patterns. Optional.
+    :param exclude_ns: list. Skip these namespaces. Optional.
+    :param exclude_ns_regex: list. Skip namespaces matching any of these patterns. Optional.
+    :param ops: list. Only read these op types, e.g. `['i', 'u', 'd']`. Optional.
+    :param end_ts: Timestamp. Only read entries before this timestamp. Optional.
+    :return: dict
+    """
+    query = {'ts': {'$gte': ts}}
+    if end_ts is not None:
+        query['ts']['$lt'] = end_ts
+    clauses = []
+    included = []
+    if include_ns:
+        included.append({'ns': {'$in': list(include_ns)}})
+    for pattern in include_ns_regex or []:
+        included.append({'ns': {'$regex': pattern}})
+    if len(included) == 1:
+        clauses.append(included[0])
+    elif included:
+        clauses.append({'$or': included})
+    if exclude_ns:
+        clauses.append({'ns': {'$nin': list(exclude_ns)}})
+    for pattern in exclude_ns_regex or []:
+        clauses.append({'ns': {'$not': Regex(pattern)}})
+    if clauses:
+        query['$and'] = clauses
+    if ops:
+        query['op'] = {'$in': list(ops)}
+    return query
+
+
+def namespace_matches(ns: str, include_ns: list = None, include_ns_regex: list = None, exclude_ns: list = None,
+                      exclude_ns_regex: list = None, **kwargs) -> bool:
+    """
+    Applies the namespace filters of `build_oplog_query` to a namespace on the client.
+
+    :param ns: str. `db.collection`
+    :return: bool. True if the namespace is tailed
+    """
+    if include_ns or include_ns_regex:
+        if ns not in (include_ns or []) and not any(re.search(p, ns) for p in include_ns_regex or []):
+            return False
+    if ns in (exclude_ns or []):
+        return False
+    return not any(re.search(p, ns) for p in exclude_ns_regex or [])
+
+
+def build_oplog_projection(fields: list = None):
+    """
+    Builds a projection for oplog entries that returns only `fields`, plus the fields pyTails needs for checkpoints
+    and partition keys.
+
+    :param fields: list. Oplog fields to return, e.g. `['o.status']`. Optional.
+    :return: dict or None if every field should be returned.
+    """
+    if not fields:
+        return None
+    projection = {field: 1 for field in fields}
+    for required in ('ts', 'op', 'ns', 'o._id', 'o2._id'):
+        parent = required.split('.')[0]
+        if required not in projection and parent not in projection:
+            projection[required] = 1
+    return projection
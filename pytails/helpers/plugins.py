@@ -0,0 +1,88 @@
+import importlib
+
+
+def load_plugin(registry: dict, group: str, name: str):
+    """
+    Returns the class registered under `name`, importing its module on first use.
+
+    Built-in plugins are listed in `registry` as `module:attribute` strings, so their dependencies are only imported
+    when they are configured. Other names are looked up in the `group` entry points of installed distributions.
+
+    :param registry: dict. Maps names to `module:attribute`
+    :param group: str. Entry point group, e.g. `pytails.sinks`
+    :param name: str. Plugin name
+    :return: type
+    """
+    spec = registry.get(name)
+    if spec is not None:
+        module, _, attribute = spec.partition(':')
+        return getattr(importlib.import_module(module), attribute)
+    plugin = _load_entry_point(group, name)
+    if plugin is None:
+        raise ValueError(f'Unknown {group} plugin {name}. Available: {", ".join(registry)}')
+    return plugin
+
+
+def _load_entry_point(group: str, name: str):
+    # scanning installed distributions is slow, only done for names that are not built in
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        try:
+            import pkg_resources
+        except ImportError:
+            return None
+        for entry_point in pkg_resources.iter_entry_points(group, name):
+            return entry_point.load()
+        return None
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        candidates = entry_points.select(group=group, name=name)
+    else:
+        candidates = [e for e in entry_points.get(group, ()) if e.name == name]
+    for entry_point in candidates:
+        return entry_point.load()
+    return None
+
+
+class LazyPlugin:
+    """
+    Stands in for a plugin class that is imported on first use, so packages can keep exporting classes whose
+    dependencies are optional or slow to import. Calling it creates an instance of the class, attributes are read
+    from the class, and `isinstance`, `issubclass` and subclassing work against the class.
+    """
+
+    def __init__(self, registry: dict, group: str, name: str):
+        """
+        :param registry: dict. Maps names to `module:attribute`
+        :param group: str. Entry point group, e.g. `pytails.sinks`
+        :param name: str. Plugin name
+        """
+        self.__registry = registry
+        self.__group = group
+        self.__name = name
+
+    def resolve(self) -> type:
+        """
+        Imports and returns the class.
+        """
+        return load_plugin(self.__registry, self.__group, self.__name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.resolve(), attribute)
+
+    def __instancecheck__(self, instance) -> bool:
+        return isinstance(instance, self.resolve())
+
+    def __subclasscheck__(self, subclass) -> bool:
+        return issubclass(subclass, self.resolve())
+
+    def __mro_entries__(self, bases: tuple) -> tuple:
+        # Python 3.7+. On 3.6, subclass the class imported from its module
+        return self.resolve(),
+
+    def __repr__(self):
+        return f'<lazy {self.__registry.get(self.__name, self.__name)}>'
@@ -0,0 +1,226 @@
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+logger = logging.getLogger(__name__)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _label_str(self, values: tuple, extra: str = '') -> str:
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self) -> list:
+        with self._lock:
+            return [f'{self.name}{self._label_str(k)} {v}' for k, v in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Gauge set explicitly with `set`, or read at scrape time from `callback`. A callback returns a number, or a dict of
+    label value tuples to numbers. A callback returning None is not exported.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> list:
+        if self.callback is None:
+            return super().samples()
+        try:
+            value = self.callback()
+        except Exception as ex:
+            logger.warning(ex, extra=dict(Func='Collect', Op='Metrics'))
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{self._label_str(k)} {v}' for k, v in value.items() if v is not None]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+    default_buckets = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = default_buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # per bucket counts, +Inf, sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def samples(self) -> list:
+        lines = []
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for labels, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{self._label_str(labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_str(labels)} {counts[-1]}')
+            lines.append(f'{self.name}_count{self._label_str(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+
+        :return: str
+        """
+        return '\n'.join(m.render() for m in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+DOCUMENTS_READ = REGISTRY.register(Counter('pytails_documents_read_total', 'Oplog entries or change events read'))
+SNAPSHOT_DOCUMENTS = REGISTRY.register(Counter('pytails_snapshot_documents_total',
+                                               'Documents read by the initial snapshot'))
+RECORDS_COMPACTED = REGISTRY.register(Counter('pytails_records_compacted_total',
+                                              'Oplog entries dropped for a later change to the same document'))
+RECORDS_WRITTEN = REGISTRY.register(Counter('pytails_records_written_total', 'Records written to a data sink',
+                                            ('sink',)))
+BYTES_OUT = REGISTRY.register(Counter('pytails_bytes_out_total', 'Serialized bytes written to a data sink',
+                                      ('sink',)))
+SINK_WRITE_SECONDS = REGISTRY.register(Histogram('pytails_sink_write_seconds',
+                                                 'Time spent in Sink.write_record', ('sink',)))
+SINK_BATCH_SECONDS = REGISTRY.register(Histogram('pytails_sink_batch_seconds',
+                                                 'Time spent sending one batch to a buffered sink', ('sink',)))
+SINK_RETRIES = REGISTRY.register(Counter('pytails_sink_retries_total', 'Batches re-sent after failed entries',
+                                         ('sink',)))
+SINK_THROTTLED = REGISTRY.register(Counter('pytails_sink_throttled_records_total',
+                                           'Records rejected by a sink and re-sent', ('sink',)))
+CHECKPOINT_COMMITS = REGISTRY.register(Counter('pytails_checkpoint_commits_total', 'Checkpoints written'))
+CHECKPOINT_SECONDS = REGISTRY.register(Histogram('pytails_checkpoint_commit_seconds', 'Time spent writing a checkpoint'))
+QUEUE_DEPTH = REGISTRY.register(Gauge('pytails_sink_queue_depth', 'Records queued for sink workers', ('sink',)))
+CHECKPOINT_AGE = REGISTRY.register(Gauge('pytails_checkpoint_age_seconds',
+                                         'Seconds between now and the last committed checkpoint timestamp'))
+SPILL_BYTES = REGISTRY.register(Gauge('pytails_spill_bytes', 'Bytes of spilled records not yet delivered'))
+LEADER = REGISTRY.register(Gauge('pytails_leader', '1 while this instance holds the lease of its tail'))
+REPLICATION_LAG = REGISTRY.register(Gauge('pytails_replication_lag_seconds',
+                                          'Newest oplog timestamp minus last processed timestamp'))
+
+
+def timed_write(sink, record, ack=None) -> None:
+    """
+    Writes a record to a sink and records its latency, count and size.
+
+    :param sink: Sink.
+    :param record: Record.
+    :param ack: callable. Optional.
+    :return:
+    """
+    name = sink.__class__.__name__
+    start = time.perf_counter()
+    sink.write_record(record, ack)
+    SINK_WRITE_SECONDS.observe(time.perf_counter() - start, name)
+    RECORDS_WRITTEN.inc(name)
+    BYTES_OUT.inc(name, amount=len(record.data))
+
+
+def instrument_client(client, lag_interval: float = 5.0) -> None:
+    """
+    Reads queue depths, spilled bytes, checkpoint age and replication lag from a tail client at scrape time. Replication lag is
+    queried from MongoDB at most every `lag_interval` seconds.
+
+    :param client: TailClient.
+    :param lag_interval: float. Seconds the replication lag is cached for
+    :return:
+    """
+    QUEUE_DEPTH.callback = lambda: {(k,): v for k, v in client.queue_depths().items()}
+    SPILL_BYTES.callback = client.spilled_bytes
+    CHECKPOINT_AGE.callback = lambda: time.time() - client.committed_ts.time if client.committed_ts else None
+
+    cache = {'at': 0, 'value': None}
+
+    def lag():
+        if time.monotonic() - cache['at'] >= lag_interval:
+            cache['value'] = client.replication_lag()
+            cache['at'] = time.monotonic()
+        return cache['value']
+    REPLICATION_LAG.callback = lag
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_metrics_server(port: int, addr: str = '', registry: Registry = REGISTRY) -> HTTPServer:
+    """
+    Serves `registry` in the Prometheus text format on `/metrics` from a daemon thread.
+
+    :param port: int. Port to listen on
+    :param addr: str. Address to bind. Default: all interfaces
+    :param registry: Registry.
+    :return: HTTPServer
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='MetricsServer').start()
+    logger.info(extra=dict(Func='Start', Op='Metrics', Attributes={'port': port}), msg='')
+    return server
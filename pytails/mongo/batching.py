@@ -0,0 +1,75 @@
+import time
+
+
+class AdaptiveBatching:
+    """
+    Picks cursor and sink batching settings by how far the tail is behind the newest oplog entry.
+
+    At `catch_up_lag` seconds behind or more, the tail is catching up: the cursor reads large batches and sinks send
+    full batches. Within `steady_lag` seconds of the head, or once the cursor has returned every entry, the tail is
+    in steady state: small batches, a short `max_await_time_ms` and a short sink linger keep latency low. In between,
+    the mode does not change, so a lag around a single threshold does not flip it back and forth.
+    """
+    CATCH_UP = 'catch-up'
+    STEADY = 'steady'
+
+    def __init__(self, catch_up_lag: float = 60, steady_lag: float = 5, catch_up_batch_size: int = 5000,
+                 steady_batch_size: int = 100, catch_up_max_await_time_ms: int = 1000,
+                 steady_max_await_time_ms: int = 100, steady_linger: float = 0.05, check_interval: float = 5.0):
+        """
+        :param catch_up_lag: float. Seconds behind the head that switch to catch-up. Default: 60
+        :param steady_lag: float. Seconds behind the head that switch to steady state. Default: 5
+        :param catch_up_batch_size: int. Oplog entries per cursor batch while catching up. Default: 5000
+        :param steady_batch_size: int. Oplog entries per cursor batch in steady state. Default: 100
+        :param catch_up_max_await_time_ms: int. Server wait for new entries while catching up. Default: 1000
+        :param steady_max_await_time_ms: int. Server wait for new entries in steady state. Default: 100
+        :param steady_linger: float. Longest sink linger in steady state. Default: 0.05
+        :param check_interval: float. Seconds between lag checks. Default: 5.0
+        """
+        self.catch_up_lag = catch_up_lag
+        self.steady_lag = steady_lag
+        self.catch_up_batch_size = catch_up_batch_size
+        self.steady_batch_size = steady_batch_size
+        self.catch_up_max_await_time_ms = catch_up_max_await_time_ms
+        self.steady_max_await_time_ms = steady_max_await_time_ms
+        self.steady_linger = steady_linger
+        self.check_interval = check_interval
+        self.mode = self.CATCH_UP
+        self.__checked = None
+
+    @property
+    def catching_up(self) -> bool:
+        return self.mode == self.CATCH_UP
+
+    @property
+    def batch_size(self) -> int:
+        return self.catch_up_batch_size if self.catching_up else self.steady_batch_size
+
+    @property
+    def max_await_time_ms(self) -> int:
+        return self.catch_up_max_await_time_ms if self.catching_up else self.steady_max_await_time_ms
+
+    def due(self) -> bool:
+        """
+        Returns True if the lag should be checked again.
+        """
+        return self.__checked is None or time.monotonic() - self.__checked >= self.check_interval
+
+    def update(self, lag) -> bool:
+        """
+        Picks the mode for `lag`.
+
+        :param lag: float. Seconds behind the newest oplog entry. None if unknown, which keeps the mode.
+        :return: bool. True if the mode changed
+        """
+        self.__checked = time.monotonic()
+        if lag is None:
+            return False
+        mode = self.mode
+        if lag >= self.catch_up_lag:
+            mode = self.CATCH_UP
+        elif lag <= self.steady_lag:
+            mode = self.STEADY
+        changed = mode != self.mode
+        self.mode = mode
+        return changed
@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import Timestamp
+from pymongo.collection import Collection
+
+from ..helpers.bson_utils import bson_timestamp_to_int, int_to_bson_timestamp
+from ..helpers.oplog_utils import build_oplog_query
+
+logger = logging.getLogger(__name__)
+
+
+def time_slices(start_ts: Timestamp, end_ts: Timestamp, slice_seconds: float) -> list:
+    """
+    Cuts the oplog range from `start_ts` up to and including `end_ts` into consecutive slices.
+
+    :param start_ts: Timestamp. First timestamp of the range
+    :param end_ts: Timestamp. Last timestamp of the range
+    :param slice_seconds: float. Length of a slice
+    :return: list of `(lower, upper)` Timestamps. `lower` is included, `upper` is not.
+    """
+    start = bson_timestamp_to_int(start_ts)
+    # exclusive bound just after `end_ts`
+    end = bson_timestamp_to_int(end_ts) + 1
+    if end <= start:
+        return []
+    step = max(int(slice_seconds * 2 ** 32), 1)
+    bounds = list(range(start, end, step)) + [end]
+    return [(int_to_bson_timestamp(bounds[i]), int_to_bson_timestamp(bounds[i + 1])) for i in range(len(bounds) - 1)]
+
+
+class ParallelOplogReader:
+    """
+    Reads a range of the oplog with parallel cursors and yields the entries in oplog order.
+
+    The range is cut into time slices of `slice_seconds`. The next `workers` slices are each read by their own thread
+    and `oplog_replay` cursor into a bounded buffer, while the consumer drains the slices one after the other. The
+    entries come out exactly as a single cursor would return them, so changes to a document stay in order and
+    checkpoints advance contiguously, while the server scans and transfers of several slices overlap.
+    """
+    __end = object()
+
+    def __init__(self, oplog: Collection, start_ts: Timestamp, end_ts: Timestamp, oplog_filter: dict = None,
+                 projection: dict = None, workers: int = 4, slice_seconds: float = 60, batch_size: int = 1000,
+                 prefetch: int = 10):
+        """
+        :param oplog: Collection. `local.oplog.rs`, with the codec options entries should be decoded with
+        :param start_ts: Timestamp. First timestamp to read
+        :param end_ts: Timestamp. Last timestamp to read
+        :param oplog_filter: dict. Keyword arguments of `build_oplog_query` filtering namespaces and op types. Optional.
+        :param projection: dict. Oplog projection. Optional.
+        :param workers: int. Slices read at the same time
+        :param slice_seconds: float. Length of a time slice
+        :param batch_size: int. Entries per cursor batch, and per buffered batch
+        :param prefetch: int. Batches buffered per slice before its reader waits for the consumer
+        """
+        self.oplog = oplog
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.oplog_filter = oplog_filter or {}
+        self.projection = projection
+        self.workers = workers
+        self.slice_seconds = slice_seconds
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.__stopped = threading.Event()
+
+    def slices(self) -> list:
+        return time_slices(self.start_ts, self.end_ts, self.slice_seconds)
+
+    def __iter__(self):
+        slices = self.slices()
+        logger.info(extra=dict(Func='Start', Op='CatchUp',
+                               Attributes={'start_ts': bson_timestamp_to_int(self.start_ts),
+                                           'end_ts': bson_timestamp_to_int(self.end_ts), 'slices': len(slices),
+                                           'workers': self.workers}), msg='')
+        buffers = {}
+        submitted = 0
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catchup')
+        try:
+            for i in range(len(slices)):
+                while submitted < len(slices) and submitted < i + self.workers:
+                    buffers[submitted] = queue.Queue(maxsize=self.prefetch)
+                    pool.submit(self.read_slice, *slices[submitted], buffers[submitted])
+                    submitted += 1
+                buffer = buffers.pop(i)
+                while True:
+                    try:
+                        batch = buffer.get(timeout=0.5)
+                    except queue.Empty:
+                        if self.stopped:
+                            return
+                        continue
+                    if batch is self.__end:
+                        break
+                    if isinstance(batch, Exception):
+                        raise batch
+                    yield from batch
+                if self.stopped:
+                    return
+        finally:
+            self.stop()
+            pool.shutdown(wait=True)
+
+    def read_slice(self, lower: Timestamp, upper: Timestamp, buffer: queue.Queue) -> None:
+        """
+        Reads the entries with `lower <= ts < upper` into `buffer`, in batches, followed by an end marker. An error
+        is put into the buffer instead, to be raised by the consumer.
+        """
+        cursor = None
+        try:
+            cursor = self.oplog.find(build_oplog_query(lower, end_ts=upper, **self.oplog_filter),
+                                     projection=self.projection, oplog_replay=True, batch_size=self.batch_size)
+            batch = []
+            for doc in cursor:
+                if self.stopped:
+                    return
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    self.__put(buffer, batch)
+                    batch = []
+            if batch:
+                self.__put(buffer, batch)
+            self.__put(buffer, self.__end)
+        except Exception as ex:
+            self.__put(buffer, ex)
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def __put(self, buffer: queue.Queue, item) -> None:
+        while not self.stopped:
+            try:
+                buffer.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    @property
+    def stopped(self) -> bool:
+        return self.__stopped.is_set()
+
+    def stop(self) -> None:
+        """
+        Stops the slice readers. Entries already yielded are not affected.
+        """
+        self.__stopped.set()
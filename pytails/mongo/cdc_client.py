@@ -1,17 +1,189 @@
-from datetime import datetime
+import logging
+import time
 
 from bson import Timestamp
-from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
 
+from .. import metrics
+from ..helpers.backoff import Backoff
+from ..helpers.bson_utils import bson_timestamp_to_int
+from ..state.store import StateStore
+from .tail_client import TailClient
 
-class ChangeStreamClient:
+logger = logging.getLogger(__name__)
+
+
+class ChangeStreamClient(TailClient):
     """
-    Not functional yet.
+    Tails a MongoDB Change Stream (MongoDB 3.6+).
+
+    Watches the whole cluster (MongoDB 4.0+) or a single database. Full documents are resolved by the server with
+    `fullDocument='updateLookup'`, and the resume token of the last checkpointed event is stored in the checkpoint
+    store so a restart resumes exactly after it.
+
+    Dropping or renaming the watched collection or database invalidates the stream. On MongoDB 4.2+ the stream is
+    reopened after the `invalidate` event with `startAfter`. Older servers cannot resume past it, so tailing stops
+    before the event and the checkpoint stays before it.
     """
-    __client = None
-    ts = Timestamp(datetime.utcnow(), 1)
+    __stream = None
+    __continue_running = True
+    _start_at_ts = None
+    _start_after_supported = None
+
+    options = dict(timestamp_suffix=False)
+
+    def __init__(self, mongo_host: str, mongo_port: int, cluster: str, replica_set: str = None,
+                 database: str = None, start_ts: Timestamp = None, batch_size: int = None,
+                 max_await_time_ms: int = 1000, checkpoint_store: StateStore = None):
+        """
+        Initialises a MongoClient. If `start_ts` is set the stream starts at the specified cluster time. If not, the
+        stream resumes from the checkpointed resume token, or from the checkpointed timestamp if only that is stored,
+        or from now.
+
+        :param mongo_host: Hostname or IP Address
+        :param mongo_port: port number
+        :param cluster: Friendly name for cluster
+        :param replica_set: Replica set name. Optional.
+        :param database: Database to watch. Optional. Watches the whole cluster if not set.
+        :param start_ts: Cluster Timestamp. Optional.
+        :param batch_size: int. Change events per getMore batch. Optional.
+        :param max_await_time_ms: int. Time the server waits for new events before returning an empty batch.
+        :param checkpoint_store: StateStore. Optional. Default: DynamoDbStore
+        """
+        super().__init__(cluster, replica_set, checkpoint_store)
+        self._connect(mongo_host, mongo_port, replica_set)
+        self.database = database
+        self.batch_size = batch_size
+        self.max_await_time_ms = max_await_time_ms
 
-    def __init__(self, mongo_host: str, mongo_port: int = 27017, start_ts: Timestamp = None):
-        self.__client = MongoClient(host=mongo_host, port=mongo_port)
         if start_ts:
-            self.ts = start_ts
+            self.ts = self._start_at_ts = start_ts
+        else:
+            self.load_checkpoint()
+
+    def load_checkpoint(self) -> None:
+        """
+        Resumes from the checkpointed resume token, or from the checkpointed timestamp if only that is stored.
+
+        :return:
+        """
+        self.resume_token = self._checkpoint_store.read_resume_token_by_key()
+        if not self.resume_token:
+            chkpoint_ts = self._checkpoint_store.read_state_by_key()
+            if chkpoint_ts:
+                self.ts = self._start_at_ts = chkpoint_ts
+
+    def set_timestamp_suffix(self, value: bool = True) -> None:
+        """
+        Adds timestamp to the output document
+
+        :param value: bool. default: True
+        """
+        self.options['timestamp_suffix'] = value
+
+    def get_stream(self):
+        """
+        Opens a change stream after the last seen resume token, or at the start timestamp if there is none.
+
+        :return: ChangeStream
+        """
+        target = self._client.get_database(self.database) if self.database else self._client
+        kwargs = dict(full_document='updateLookup', max_await_time_ms=self.max_await_time_ms)
+        if self.batch_size:
+            kwargs['batch_size'] = self.batch_size
+        if self.resume_token:
+            # unlike resumeAfter, startAfter also accepts the token of an invalidate event
+            kwargs['start_after' if self.supports_start_after() else 'resume_after'] = self.resume_token
+        elif self._start_at_ts:
+            kwargs['start_at_operation_time'] = self._start_at_ts
+        self.__stream = target.watch(**kwargs)
+        return self.__stream
+
+    def supports_start_after(self) -> bool:
+        """
+        Returns True if the server can open a change stream after an `invalidate` event (MongoDB 4.2+).
+
+        :return: bool
+        """
+        if self._start_after_supported is None:
+            version = self._client.server_info()['version']
+            self._start_after_supported = tuple(int(v) for v in version.split('-')[0].split('.')[:2]) >= (4, 2)
+        return self._start_after_supported
+
+    def tail(self) -> None:
+        """
+        Tails the change stream and processes every change event.
+
+        At least one data sink must be registered. if not, NotImplementedError is raised.
+
+        If connection is severed, the stream is reopened after the last processed event, with exponential backoff
+        between attempts.
+        :return:
+        """
+        if not self._data_sinks:
+            raise NotImplementedError('data sink not registered')
+        logger.info(extra=dict(Func='Start', Op='Tail',
+                               Attributes={'identifier': self.identifier, 'host': self._client.address[0],
+                                           'port': self._client.address[1], 'database': self.database}), msg='')
+        self.__continue_running = True
+        reconnect = Backoff(initial=0.1, maximum=30.0)
+        while self.__continue_running:
+            try:
+                with self.get_stream() as stream:
+                    reconnect.reset()
+                    while self.__continue_running and stream.alive:
+                        change = stream.try_next()
+                        if change is None:
+                            self.check_sinks()
+                            continue
+                        if change['operationType'] == 'invalidate' and not self.supports_start_after():
+                            logger.error(extra=dict(Func='Invalidate', Op='Tail',
+                                                    Attributes={'identifier': self.identifier,
+                                                                'database': self.database}),
+                                         msg='Change stream invalidated, MongoDB 4.2+ is needed to resume after it')
+                            self.stop_tail()
+                            return
+                        # the stream closes after an invalidate event and is reopened after it
+                        self.process_change(change)
+            except ConnectionFailure as ex:
+                delay = reconnect.next()
+                logger.warning(ex, extra=dict(Func='Reconnect', Op='Tail',
+                                              Attributes={'identifier': self.identifier, 'attempt': reconnect.attempt,
+                                                          'delay': delay}))
+                time.sleep(delay)
+
+    def process_change(self, change: dict) -> None:
+        """
+        Writes the change event to all data sinks. The event carries the full document in `fullDocument` for inserts,
+        updates and replaces.
+
+        :param change: dict. change event
+        :return:
+        """
+        metrics.DOCUMENTS_READ.inc()
+        # resume from here if the stream has to be reopened
+        self.resume_token = change['_id']
+        if 'clusterTime' in change:
+            self.ts = change['clusterTime']
+
+        if self.options['timestamp_suffix']:
+            doc = {'ts': bson_timestamp_to_int(self.ts), 'doc': change}
+        else:
+            doc = {'doc': change}
+        key = None
+        if 'ns' in change and 'documentKey' in change:
+            key = (f"{change['ns']['db']}.{change['ns'].get('coll')}", change['documentKey'].get('_id'))
+            if key[0] in self._ignored_ns:
+                return
+        self.write_to_sink(doc, key, ts=self.ts, resume_token=self.resume_token)
+
+    def stop_tail(self):
+        """
+        Stops tailing the change stream gracefully. Closes the stream and commits a checkpoint.
+
+        :return:
+        """
+        self.__continue_running = False
+        if self.__stream:
+            self.__stream.close()
+        super().stop_tail()
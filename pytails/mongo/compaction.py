@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+
+from .. import metrics
+from ..helpers.oplog_utils import hashable_doc_key, oplog_doc_key
+
+
+class CompactionWindow:
+    """
+    Collapses the oplog entries that change the same document within a window to the latest one.
+
+    Entries are keyed by `(namespace, _id)`, see `hashable_doc_key`. A later entry replaces the pending one for its
+    document, so a delete replaces every earlier change and nothing is looked up for a document deleted within the
+    window. An insert followed by updates is written as the latest update, whose full document is the same record the
+    insert would have produced. A document inserted and deleted within the window was never written, so nothing is
+    written for it at all. The window is flushed once it holds `max_keys` documents or its oldest entry has waited
+    `window` seconds. A flush returns the remaining entries ordered by their timestamp, and the timestamp of the last
+    entry added to the window, which includes the timestamps of the entries that were dropped.
+    """
+
+    def __init__(self, window: float = 1.0, max_keys: int = 10000):
+        """
+        :param window: float. Seconds an entry may wait for later changes to its document. Default: 1.0
+        :param max_keys: int. Documents held before the window is flushed early. Default: 10000
+        """
+        self.window = window
+        self.max_keys = max_keys
+        self._pending = OrderedDict()
+        self._opened = None
+        self._end_ts = None
+        self._added = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, doc: dict) -> tuple:
+        """
+        Adds an oplog entry to the window. Returns the flushed window once it is full or has expired.
+
+        :param doc: dict. oplog entry
+        :return: tuple. See `flush`. `([], None)` while the window is open
+        """
+        # entries dropped from the window still count, so their timestamp is not held back
+        if self._end_ts is None:
+            self._opened = time.monotonic()
+        key = hashable_doc_key(oplog_doc_key(doc))
+        # keeps the pending entries ordered by their latest change, with the operation of the first one
+        first_op, _ = self._pending.pop(key, (doc['op'], None))
+        if not (first_op == 'i' and doc['op'] == 'd'):
+            self._pending[key] = (first_op, doc)
+        self._end_ts = doc['ts']
+        self._added += 1
+        if len(self._pending) >= self.max_keys or time.monotonic() - self._opened >= self.window:
+            return self.flush()
+        return [], None
+
+    def flush(self) -> tuple:
+        """
+        Closes the window.
+
+        :return: tuple. (list of oplog entries in timestamp order, Timestamp of the last entry added or None)
+        """
+        docs, end_ts = [doc for _, doc in self._pending.values()], self._end_ts
+        metrics.RECORDS_COMPACTED.inc(amount=self._added - len(docs))
+        self._pending.clear()
+        self._opened = self._end_ts = None
+        self._added = 0
+        return docs, end_ts
@@ -0,0 +1,135 @@
+import logging
+import time
+from collections import OrderedDict
+
+from pymongo import MongoClient, ReadPreference
+
+from ..helpers.bson_utils import bson_timestamp_to_int
+from ..helpers.oplog_utils import hashable_doc_key, oplog_doc_key
+
+logger = logging.getLogger(__name__)
+
+
+class FullDocumentResolver:
+    """
+    Resolves the full document for oplog entries in micro-batches.
+
+    Pending entries are grouped by namespace and fetched with one `$in` query per collection per batch. Fetched
+    documents are kept in a bounded LRU cache tagged with the cluster time the server read them at (`operationTime`),
+    so they serve every later entry up to that time, e.g. the rest of a backlog written while the batch was pending.
+    A later oplog entry for the same document invalidates the cached copy. Servers that do not report an
+    `operationTime` tag documents with the newest oplog entry they were fetched for. Deletes are never fetched.
+    """
+    __client = None
+
+    def __init__(self, client: MongoClient, batch_size: int = 500, max_wait: float = 0.5, cache_size: int = 10000,
+                 read_preference=ReadPreference.PRIMARY):
+        """
+        :param client: MongoClient.
+        :param batch_size: int. Pending entries that trigger a fetch. Default: 500
+        :param max_wait: float. Seconds an entry may wait for its batch to fill. Default: 0.5
+        :param cache_size: int. Maximum cached documents. `0` disables the cache. Default: 10000
+        :param read_preference: pymongo read preference used for lookups. Default: PRIMARY
+        """
+        self.__client = client
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.read_preference = read_preference
+        self._pending = []
+        self._pending_since = None
+        self._cache = OrderedDict()
+
+    def add(self, doc: dict) -> list:
+        """
+        Queues an oplog entry for lookup. Returns the resolved batch once `batch_size` entries are pending or the
+        oldest pending entry has waited `max_wait` seconds, otherwise an empty list.
+
+        :param doc: dict. oplog entry
+        :return: list. `(oplog entry, (namespace, _id), full document)` tuples in oplog order
+        """
+        key = oplog_doc_key(doc)
+        if key is None:
+            return []
+        ident = hashable_doc_key(key)
+        cached = self._cache.get(ident)
+        if cached and cached[0] < bson_timestamp_to_int(doc['ts']):
+            del self._cache[ident]
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append((doc, key, ident))
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._pending_since >= self.max_wait:
+            return self.resolve()
+        return []
+
+    def resolve(self) -> list:
+        """
+        Fetches the full documents for all pending entries.
+
+        :return: list. `(oplog entry, (namespace, _id), full document)` tuples in oplog order
+        """
+        if not self._pending:
+            return []
+        pending = self._pending
+        self._pending = []
+        self._pending_since = None
+
+        # newest oplog timestamp and `_id` per document in this batch, keyed by `hashable_doc_key`
+        latest = {}
+        for doc, key, ident in pending:
+            latest[ident] = (bson_timestamp_to_int(doc['ts']), doc['op'], key[1])
+
+        resolved = {}
+        # timestamp up to which the resolved document is current
+        tags = {}
+        to_fetch = {}
+        for ident, (ts, op, _id) in latest.items():
+            cached = self._cache.get(ident)
+            if cached and cached[0] >= ts:
+                self._cache.move_to_end(ident)
+                tags[ident], resolved[ident] = cached
+            elif op == 'd':
+                tags[ident], resolved[ident] = ts, None
+            else:
+                to_fetch.setdefault(ident[0], []).append((ident, ts, _id))
+
+        for ns, fetch in to_fetch.items():
+            docs, read_ts = self._fetch(ns, [_id for _, _, _id in fetch])
+            for full_doc in docs:
+                resolved[hashable_doc_key((ns, full_doc['_id']))] = full_doc
+            for ident, ts, _ in fetch:
+                tags[ident] = max(ts, read_ts or 0)
+        logger.debug(extra=dict(Func='Resolve', Op='FullDoc',
+                                Attributes={'entries': len(pending), 'documents': len(latest),
+                                            'queries': len(to_fetch)}), msg='')
+
+        if self.cache_size:
+            for ident, ts in tags.items():
+                self._cache[ident] = (ts, resolved.get(ident))
+                self._cache.move_to_end(ident)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return [(doc, key, resolved.get(ident)) for doc, key, ident in pending]
+
+    def _fetch(self, ns: str, ids: list) -> tuple:
+        """
+        Returns the documents with `_id` in `ids` and the cluster time they were read at.
+
+        :param ns: str. Namespace
+        :param ids: list. `_id` values
+        :return: tuple. `(list of documents, timestamp as 64 bit integer or None)`
+        """
+        db_name, coll_name = ns.split('.', 1)
+        coll = self.__client.get_database(db_name).get_collection(coll_name, read_preference=self.read_preference)
+        docs = []
+        read_ts = None
+        with self.__client.start_session() as session:
+            for full_doc in coll.find({'_id': {'$in': ids}}, session=session):
+                # documents of later batches are read later, the time of the first batch holds for all of them
+                if not docs:
+                    read_ts = session.operation_time
+                docs.append(full_doc)
+            if not docs:
+                read_ts = session.operation_time
+        return docs, bson_timestamp_to_int(read_ts) if read_ts is not None else None
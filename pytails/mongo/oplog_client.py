@@ -1,12 +1,23 @@
 import time
 
 import pymongo
-from bson import Timestamp
-from pymongo import MongoClient, CursorType
-from pymongo.errors import AutoReconnect, ServerSelectionTimeoutError
+from bson import BSON, Timestamp
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import CursorType, ReadPreference
+from pymongo.errors import AutoReconnect
 
 import logging
+from .. import metrics
+from ..helpers.backoff import Backoff
 from ..helpers.bson_utils import bson_timestamp_to_int, int_to_bson_timestamp
+from ..helpers.oplog_utils import oplog_doc_key, build_oplog_query, build_oplog_projection
+from .batching import AdaptiveBatching
+from .catchup import ParallelOplogReader
+from .compaction import CompactionWindow
+from .doc_resolver import FullDocumentResolver
+from .snapshot import InitialSnapshot, list_namespaces
+from ..state.store import StateStore
 from .tail_client import TailClient
 
 logger = logging.getLogger(__name__)
@@ -15,13 +26,23 @@ logger = logging.getLogger(__name__)
 class OplogClient(TailClient):
     __cursor = None
     __continue_running = True
-    _doc_counter = 0
+    _doc_resolver = None
+    _compaction = None
+    _batching = None
+    _catch_up = None
+    _catch_up_options = None
+    _oplog_filter = dict(ops=('i', 'u', 'd'))
+    _oplog_projection = None
+    _snapshot = None
+    _snapshot_options = None
+    _resumed = False
 
     options = dict(timestamp_suffix=False,
-                   full_doc=False)
+                   full_doc=False,
+                   raw_bson=False)
 
     def __init__(self, mongo_host: str, mongo_port: int, cluster: str, replica_set: str = None,
-                 start_ts: Timestamp = None):
+                 start_ts: Timestamp = None, checkpoint_store: StateStore = None):
         """
         Initialises a MongoClient. If `replica_set` is specified, it creates a HA connection to the set. If `start_ts`
         is set it starts tailing at the specified timestamp. if `start_ts` is not set, the client starts tailing from
@@ -32,38 +53,29 @@ class OplogClient(TailClient):
         :param cluster: Friendly name for cluster
         :param replica_set: Replica set name. Optional.
         :param start_ts: Oplog Timestamp. Optional.
+        :param checkpoint_store: StateStore. Optional. Default: DynamoDbStore
         """
-        super().__init__(cluster, replica_set)
-        if replica_set:
-            self._client = MongoClient(host=[f'{mongo_host}:{mongo_port}'], replicaset=replica_set)
-        else:
-            self._client = MongoClient(host=mongo_host, port=mongo_port)
-
-        self._connection_check()
+        super().__init__(cluster, replica_set, checkpoint_store)
+        if self._ignored_ns:
+            self._oplog_filter = dict(self._oplog_filter, exclude_ns=list(self._ignored_ns))
+        self._connect(mongo_host, mongo_port, replica_set)
 
         if start_ts:
             self.ts = start_ts
+            self._resumed = True
         else:
-            chkpoint_ts = self._checkpoint_store.read_state_by_key()
-            if chkpoint_ts:
-                self.ts = chkpoint_ts
+            self.load_checkpoint()
 
-    def _connection_check(self, attempt: int = 3):
+    def load_checkpoint(self) -> None:
         """
-        Performs a simple check of `is_primary` to initiate a connection to the MongoDB host.
-        Connection attempt is tried 3 times before raising Error.
+        Resumes from the checkpoint in the store, if there is one.
 
-        :param attempt: int. default: 3
-        :return: bool.
+        :return:
         """
-        attempt -= 1
-        try:
-            return self._check_mongo_version
-        except ServerSelectionTimeoutError as ex:
-            if attempt == 0:
-                raise ex
-            time.sleep(5)
-            self._connection_check(attempt)
+        chkpoint_ts = self._checkpoint_store.read_state_by_key()
+        if chkpoint_ts:
+            self.ts = chkpoint_ts
+            self._resumed = True
 
     def set_timestamp_suffix(self, value: bool = True) -> None:
         """
@@ -73,36 +85,269 @@ class OplogClient(TailClient):
         """
         self.options['timestamp_suffix'] = value
 
-    def set_full_doc(self, value: bool = True) -> None:
-        # checkpointing breaks if this is enabled. figure out how to make this work.
+    def set_full_doc(self, value: bool = True, batch_size: int = 500, cache_size: int = 10000,
+                     secondary_reads: bool = False) -> None:
+        """
+        Writes the full document instead of the oplog entry. Lookups are batched per collection and cached.
+
+        :param value: bool. default: True
+        :param batch_size: int. Oplog entries resolved per micro-batch. default: 500
+        :param cache_size: int. Recently fetched documents kept in the LRU cache. default: 10000
+        :param secondary_reads: bool. Allows lookups to be served by secondaries. default: False
+        """
+        if value and self.options['raw_bson']:
+            raise ValueError('full document mode cannot be combined with raw BSON')
         self.options['full_doc'] = value
         self.set_timestamp_suffix()
+        read_preference = ReadPreference.SECONDARY_PREFERRED if secondary_reads else ReadPreference.PRIMARY
+        self._doc_resolver = FullDocumentResolver(self._client, batch_size=batch_size, cache_size=cache_size,
+                                                  read_preference=read_preference)
+
+    def set_compaction(self, window: float = 1.0, max_keys: int = 10000) -> None:
+        """
+        Collapses the changes to the same document within a window to the latest one before the full document is
+        looked up and written, so hot documents are written once per window. A delete replaces every earlier change,
+        and nothing is written for a document inserted and deleted within the window.
+        See `pytails.mongo.compaction.CompactionWindow`.
+
+        The checkpoint moves past a window only once every record written for it has been delivered, so no change is
+        skipped on restart. Requires full document mode, as oplog updates only carry the changed fields.
 
-    @property
-    def _check_mongo_version(self) -> str:
+        :param window: float. Seconds changes are held. default: 1.0
+        :param max_keys: int. Documents held before the window is written early. default: 10000
         """
-        Returns the version of MongoDB server
+        if not self.options['full_doc']:
+            raise ValueError('compaction requires full document mode')
+        self._compaction = CompactionWindow(window=window, max_keys=max_keys)
 
-        :rtype: str
+    def set_raw_bson(self, value: bool = True) -> None:
+        """
+        Reads oplog entries as `RawBSONDocument`. Only the fields pyTails needs (`ts`, `op`, `ns`, `_id`) are
+        decoded, and oplog entries are written to the sinks as their original BSON bytes, without the `doc` wrapper.
+        Cannot be combined with full document mode or compaction, which write looked up documents.
+
+        :param value: bool. default: True
+        """
+        if value and self.options['full_doc']:
+            raise ValueError('raw BSON cannot be combined with full document mode')
+        self.options['raw_bson'] = value
+        if value:
+            self.set_codec('bson')
+
+    def set_oplog_filter(self, include_ns: list = None, include_ns_regex: list = None, exclude_ns: list = None,
+                         exclude_ns_regex: list = None, ops: list = ('i', 'u', 'd'), projection: list = None) -> None:
+        """
+        Filters oplog entries on the server, so skipped namespaces and operations are never sent to the client.
+
+        :param include_ns: list. Only tail these namespaces (`db.collection`). Optional.
+        :param include_ns_regex: list. Only tail namespaces matching any of these patterns. Optional.
+        :param exclude_ns: list. Skip these namespaces. Optional.
+        :param exclude_ns_regex: list. Skip namespaces matching any of these patterns. Optional.
+        :param ops: list. Op types to tail. default: `('i', 'u', 'd')`, which drops noop and command entries.
+        :param projection: list. Oplog fields to return. `ts`, `op`, `ns` and `_id` are always returned. Optional.
         :return:
         """
-        return self._client.server_info()['version']
+        exclude_ns = list(exclude_ns or []) + [ns for ns in self._ignored_ns if ns not in (exclude_ns or [])]
+        self._oplog_filter = dict(include_ns=include_ns, include_ns_regex=include_ns_regex,
+                                  exclude_ns=exclude_ns or None, exclude_ns_regex=exclude_ns_regex, ops=ops)
+        self._oplog_projection = build_oplog_projection(projection)
+
+    def set_adaptive_batching(self, catch_up_lag: float = 60, steady_lag: float = 5, catch_up_batch_size: int = 5000,
+                              steady_batch_size: int = 100, catch_up_max_await_time_ms: int = 1000,
+                              steady_max_await_time_ms: int = 100, steady_linger: float = 0.05,
+                              check_interval: float = 5.0) -> None:
+        """
+        Switches the oplog cursor and the data sinks between catch-up and steady-state batching by how far the tail
+        is behind the head of the oplog. See `pytails.mongo.batching.AdaptiveBatching`.
+
+        :param catch_up_lag: float. Seconds behind the head that switch to catch-up. default: 60
+        :param steady_lag: float. Seconds behind the head that switch to steady state. default: 5
+        :param catch_up_batch_size: int. Oplog entries per cursor batch while catching up. default: 5000
+        :param steady_batch_size: int. Oplog entries per cursor batch in steady state. default: 100
+        :param catch_up_max_await_time_ms: int. Server wait for new entries while catching up. default: 1000
+        :param steady_max_await_time_ms: int. Server wait for new entries in steady state. default: 100
+        :param steady_linger: float. Longest sink linger in steady state. default: 0.05
+        :param check_interval: float. Seconds between lag checks. default: 5.0
+        """
+        self._batching = AdaptiveBatching(catch_up_lag=catch_up_lag, steady_lag=steady_lag,
+                                          catch_up_batch_size=catch_up_batch_size,
+                                          steady_batch_size=steady_batch_size,
+                                          catch_up_max_await_time_ms=catch_up_max_await_time_ms,
+                                          steady_max_await_time_ms=steady_max_await_time_ms,
+                                          steady_linger=steady_linger, check_interval=check_interval)
+
+    def set_parallel_catch_up(self, workers: int = 4, slice_seconds: float = 60, min_lag: float = 600,
+                              batch_size: int = 1000) -> None:
+        """
+        Reads the oplog with parallel cursors whenever the tail is at least `min_lag` seconds behind the head of the
+        oplog, before the tailable cursor is opened. See `read_range`.
+
+        :param workers: int. Time slices read at the same time. default: 4
+        :param slice_seconds: float. Length of a time slice. default: 60
+        :param min_lag: float. Seconds behind the head of the oplog that start a parallel catch-up. default: 600
+        :param batch_size: int. Oplog entries per cursor batch. default: 1000
+        """
+        self._catch_up_options = dict(workers=workers, slice_seconds=slice_seconds, min_lag=min_lag,
+                                      batch_size=batch_size)
+
+    def set_initial_snapshot(self, workers: int = 4, partition_docs: int = 100000, batch_size: int = 1000,
+                             namespaces: list = None) -> None:
+        """
+        Writes a snapshot of the existing documents before tailing, if the tail has no checkpoint and no start
+        timestamp. See `snapshot`.
+
+        :param workers: int. Scanning threads. default: 4
+        :param partition_docs: int. Approximate documents per `_id` range. default: 100000
+        :param batch_size: int. Documents per cursor batch. default: 1000
+        :param namespaces: list. Collections to scan. Optional. Default: all collections passing the oplog filter.
+        """
+        self._snapshot_options = dict(workers=workers, partition_docs=partition_docs, batch_size=batch_size,
+                                      namespaces=namespaces)
+
+    def snapshot(self, workers: int = 4, partition_docs: int = 100000, batch_size: int = 1000,
+                 namespaces: list = None) -> bool:
+        """
+        Writes every existing document to the data sinks as a synthetic insert and moves the tail position to the
+        oplog head read before the scan. Changes made during the scan are in the oplog after the head, so tailing from
+        it afterwards brings the sinks up to date. A checkpoint at the head is committed once every snapshot record is
+        delivered, so an interrupted snapshot starts over on restart.
+
+        :param workers: int. Scanning threads
+        :param partition_docs: int. Approximate documents per `_id` range
+        :param batch_size: int. Documents per cursor batch
+        :param namespaces: list. Collections to scan. Optional. Default: all collections passing the oplog filter.
+        :return: bool. False if the snapshot was stopped
+        """
+        head = self.get_last_write_ts()
+        if namespaces is None:
+            namespaces = list_namespaces(self._client, **self._oplog_filter)
+        codec_options = CodecOptions(document_class=RawBSONDocument) if self.options['raw_bson'] else None
+        self._start_dispatcher()
+        self._start_spill()
+        self._snapshot = InitialSnapshot(self._client, namespaces,
+                                         lambda ns, doc: self._write_snapshot_doc(ns, doc, head),
+                                         workers=workers, partition_docs=partition_docs, batch_size=batch_size,
+                                         codec_options=codec_options)
+        self._snapshot.run()
+        if self._snapshot.stopped:
+            return False
+        self.flush_sinks()
+        self.ts = head
+        self._committer.track(head, 0)
+        self._committer.commit()
+        self._snapshot = None
+        return True
+
+    def _write_snapshot_doc(self, ns: str, doc, head: Timestamp) -> None:
+        key = (ns, doc['_id'])
+        if self.options['full_doc']:
+            if self.options['timestamp_suffix']:
+                self.write_to_sink({'ts': bson_timestamp_to_int(head), 'doc': doc}, key)
+            else:
+                self.write_to_sink({'doc': doc}, key)
+            return
+        entry = {'ts': head, 'op': 'i', 'ns': ns, 'o': doc}
+        if self.options['raw_bson']:
+            self.write_to_sink(RawBSONDocument(BSON.encode(entry)), key)
+        else:
+            self.write_to_sink({'doc': entry}, key)
 
     def get_cursor(self, ts: Timestamp = None):
         """
-        Returns a tailable cursor for oplog.rs collection
+        Returns a tailable cursor for oplog.rs collection. Filters set with `set_oplog_filter` are applied by the server.
+        With adaptive batching, the batch size and await time of the current mode are used.
 
         :param ts: Timestamp. Default: None.
         :return:
         """
         if not ts:
             ts = self.ts
-        oplog = self._client.local.oplog.rs
-        self.__cursor = oplog.find({'ts': {'$gte': ts}},
+        self.__cursor = self._oplog().find(build_oplog_query(ts, **self._oplog_filter),
+                                   projection=self._oplog_projection,
                                    cursor_type=CursorType.TAILABLE_AWAIT,
                                    oplog_replay=True)
+        if self._batching:
+            self.__cursor.batch_size(self._batching.batch_size)
+            self.__cursor.max_await_time_ms(self._batching.max_await_time_ms)
         return self.__cursor
 
+    def _oplog(self):
+        oplog = self._client.local.oplog.rs
+        if self.options['raw_bson']:
+            oplog = oplog.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+        return oplog
+
+    def read_range(self, start_ts: Timestamp, end_ts: Timestamp, workers: int = 4, slice_seconds: float = 60,
+                   batch_size: int = 1000) -> int:
+        """
+        Processes the oplog entries from `start_ts` up to and including `end_ts`, read with parallel cursors over
+        time slices but processed in oplog order. See `pytails.mongo.catchup.ParallelOplogReader`.
+
+        :param start_ts: Timestamp. First timestamp to read
+        :param end_ts: Timestamp. Last timestamp to read
+        :param workers: int. Time slices read at the same time
+        :param slice_seconds: float. Length of a time slice
+        :param batch_size: int. Oplog entries per cursor batch
+        :return: int. Oplog entries processed
+        """
+        self._catch_up = ParallelOplogReader(self._oplog(), start_ts, end_ts, oplog_filter=self._oplog_filter,
+                                             projection=self._oplog_projection, workers=workers,
+                                             slice_seconds=slice_seconds, batch_size=batch_size)
+        entries = iter(self._catch_up)
+        count = 0
+        try:
+            for doc in entries:
+                self.process_doc(doc)
+                count += 1
+                if not self.__continue_running:
+                    break
+            self.flush_full_docs()
+        finally:
+            entries.close()
+            self._catch_up = None
+        logger.info(extra=dict(Func='Finish', Op='CatchUp',
+                               Attributes={'identifier': self.identifier, 'entries': count,
+                                           'start_ts': bson_timestamp_to_int(start_ts),
+                                           'end_ts': bson_timestamp_to_int(end_ts)}), msg='')
+        return count
+
+    def catch_up(self) -> int:
+        """
+        Reads up to the current head of the oplog with `read_range` if the tail is at least `min_lag` seconds behind
+        it. Tailing continues right after the head afterwards, as `read_range` has processed the head entry.
+
+        :return: int. Oplog entries processed
+        """
+        head = self.get_last_write_ts()
+        if head is None or head.time - self.ts.time < self._catch_up_options['min_lag']:
+            return 0
+        options = dict(self._catch_up_options)
+        options.pop('min_lag')
+        count = self.read_range(self.ts, head, **options)
+        if self.__continue_running:
+            # the tailable cursor reads from `ts` inclusive
+            self.ts = int_to_bson_timestamp(bson_timestamp_to_int(head) + 1)
+        return count
+
+    def replay(self, start_ts: Timestamp, end_ts: Timestamp, workers: int = 4, slice_seconds: float = 60,
+               batch_size: int = 1000) -> int:
+        """
+        Writes the oplog entries from `start_ts` up to and including `end_ts` to the data sinks with `read_range`,
+        then closes the sinks.
+
+        At least one data sink must be registered. if not, NotImplementedError is raised.
+
+        :return: int. Oplog entries processed
+        """
+        if not self._data_sinks:
+            raise NotImplementedError('data sink not registered')
+        self.__continue_running = True
+        try:
+            return self.read_range(start_ts, end_ts, workers=workers, slice_seconds=slice_seconds,
+                                   batch_size=batch_size)
+        finally:
+            self.stop_tail()
+
     def get_oplog_first_ts(self) -> Timestamp:
         """
         Returns the earliest available timestmap for oplog
@@ -113,99 +358,178 @@ class OplogClient(TailClient):
         first = oplog.find().sort('$natural', pymongo.ASCENDING).limit(-1).next()
         return first['ts']
 
+    def get_last_write_ts(self) -> Timestamp:
+        """
+        Returns the timestamp of the newest oplog entry
+
+        :return: Timestamp
+        """
+        oplog = self._client.local.oplog.rs
+        last = oplog.find(projection={'ts': 1}).sort('$natural', pymongo.DESCENDING).limit(-1).next()
+        return last['ts']
+
     def tail(self) -> None:
         """
         Tails the oplog.rs entries and processes them.
 
         At least one data sink must be registered. if not, NotImplementedError is raised.
 
+        If an initial snapshot is configured and the tail has no checkpoint, the snapshot is written first and tailing
+        starts at the oplog head read before it. With parallel catch-up, a tail far behind the head of the oplog reads
+        up to the head with `catch_up` before the tailable cursor is opened.
+
         For every oplog document, `process_doc` method is called. If connection is severed or primary changes, the client
-        attempts to connect to new primary server.
+        attempts to connect to new primary server, with exponential backoff between attempts.
         :return:
         """
         if not self._data_sinks:
             raise NotImplementedError('data sink not registered')
+        if self._snapshot_options and not self._resumed:
+            if not self.snapshot(**self._snapshot_options):
+                return
         logger.info(extra=dict(Func='Start', Op='Tail',
                                Attributes={'identifier': self.identifier, 'host': self._client.address[0],
                                            'port': self._client.address[1]}), msg='')
         self.__continue_running = True
+        if self._batching:
+            self._adapt(self.replication_lag(), force=True)
+        reconnect = Backoff(initial=0.1, maximum=30.0)
+        idle = Backoff(initial=0.05, maximum=1.0)
         while self.__continue_running:
-            self.get_cursor(ts=self.ts)
-            while self.__cursor.alive:
-                try:
-                    for doc in self.__cursor:
-                        self.process_doc(doc)
-                        if not self.__continue_running:
-                            break
-                except AutoReconnect as ex:
-                    time.sleep(1)
-                if not self.__continue_running:
-                    break
-                time.sleep(1)
+            try:
+                if self._catch_up_options:
+                    self.catch_up()
+                read = self._read_cursor()
+                reconnect.reset()
+            except AutoReconnect as ex:
+                delay = reconnect.next()
+                logger.warning(ex, extra=dict(Func='Reconnect', Op='Tail',
+                                              Attributes={'identifier': self.identifier, 'attempt': reconnect.attempt,
+                                                          'delay': delay}))
+                time.sleep(delay)
+                continue
+            if read:
+                idle.reset()
+            elif self.__continue_running:
+                # nothing matched the query, so the server closed the tailable cursor right away
+                time.sleep(idle.next())
+
+    def _read_cursor(self) -> int:
+        """
+        Reads a new cursor from `ts` until it is closed, tailing stops or the batching mode changes.
+
+        :return: int. Oplog entries read
+        """
+        cursor = self.get_cursor(ts=self.ts)
+        read = 0
+        try:
+            while cursor.alive and self.__continue_running:
+                for doc in cursor:
+                    self.process_doc(doc)
+                    read += 1
+                    if not self.__continue_running:
+                        break
+                    if self._batching and self._batching.due() and self._adapt(self.replication_lag()):
+                        self.flush_full_docs()
+                        return read
+                self.flush_full_docs()
+                self.check_sinks()
+                # the server waited `max_await_time_ms` without new entries: at the head of the oplog
+                if self._batching and self.__continue_running and self._adapt(0):
+                    return read
+        finally:
+            cursor.close()
+        return read
+
+    def _adapt(self, lag, force: bool = False) -> bool:
+        """
+        Updates the batching mode for `lag` and tunes the data sinks if it changed.
+
+        :param lag: int. Seconds behind the head of the oplog, or None if unknown
+        :param force: bool. Tunes the sinks even if the mode did not change
+        :return: bool. True if the mode changed
+        """
+        changed = self._batching.update(lag)
+        if changed or force:
+            for sink in self._data_sinks:
+                sink.set_catch_up(self._batching.catching_up, self._batching.steady_linger)
+            logger.info(extra=dict(Func='Adapt', Op='Tail',
+                                   Attributes={'identifier': self.identifier, 'mode': self._batching.mode, 'lag': lag,
+                                               'batch_size': self._batching.batch_size,
+                                               'max_await_time_ms': self._batching.max_await_time_ms}), msg='')
+        return changed
 
     def process_doc(self, doc):
         """
         Processes the oplog doc to filter out noop and cmd operations and write the rest to all data sinks.
 
-        if `full_doc` is set to True in options, a query is made to MongoDB to read the full document for every oplog
-        document. For high rate of change, this might be expensive operation for the MongoDB cluster.
-        Currently, `full_doc` option is not compatible with writing to data sinks.
+        if `full_doc` is set to True in options, the full document is read from MongoDB for every oplog document.
+        Lookups are batched by the `FullDocumentResolver`, so written records can lag the cursor by up to one
+        micro-batch. With compaction, entries are held for the compaction window first and only the latest change to
+        each document is looked up. Call `flush_full_docs` to resolve and write the pending entries.
 
         :param doc:
         :return:
         """
+        metrics.DOCUMENTS_READ.inc()
+        # resume here if the cursor has to be reopened
+        self.ts = doc['ts']
         # skip n,c ops
         if doc['op'] in ('n', 'c'):
             return
 
-        doc_doc_ = {'doc': doc}
-        if self.options['full_doc']:
-            # query the full document and return it
-            oid = None
-            if doc['op'] in ['i', 'd']:
-                oid = doc['o']['_id']
-            elif doc['op'] == 'u':
-                oid = doc['o2']['_id']
-
-            if oid:
-                full_doc = self._client.get_database(doc['ns'].split('.')[0]).get_collection(
-                    doc['ns'].split('.')[1]).find_one({'_id': oid})
-                if self.options['timestamp_suffix']:
-                    full_doc = {'ts': bson_timestamp_to_int(doc['ts']), 'doc': full_doc}
-                else:
-                    full_doc = {'doc': full_doc}
-                self.write_to_sink(full_doc)
+        if self._compaction is not None:
+            self._write_compacted(*self._compaction.add(doc))
+        elif self.options['full_doc']:
+            self._write_full_docs(self._doc_resolver.add(doc))
+        elif self.options['raw_bson']:
+            # pass the original bytes through
+            self.write_to_sink(doc, oplog_doc_key(doc), ts=doc['ts'])
         else:
             # return oplog without modifications
-            self.write_to_sink(doc_doc_)
-        self._doc_counter += 1
-        if self._doc_counter >= 500:
-            self.checkpoint(doc_doc_)
-            self._doc_counter = 0
+            self.write_to_sink({'doc': doc}, oplog_doc_key(doc), ts=doc['ts'])
 
-    def stop_tail(self):
+    def flush_full_docs(self) -> None:
         """
-        Stops tailing the oplog collection gracefully. Closes the cursor and commits a checkpoint.
+        Resolves and writes all oplog entries still waiting for a full document lookup, closing the compaction window.
 
         :return:
         """
-        self.__cursor.close()
-        super().stop_tail()
+        if self._compaction is not None:
+            self._write_compacted(*self._compaction.flush())
+        if self.options['full_doc']:
+            self._write_full_docs(self._doc_resolver.resolve())
 
-        self.__continue_running = False
+    def _write_compacted(self, docs: list, end_ts: Timestamp) -> None:
+        if end_ts is None:
+            return
+        for doc in docs:
+            self._write_full_docs(self._doc_resolver.add(doc))
+        self._write_full_docs(self._doc_resolver.resolve())
+        # the window is covered once the records written for it are delivered, including dropped entries
+        self._committer.track(end_ts, 0)
+
+    def _write_full_docs(self, resolved: list) -> None:
+        for doc, key, full_doc in resolved:
+            if self.options['timestamp_suffix']:
+                full_doc = {'ts': bson_timestamp_to_int(doc['ts']), 'doc': full_doc}
+            else:
+                full_doc = {'doc': full_doc}
+            self.write_to_sink(full_doc, key, ts=doc['ts'])
 
-    def checkpoint(self, doc: dict = None):
+    def stop_tail(self):
         """
-        Commits a checkpoint. `doc` must contain `['doc']['ts']` properties.
-
-        Currently breaks if `full_doc` option is set.
+        Stops tailing the oplog collection gracefully. Closes the cursor and commits a checkpoint.
 
-        :param doc:
         :return:
         """
-        if doc:
-            if self.options['full_doc'] and self.options['timestamp_suffix']:
-                self.ts = int_to_bson_timestamp(doc['ts'])
-            else:
-                self.ts = doc['doc']['ts']
-        super().checkpoint()
+        if self._snapshot:
+            self._snapshot.stop()
+        if self._catch_up:
+            self._catch_up.stop()
+        if self.__cursor:
+            self.__cursor.close()
+        self.flush_full_docs()
+        super().stop_tail()
+
+        self.__continue_running = False
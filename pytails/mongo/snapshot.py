@@ -0,0 +1,169 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import ASCENDING, MongoClient, ReadPreference
+from pymongo.collection import Collection
+
+from .. import metrics
+from ..helpers.oplog_utils import namespace_matches
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_DATABASES = ('admin', 'config', 'local')
+
+
+def list_namespaces(client: MongoClient, **filters) -> list:
+    """
+    Lists the collections of all user databases that pass the namespace filters of `build_oplog_query`.
+
+    :param client: MongoClient.
+    :param filters: `include_ns`, `include_ns_regex`, `exclude_ns`, `exclude_ns_regex`
+    :return: list of str. `db.collection`
+    """
+    namespaces = []
+    for db_name in client.list_database_names():
+        if db_name in SYSTEM_DATABASES:
+            continue
+        for coll_name in client[db_name].list_collection_names():
+            ns = f'{db_name}.{coll_name}'
+            if not coll_name.startswith('system.') and namespace_matches(ns, **filters):
+                namespaces.append(ns)
+    return sorted(namespaces)
+
+
+def split_points(collection: Collection, partitions: int, oversample: int = 10) -> list:
+    """
+    Picks `_id` values that split a collection into roughly equal ranges, from a `$sample` of `_id`s sorted by the
+    server.
+
+    :param collection: Collection.
+    :param partitions: int. Number of ranges wanted
+    :param oversample: int. Sampled `_id`s per range. More samples give more even ranges.
+    :return: list. Up to `partitions - 1` ascending `_id`s
+    """
+    if partitions <= 1:
+        return []
+    sample = [doc['_id'] for doc in collection.aggregate([{'$sample': {'size': partitions * oversample}},
+                                                          {'$project': {'_id': 1}},
+                                                          {'$sort': {'_id': 1}}], allowDiskUse=True)]
+    points = []
+    for i in range(1, partitions):
+        point = sample[i * len(sample) // partitions] if sample else None
+        if point is not None and (not points or point != points[-1]):
+            points.append(point)
+    return points
+
+
+class InitialSnapshot:
+    """
+    Scans collections in parallel and hands every document to `write`.
+
+    Each collection is split into `_id` ranges from `$sample`d split points, about `partition_docs` documents each,
+    and the ranges of all collections are scanned by a pool of `workers` threads. Ranges are read in `_id` index
+    order with `min`/`max` bounds, so documents with `_id`s of any type fall into exactly one range.
+    """
+
+    def __init__(self, client: MongoClient, namespaces: list, write, workers: int = 4,
+                 partition_docs: int = 100000, batch_size: int = 1000, codec_options=None,
+                 read_preference=ReadPreference.PRIMARY):
+        """
+        :param client: MongoClient.
+        :param namespaces: list of str. `db.collection` to scan
+        :param write: callable. `write(ns, doc)`, called from worker threads
+        :param workers: int. Scanning threads
+        :param partition_docs: int. Approximate documents per `_id` range
+        :param batch_size: int. Documents per cursor batch
+        :param codec_options: CodecOptions. Optional. e.g. to read `RawBSONDocument`s
+        :param read_preference: pymongo read preference. Default: PRIMARY
+        """
+        self.__client = client
+        self.namespaces = namespaces
+        self.write = write
+        self.workers = workers
+        self.partition_docs = partition_docs
+        self.batch_size = batch_size
+        self.codec_options = codec_options
+        self.read_preference = read_preference
+        self.__stopped = threading.Event()
+        self.__counts = {}
+        self.__lock = threading.Lock()
+
+    def _collection(self, ns: str) -> Collection:
+        db_name, coll_name = ns.split('.', 1)
+        kwargs = dict(read_preference=self.read_preference)
+        if self.codec_options:
+            kwargs['codec_options'] = self.codec_options
+        return self.__client[db_name].get_collection(coll_name, **kwargs)
+
+    def ranges(self, ns: str) -> list:
+        """
+        Splits a collection into `_id` ranges.
+
+        :param ns: str. `db.collection`
+        :return: list of `(ns, lower, upper)`. `None` bounds are open.
+        """
+        collection = self._collection(ns)
+        partitions = max(1, min(collection.estimated_document_count() // self.partition_docs + 1, 1024))
+        bounds = [None] + split_points(collection, partitions) + [None]
+        return [(ns, bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+    def scan_range(self, ns: str, lower=None, upper=None) -> int:
+        """
+        Writes every document with `lower <= _id < upper` in `_id` order.
+
+        :return: int. Documents written
+        """
+        cursor = self._collection(ns).find({}, batch_size=self.batch_size).hint([('_id', ASCENDING)])
+        if lower is not None:
+            cursor = cursor.min([('_id', lower)])
+        if upper is not None:
+            cursor = cursor.max([('_id', upper)])
+        count = 0
+        try:
+            for doc in cursor:
+                if self.__stopped.is_set():
+                    break
+                self.write(ns, doc)
+                count += 1
+                metrics.SNAPSHOT_DOCUMENTS.inc()
+        finally:
+            cursor.close()
+        with self.__lock:
+            self.__counts[ns] = self.__counts.get(ns, 0) + count
+        return count
+
+    def run(self) -> dict:
+        """
+        Scans all namespaces and waits until every document has been handed to `write`.
+
+        :return: dict. ns -> documents written
+        """
+        ranges = []
+        for ns in self.namespaces:
+            ranges.extend(self.ranges(ns))
+        logger.info(extra=dict(Func='Start', Op='Snapshot',
+                               Attributes={'namespaces': len(self.namespaces), 'ranges': len(ranges),
+                                           'workers': self.workers}), msg='')
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='snapshot') as pool:
+            futures = [pool.submit(self.scan_range, *r) for r in ranges]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                self.stop()
+                raise
+        logger.info(extra=dict(Func='Finish', Op='Snapshot',
+                               Attributes={'documents': sum(self.__counts.values()), 'stopped': self.stopped}),
+                    msg='')
+        return dict(self.__counts)
+
+    @property
+    def stopped(self) -> bool:
+        return self.__stopped.is_set()
+
+    def stop(self) -> None:
+        """
+        Stops scanning after the documents being written.
+        """
+        self.__stopped.set()
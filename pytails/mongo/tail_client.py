@@ -1,14 +1,24 @@
 import abc
+import os
 import platform
 import signal
+import time
 from datetime import datetime
 
 from bson import Timestamp
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError, ServerSelectionTimeoutError
 
+from .. import metrics
 from ..helpers.bson_utils import bson_timestamp_to_int
+from ..helpers.codecs import get_codec
 import logging
-from ..sinks import Sink
-from ..state import NullStore, DynamoDbStore
+from ..sinks import Record, Sink
+from ..sinks.dispatcher import SinkDispatcher
+from ..sinks.spill import SpillQueue
+from ..state import NullStore, get_store_class
+from ..state.committer import CheckpointCommitter
+from ..state.lease import LeaderElection
 from ..state.store import StateStore
 
 logger = logging.getLogger(__name__)
@@ -18,25 +28,176 @@ class TailClient(metaclass=abc.ABCMeta):
     __sigs_map = {v.value: k for k, v in signal.__dict__.items() if k.startswith('SIG')}
     _data_sinks = set()
     _checkpoint_store = None
+    _committer = None
+    _election = None
+    _stopped = False
+    _dispatcher = None
+    _sink_workers = 0
+    _sink_queue_size = 1000
+    _spill = None
+    _spill_options = None
+    _codec = get_codec('json')
     _client = None
+    _ignored_ns = ()
     ts = Timestamp(datetime.utcnow(), 1)
+    resume_token = None
     identifier = None
 
-    def __init__(self, cluster: str, replica_set: str):
+    def __init__(self, cluster: str, replica_set: str, checkpoint_store: StateStore = None):
         self.identifier = cluster + ':' + replica_set
+        self._data_sinks = set()
         self.__set_interrupt_handler()
-        self.register_checkpoint_store(DynamoDbStore(cluster, replica_set))
+        self.register_checkpoint_store(checkpoint_store or get_store_class('dynamodb')(cluster, replica_set))
         # self.register_checkpoint_store(NullStore())
 
-    def checkpoint(self, doc: dict = None):
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        """
+        Initialises a MongoClient. If `replica_set` is specified, it creates a HA connection to the set.
+
+        :param mongo_host: Hostname or IP Address. A comma separated list of `host:port` seeds the replica set.
+        :param mongo_port: port number. Used for hosts without a port.
+        :param replica_set: Replica set name. Optional.
+        :return:
+        """
+        if replica_set:
+            hosts = [h if ':' in h else f'{h}:{mongo_port}' for h in mongo_host.split(',')]
+            self._client = MongoClient(host=hosts, replicaset=replica_set)
+        else:
+            self._client = MongoClient(host=mongo_host, port=mongo_port)
+
+        self._connection_check()
+        self._checkpoint_store.attach(self._client)
+
+    def _connection_check(self, attempt: int = 3):
+        """
+        Performs a simple check of `is_primary` to initiate a connection to the MongoDB host.
+        Connection attempt is tried 3 times before raising Error.
+
+        :param attempt: int. default: 3
+        :return: bool.
+        """
+        attempt -= 1
+        try:
+            return self._check_mongo_version
+        except ServerSelectionTimeoutError as ex:
+            if attempt == 0:
+                raise ex
+            time.sleep(5)
+            self._connection_check(attempt)
+
+    @property
+    def _check_mongo_version(self) -> str:
+        """
+        Returns the version of MongoDB server
+
+        :rtype: str
+        :return:
+        """
+        return self._client.server_info()['version']
+
+    def checkpoint(self):
+        """
+        Commits a checkpoint at the newest record every data sink has delivered. Checkpoints are also committed in
+        the background according to `set_checkpoint_policy`.
+
+        :return:
+        """
+        watermark = self._committer.watermark
         logger.debug(extra=dict(Func='Checkpoint', Op='Tail',
                      Attributes={'identifier': self.identifier, 'host': self._client.address[0],
                                  'port': self._client.address[1],
-                                 'checkpoint': bson_timestamp_to_int(self.ts)}), msg='')
-        self._checkpoint_store.save_state(bson_timestamp_to_int(self.ts), str(self._client.address))
+                                 'checkpoint': bson_timestamp_to_int(watermark[0]) if watermark else None}), msg='')
+        self._committer.commit()
 
-    def start_tail(self):
-        self.tail()
+    def set_checkpoint_policy(self, interval: float = 5.0, count: int = 500) -> None:
+        """
+        Commits checkpoints every `interval` seconds, or sooner once `count` records have been delivered by every
+        data sink since the last commit.
+
+        :param interval: float. default: 5.0
+        :param count: int. default: 500
+        :return:
+        """
+        self._committer.interval = interval
+        self._committer.count = count
+
+    def set_leader_election(self, lease_seconds: float = 10.0, heartbeat: float = None, owner: str = None) -> None:
+        """
+        Runs the tail as leader or standby of the instances sharing its checkpoint, so only one of them writes records.
+        The checkpoint store must support leases. See `pytails.state.lease.LeaderElection`.
+
+        :param lease_seconds: float. Seconds a lease lasts without renewal. default: 10.0
+        :param heartbeat: float. Seconds between renewals. default: a third of `lease_seconds`
+        :param owner: str. Identifies this instance. default: `hostname:pid`
+        :return:
+        """
+        self._election = LeaderElection(self._checkpoint_store, owner=owner, lease_seconds=lease_seconds,
+                                        heartbeat=heartbeat)
+
+    def start_tail(self) -> bool:
+        """
+        Tails. With leader election, the client first waits as a standby until it holds the lease, then tails from the
+        last committed checkpoint. The lease is released once tailing stops.
+
+        If the lease is lost while tailing, the client stops as on SIGTERM and False is returned. The process should
+        then exit, so it can be restarted as a standby.
+
+        :return: bool. False if the lease was lost
+        """
+        if not self._election:
+            self.tail()
+            return True
+        self._election.start(on_lost=self.__on_lease_lost)
+        try:
+            if self.standby():
+                self.tail()
+        finally:
+            self._election.stop()
+        return not self._election.lost
+
+    def __on_lease_lost(self):
+        # stop on the main thread, the same way as a SIGTERM
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def standby(self) -> bool:
+        """
+        Waits until this instance is elected. The MongoDB connection, the data sinks and the checkpoint store stay open
+        meanwhile. Every heartbeat the committed checkpoint of the leader is read and the head of the oplog is queried,
+        so the connections stay warm and `replication_lag` reports how far the leader is behind. Once elected, the
+        checkpoint is read again and tailing resumes from it.
+
+        :return: bool. True once elected, False if the client was stopped first
+        """
+        while not self._election.wait(self._election.heartbeat):
+            if self._stopped:
+                return False
+            try:
+                self._checkpoint_store.invalidate()
+                self.load_checkpoint()
+                lag = self.replication_lag()
+            except PyMongoError as ex:
+                logger.warning(ex, extra=dict(Func='Standby', Op='Tail', Attributes={'identifier': self.identifier}))
+                continue
+            logger.debug(extra=dict(Func='Standby', Op='Tail',
+                                    Attributes={'identifier': self.identifier, 'owner': self._election.owner,
+                                                'leader_lag': lag}), msg='')
+        if self._stopped:
+            return False
+        self._checkpoint_store.invalidate()
+        self.load_checkpoint()
+        logger.info(extra=dict(Func='TakeOver', Op='Tail',
+                               Attributes={'identifier': self.identifier, 'owner': self._election.owner,
+                                           'checkpoint': bson_timestamp_to_int(self.ts)}), msg='')
+        return True
+
+    @abc.abstractmethod
+    def load_checkpoint(self) -> None:
+        """
+        Positions the client at the checkpoint in the store. Called on start and by a standby taking over.
+
+        :return:
+        """
+        pass
 
     @abc.abstractmethod
     def tail(self):
@@ -44,26 +205,180 @@ class TailClient(metaclass=abc.ABCMeta):
 
     def stop_tail(self):
         """
-        Commits a checkpoint.
+        Closes all registered data sinks so buffered records are delivered, then commits a checkpoint.
 
         :return:
         """
-        self.checkpoint()
+        self._stopped = True
+        self.close_sinks()
+        self._committer.stop()
+        self._checkpoint_store.close()
 
         logger.info(extra=dict(Func='Stop', Op='Tail',
                     Attributes={'identifier': self.identifier, 'host': self._client.address[0],
                                 'port': self._client.address[1]
                                 }), msg='')
 
-    def write_to_sink(self, doc: dict):
+    def write_to_sink(self, doc: dict, key=None, ts: Timestamp = None, resume_token: dict = None):
         """
-        Writes document to all registered data sinks. Performs a checkpoint at the end.
+        Serializes document once and writes it to all registered data sinks. If sink workers are configured, the
+        document is queued for the sink worker threads instead and this call only blocks while the queues are full.
+        With a spill directory, the record is appended to the spill queue and delivered from its background thread.
+
+        If `ts` is set, the record is tracked for checkpointing and the checkpoint can only move past it once every
+        sink has delivered it.
 
         :param doc: dict
+        :param key: hashable. `(namespace, _id)` of the changed document. Keeps per-document order with sink workers.
+        :param ts: Timestamp. oplog or cluster time of the record. Optional.
+        :param resume_token: dict. Change stream resume token of the record. Optional.
+        :return:
+        """
+        record = Record(doc, self._codec, key, ts)
+        ack = None
+        if ts is not None:
+            ack = self._committer.track(ts, len(self._data_sinks), resume_token)
+        if self._spill_options:
+            self._start_spill()
+            self._spill.put(record, ack)
+            return
+        self._deliver(record, ack)
+
+    def _deliver(self, record: Record, ack=None) -> None:
+        if self._sink_workers:
+            self._start_dispatcher()
+            self._dispatcher.dispatch(record, ack)
+            return
+        for sink in self._data_sinks:
+            metrics.timed_write(sink, record, ack)
+
+    def _start_dispatcher(self) -> None:
+        if self._sink_workers and not self._dispatcher:
+            self._dispatcher = SinkDispatcher(self._data_sinks, self._sink_workers, self._sink_queue_size)
+
+    def _start_spill(self) -> None:
+        if self._spill_options and not self._spill:
+            self._start_dispatcher()
+            self._spill = SpillQueue(deliver=self._deliver, decode=self._codec.decode, **self._spill_options)
+
+    def check_sinks(self) -> None:
+        """
+        Raises the error of a failed write on a sink worker, if any, so tailing stops even while no records are read.
+
+        :return:
+        """
+        if self._dispatcher:
+            self._dispatcher.check()
+
+    def flush_sinks(self) -> None:
+        """
+        Waits until the spill queue and the sink workers have written every queued record, then flushes all data sinks.
+
+        :return:
+        """
+        if self._spill:
+            self._spill.join()
+        if self._dispatcher:
+            self._dispatcher.join()
+        for sink in self._data_sinks:
+            sink.flush()
+
+    @property
+    def committed_ts(self):
+        """
+        Returns the timestamp of the last committed checkpoint, or None.
+
+        :return: Timestamp
+        """
+        committed = self._committer.committed
+        return committed[0] if committed else None
+
+    def queue_depths(self) -> dict:
+        """
+        Returns the number of records queued for sink workers per sink.
+
+        :return: dict. sink class name -> queued records
+        """
+        return self._dispatcher.queue_depths() if self._dispatcher else {}
+
+    def spilled_bytes(self):
+        """
+        Returns the bytes of spilled records not yet delivered, or None without a spill directory.
+
+        :return: int
+        """
+        return self._spill.spilled_bytes if self._spill else None
+
+    def get_last_write_ts(self):
+        """
+        Returns the timestamp of the newest write on the connected replica set member, or None if it does not report one.
+
+        :return: Timestamp
+        """
+        last_write = self._client.admin.command('isMaster').get('lastWrite')
+        return last_write['opTime']['ts'] if last_write else None
+
+    def replication_lag(self):
+        """
+        Returns the seconds between the newest write on the server and the last processed change, or None if unknown.
+
+        :return: int
+        """
+        newest = self.get_last_write_ts()
+        if newest is None:
+            return None
+        return max(newest.time - self.ts.time, 0)
+
+    def set_codec(self, name: str) -> None:
+        """
+        Sets the codec records are serialized with. See `pytails.helpers.codecs.CODECS`.
+
+        :param name: str. default: json
+        :return:
+        """
+        self._codec = get_codec(name)
+
+    def set_sink_workers(self, workers: int, queue_size: int = 1000) -> None:
+        """
+        Writes to data sinks from `workers` threads per sink, fed by bounded queues of `queue_size` records per
+        worker. `0` writes synchronously on the tailing thread.
+
+        :param workers: int.
+        :param queue_size: int.
+        :return:
+        """
+        self._sink_workers = workers
+        self._sink_queue_size = queue_size
+
+    def set_spill(self, directory: str, max_bytes: int = 1024 * 1024 * 1024, segment_bytes: int = 64 * 1024 * 1024,
+                  fsync_interval: float = 1.0) -> None:
+        """
+        Spills records to segment files in `directory` and delivers them to the data sinks from a background thread,
+        so slow sinks do not stall the reader. See `pytails.sinks.spill.SpillQueue`.
+
+        :param directory: str. Spill directory
+        :param max_bytes: int. Disk budget. The reader blocks once spilled records exceed it. Default: 1 GiB
+        :param segment_bytes: int. Size of a spill segment. Default: 64 MiB
+        :param fsync_interval: float. Seconds between syncs to disk. None never syncs. Default: 1.0
+        :return:
+        """
+        self._spill_options = dict(directory=directory, max_bytes=max_bytes, segment_bytes=segment_bytes,
+                                   fsync_interval=fsync_interval)
+
+    def close_sinks(self):
+        """
+        Closes all registered data sinks, delivering any records they still buffer or have spilled.
+
         :return:
         """
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+        if self._dispatcher:
+            self._dispatcher.close()
+            self._dispatcher = None
         for sink in self._data_sinks:
-            sink.write_record(doc)
+            sink.close()
 
     def register_data_sink(self, sink: Sink):
         """
@@ -80,12 +395,17 @@ class TailClient(metaclass=abc.ABCMeta):
 
     def register_checkpoint_store(self, store: StateStore):
         """
-        Registers a checkpoint store. Only one checkpoint store can be registered.
+        Registers a checkpoint store. Only one checkpoint store can be registered. Checkpoints are committed to it by a
+        background `CheckpointCommitter`. Changes to the namespace of a store keeping checkpoints on the tailed cluster
+        are not tailed.
 
         :param store:
         :return:
         """
         self._checkpoint_store = store
+        namespace = getattr(store, 'namespace', None)
+        self._ignored_ns = (namespace,) if namespace else ()
+        self._committer = CheckpointCommitter(store, lambda: str(self._client.address))
 
     def sig_int_handler(self, signum: int, frame):
         """
@@ -1,72 +1,453 @@
 #!/usr/bin/env python
 
 import argparse
+import functools
 import os
 
 import logging
 import sys
 
+from pytails import metrics
+from pytails.helpers.bson_utils import parse_timestamp
+from pytails.helpers.codecs import CODECS
+from pytails.mongo.cdc_client import ChangeStreamClient
 from pytails.mongo.oplog_client import OplogClient
-from pytails.sinks import ConsoleSink
-from pytails.sinks.kinesis import KinesisSink
-from pytails.sinks.firehose import FirehoseSink
-from pytails.state.ddb_store import DynamoDbStore
+from pytails.sinks import get_sink_class
+from pytails.sinks.file_reader import FileReader
+from pytails.state import STORES, CachedStore, NullStore, get_store_class
+from pytails.state.store import StateStore
+from pytails.supervisor import TailSupervisor, discover_shards, load_replica_sets
 
 logger = logging.getLogger(__name__)
 
 
-def main():
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
-                        format='%(asctime)s - %(levelname)s - %(name)s - %(Func)s %(Op)s %(message)s')
+def _csv(value: str) -> list:
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _env_list(name: str) -> list:
+    return [os.environ[name]] if os.environ.get(name) else []
+
 
+def parse_args(argv: list = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument('--mongo-host', type=str, default=os.environ.get('MONGO_HOST', None),
-                        help='MongoDB replica set host to tail', required=True)
+                        help='MongoDB replica set host to tail. Not needed with --replay-dir')
     parser.add_argument('--mongo-port', type=int, default=os.environ.get('MONGO_PORT', 27017),
                         help='MongoDB replica set port', required=True)
     parser.add_argument('--tail-id', type=str, default=os.environ.get('TAIL_ID', None),
                         help='Unique identifier for tail. usually short name for Mongodb cluster', required=True)
     parser.add_argument('--replica-set', type=str, default=os.environ.get('REPLICA_SET', None),
-                        help='Mongodb Replica set name', required=True)
+                        help='Mongodb Replica set name. Not needed with --shard-discovery or --replica-set-config')
+    parser.add_argument('--shard-discovery', action='store_true',
+                        default=bool(int(os.environ.get('SHARD_DISCOVERY', 0))),
+                        help='--mongo-host is a mongos. Tails every shard listed in config.shards in its own process')
+    parser.add_argument('--replica-set-config', type=str, default=os.environ.get('REPLICA_SET_CONFIG', None),
+                        help='JSON file listing replica sets to tail, each in its own process')
+    parser.add_argument('--merge-by-cluster-time', action='store_true',
+                        default=bool(int(os.environ.get('MERGE_BY_CLUSTER_TIME', 0))),
+                        help='Merge the records of all replica sets in cluster time order before writing to sinks')
+    parser.add_argument('--merge-max-delay', type=float, default=float(os.environ.get('MERGE_MAX_DELAY', 1.0)),
+                        help='Seconds a record waits for other replica sets before it is written out of order')
     parser.add_argument('--kinesis-data-sink', type=str, default=os.environ.get('KINESIS_DATA_SINK', None),
                         help='Kinesis Data Stream Name. Not ARN')
+    parser.add_argument('--kinesis-batch-size', type=int, default=int(os.environ.get('KINESIS_BATCH_SIZE', 500)),
+                        help='Maximum records per Kinesis PutRecords call. 1 sends every record on its own')
+    parser.add_argument('--kinesis-linger', type=float, default=float(os.environ.get('KINESIS_LINGER', 1.0)),
+                        help='Seconds a record may be buffered before it is sent to Kinesis')
+    parser.add_argument('--kinesis-partition-strategy', type=str,
+                        default=os.environ.get('KINESIS_PARTITION_STRATEGY', 'ns_id'),
+                        help='ns_id: namespace and _id, ns: namespace only, field:<path>: value of a dotted path in '
+                             'the record, e.g. field:doc.o.tenant')
+    parser.add_argument('--kinesis-shard-map', action='store_true',
+                        default=bool(int(os.environ.get('KINESIS_SHARD_MAP', 0))),
+                        help='Spread partition keys evenly over the open shards with explicit hash keys')
+    parser.add_argument('--kinesis-shard-map-refresh', type=float,
+                        default=float(os.environ.get('KINESIS_SHARD_MAP_REFRESH', 300)),
+                        help='Seconds between ListShards calls to pick up shard splits and merges')
+    parser.add_argument('--kinesis-aggregate', action='store_true',
+                        default=bool(int(os.environ.get('KINESIS_AGGREGATE', 0))),
+                        help='Pack many records into each Kinesis record in the KPL aggregation format')
+    parser.add_argument('--kinesis-aggregation-buckets', type=int,
+                        default=int(os.environ.get('KINESIS_AGGREGATION_BUCKETS', 64)),
+                        help='Aggregates built in parallel. Should be at least the number of shards')
     parser.add_argument('--firehose-data-sink', type=str, default=os.environ.get('FIREHOSE_DATA_SINK', None),
-                        help='Kinesis Data Stream Name. Not ARN')
+                        help='Firehose Delivery Stream Name. Not ARN')
+    parser.add_argument('--firehose-batch-size', type=int, default=int(os.environ.get('FIREHOSE_BATCH_SIZE', 500)),
+                        help='Maximum records per Firehose PutRecordBatch call')
+    parser.add_argument('--firehose-linger', type=float, default=float(os.environ.get('FIREHOSE_LINGER', 1.0)),
+                        help='Seconds a record may be buffered before it is sent to Firehose')
+    parser.add_argument('--file-sink', type=str, default=os.environ.get('FILE_SINK', None),
+                        help='Directory to write rotating segment files with a timestamp index to')
+    parser.add_argument('--file-compression', choices=['gzip', 'zstd'],
+                        default=os.environ.get('FILE_COMPRESSION', None),
+                        help='Compress file sink segments. zstd requires the zstandard package')
+    parser.add_argument('--file-segment-bytes', type=int,
+                        default=int(os.environ.get('FILE_SEGMENT_BYTES', 256 * 1024 * 1024)),
+                        help='Start a new file sink segment once the current one reaches this size')
+    parser.add_argument('--file-segment-age', type=float, default=float(os.environ.get('FILE_SEGMENT_AGE', 3600)),
+                        help='Start a new file sink segment after this many seconds')
+    parser.add_argument('--replay-dir', type=str, default=os.environ.get('REPLAY_DIR', None),
+                        help='Replay the segments written by --file-sink in this directory into the sinks instead '
+                             'of tailing MongoDB')
+    parser.add_argument('--replay-start-ts', type=parse_timestamp,
+                        default=parse_timestamp(os.environ['REPLAY_START_TS']) if os.environ.get('REPLAY_START_TS')
+                        else None,
+                        help='Replay from this timestamp: seconds:increment, checkpoint integer or epoch seconds')
+    parser.add_argument('--replay-end-ts', type=parse_timestamp,
+                        default=parse_timestamp(os.environ['REPLAY_END_TS']) if os.environ.get('REPLAY_END_TS')
+                        else None,
+                        help='Replay up to and including this timestamp')
     parser.add_argument('--console-sink', action='store_true', default=bool(os.environ.get('CONSOLE_SINK', 0)),
-                        help='Enable Console output')
+                        help='Log every record. For debugging')
+    parser.add_argument('--stdout-sink', action='store_true', default=bool(int(os.environ.get('STDOUT_SINK', 0))),
+                        help='Write records to stdout as newline delimited JSON. Logs go to stderr')
+    parser.add_argument('--pipe-sink', type=str, default=os.environ.get('PIPE_SINK', None),
+                        help='Write records as newline delimited JSON to this named pipe or file')
+    parser.add_argument('--pipe-batch-bytes', type=int, default=int(os.environ.get('PIPE_BATCH_BYTES', 1024 * 1024)),
+                        help='Bytes buffered before a write to stdout or the pipe')
+    parser.add_argument('--pipe-linger', type=float, default=float(os.environ.get('PIPE_LINGER', 0.1)),
+                        help='Seconds a record may be buffered before it is written to stdout or the pipe')
     parser.add_argument('--mode', choices=['oplog', 'full', 'cdc'], default=os.environ.get('MODE', 'oplog'),
                         help='oplog: oplog entries \n'
                              'full: full document\n'
-                             'cdc: Enable for MongoDB v3.6 Change Streams')
+                             'cdc: MongoDB v3.6+ Change Streams with full documents')
+    parser.add_argument('--include-ns', type=_csv, default=_csv(os.environ.get('INCLUDE_NS', '')),
+                        help='Comma separated namespaces (db.collection) to tail')
+    parser.add_argument('--include-ns-regex', action='append', default=_env_list('INCLUDE_NS_REGEX'),
+                        help='Tail namespaces matching this pattern. Can be repeated')
+    parser.add_argument('--exclude-ns', type=_csv, default=_csv(os.environ.get('EXCLUDE_NS', '')),
+                        help='Comma separated namespaces (db.collection) to skip')
+    parser.add_argument('--exclude-ns-regex', action='append', default=_env_list('EXCLUDE_NS_REGEX'),
+                        help='Skip namespaces matching this pattern. Can be repeated')
+    parser.add_argument('--ops', type=_csv, default=_csv(os.environ.get('OPS', 'i,u,d')),
+                        help='Comma separated oplog op types to tail. Default: i,u,d')
+    parser.add_argument('--projection', type=_csv, default=_csv(os.environ.get('PROJECTION', '')),
+                        help='Comma separated oplog fields to return, e.g. o.status. Default: all fields')
+    parser.add_argument('--cdc-database', type=str, default=os.environ.get('CDC_DATABASE', None),
+                        help='cdc mode: database to watch. Watches the whole cluster (MongoDB 4.0+) if not set')
+    parser.add_argument('--cdc-batch-size', type=int, default=os.environ.get('CDC_BATCH_SIZE', None),
+                        help='cdc mode: change events per batch')
+    parser.add_argument('--cdc-max-await-time-ms', type=int, default=int(os.environ.get('CDC_MAX_AWAIT_TIME_MS', 1000)),
+                        help='cdc mode: milliseconds the server waits for new change events')
+    parser.add_argument('--start-ts', type=parse_timestamp,
+                        default=parse_timestamp(os.environ['START_TS']) if os.environ.get('START_TS') else None,
+                        help='Start at this timestamp instead of the checkpoint: seconds:increment, checkpoint integer '
+                             'or epoch seconds')
+    parser.add_argument('--end-ts', type=parse_timestamp,
+                        default=parse_timestamp(os.environ['END_TS']) if os.environ.get('END_TS') else None,
+                        help='oplog/full mode: replay the oplog from --start-ts up to and including this timestamp '
+                             'into the sinks and exit, without checkpoints')
+    parser.add_argument('--catch-up-workers', type=int, default=int(os.environ.get('CATCH_UP_WORKERS', 0)),
+                        help='Read the oplog with this many parallel cursors when far behind its head, and for '
+                             '--end-ts replays. 0 disables parallel catch-up')
+    parser.add_argument('--catch-up-slice-seconds', type=float,
+                        default=float(os.environ.get('CATCH_UP_SLICE_SECONDS', 60)),
+                        help='Length of the time slice read by one parallel cursor')
+    parser.add_argument('--catch-up-min-lag', type=float, default=float(os.environ.get('CATCH_UP_MIN_LAG', 600)),
+                        help='Seconds behind the oplog head that start a parallel catch-up')
+    parser.add_argument('--adaptive-batching', action='store_true',
+                        default=bool(int(os.environ.get('ADAPTIVE_BATCHING', 0))),
+                        help='Switch cursor and sink batching between catch-up and steady state by the oplog lag')
+    parser.add_argument('--catch-up-lag', type=float, default=float(os.environ.get('CATCH_UP_LAG', 60)),
+                        help='Seconds behind the oplog head that switch to catch-up batching')
+    parser.add_argument('--steady-lag', type=float, default=float(os.environ.get('STEADY_LAG', 5)),
+                        help='Seconds behind the oplog head that switch to steady-state batching')
+    parser.add_argument('--catch-up-batch-size', type=int, default=int(os.environ.get('CATCH_UP_BATCH_SIZE', 5000)),
+                        help='Oplog entries per cursor batch while catching up')
+    parser.add_argument('--steady-batch-size', type=int, default=int(os.environ.get('STEADY_BATCH_SIZE', 100)),
+                        help='Oplog entries per cursor batch in steady state')
+    parser.add_argument('--steady-max-await-time-ms', type=int,
+                        default=int(os.environ.get('STEADY_MAX_AWAIT_TIME_MS', 100)),
+                        help='Milliseconds the server waits for new oplog entries in steady state')
+    parser.add_argument('--steady-linger', type=float, default=float(os.environ.get('STEADY_LINGER', 0.05)),
+                        help='Longest sink linger in steady state')
+    parser.add_argument('--full-doc-batch-size', type=int, default=int(os.environ.get('FULL_DOC_BATCH_SIZE', 500)),
+                        help='full mode: oplog entries resolved with one query per collection')
+    parser.add_argument('--full-doc-cache-size', type=int, default=int(os.environ.get('FULL_DOC_CACHE_SIZE', 10000)),
+                        help='full mode: recently fetched documents kept in memory. 0 disables the cache')
+    parser.add_argument('--full-doc-secondary-reads', action='store_true',
+                        default=bool(int(os.environ.get('FULL_DOC_SECONDARY_READS', 0))),
+                        help='full mode: allow document lookups to be served by secondaries')
+    parser.add_argument('--compaction-window', type=float, default=float(os.environ.get('COMPACTION_WINDOW', 0)),
+                        help='full mode: seconds changes are held so only the latest change to a document is written. '
+                             '0 disables compaction')
+    parser.add_argument('--compaction-max-keys', type=int,
+                        default=int(os.environ.get('COMPACTION_MAX_KEYS', 10000)),
+                        help='full mode: documents held before the compaction window is written early')
+    parser.add_argument('--initial-snapshot', action='store_true',
+                        default=bool(int(os.environ.get('INITIAL_SNAPSHOT', 0))),
+                        help='oplog/full mode: write all existing documents as inserts before tailing, if the tail '
+                             'has no checkpoint yet')
+    parser.add_argument('--snapshot-workers', type=int, default=int(os.environ.get('SNAPSHOT_WORKERS', 4)),
+                        help='Threads scanning collections for the initial snapshot')
+    parser.add_argument('--snapshot-partition-docs', type=int,
+                        default=int(os.environ.get('SNAPSHOT_PARTITION_DOCS', 100000)),
+                        help='Approximate documents per _id range scanned by one snapshot thread')
+    parser.add_argument('--snapshot-batch-size', type=int, default=int(os.environ.get('SNAPSHOT_BATCH_SIZE', 1000)),
+                        help='Documents per cursor batch during the initial snapshot')
     parser.add_argument('--debug', action='store_true', default=bool(os.environ.get('DEBUG', 0)),
                         help='Enable for MongoDB v3.6 Change Streams')
+    parser.add_argument('--codec', choices=sorted(CODECS), default=os.environ.get('CODEC', 'json'),
+                        help='Record serialization. json: Extended JSON as before, relaxed/canonical: Extended JSON '
+                             'modes, fastjson: compact JSON (orjson if installed), msgpack: MessagePack')
+    parser.add_argument('--raw-bson', action='store_true', default=bool(int(os.environ.get('RAW_BSON', 0))),
+                        help='oplog mode: pass oplog entries to sinks as their original BSON bytes')
+    parser.add_argument('--sink-workers', type=int, default=int(os.environ.get('SINK_WORKERS', 0)),
+                        help='Worker threads per data sink. 0 writes to sinks on the tailing thread')
+    parser.add_argument('--sink-queue-size', type=int, default=int(os.environ.get('SINK_QUEUE_SIZE', 1000)),
+                        help='Maximum records queued per sink worker before tailing blocks')
+    parser.add_argument('--spill-dir', type=str, default=os.environ.get('SPILL_DIR', None),
+                        help='Spill records to this directory and deliver them to the sinks in the background')
+    parser.add_argument('--spill-max-bytes', type=int,
+                        default=int(os.environ.get('SPILL_MAX_BYTES', 1024 * 1024 * 1024)),
+                        help='Disk budget of the spill directory. Tailing blocks once it is used up')
+    parser.add_argument('--spill-segment-bytes', type=int,
+                        default=int(os.environ.get('SPILL_SEGMENT_BYTES', 64 * 1024 * 1024)),
+                        help='Size of a spill segment')
+    parser.add_argument('--spill-fsync-interval', type=float,
+                        default=float(os.environ.get('SPILL_FSYNC_INTERVAL', 1.0)),
+                        help='Seconds between syncs of spilled records to disk')
+    parser.add_argument('--state-store', type=str, default=os.environ.get('STATE_STORE', 'dynamodb'),
+                        help='Where checkpoints are kept. dynamodb: pytails_checkpoints table, sqlite: local database '
+                             'file, mongodb: collection on the tailed cluster, none: no checkpoints, or the name of a '
+                             'store registered in the pytails.stores entry point group')
+    parser.add_argument('--state-path', type=str, default=os.environ.get('STATE_PATH', 'pytails_checkpoints.db'),
+                        help='sqlite state store: database file')
+    parser.add_argument('--state-sync-interval', type=float,
+                        default=float(os.environ.get('STATE_SYNC_INTERVAL', 1.0)),
+                        help='sqlite state store: seconds between syncs to disk. 0 syncs every checkpoint')
+    parser.add_argument('--state-namespace', type=str,
+                        default=os.environ.get('STATE_NAMESPACE', 'pytails.checkpoints'),
+                        help='mongodb state store: db.collection checkpoints are kept in. Not tailed')
+    parser.add_argument('--state-endpoint-url', type=str, default=os.environ.get('STATE_ENDPOINT_URL', None),
+                        help='dynamodb state store: endpoint to use instead of AWS, e.g. a local DynamoDB')
+    parser.add_argument('--lease-seconds', type=float, default=float(os.environ.get('LEASE_SECONDS', 0)),
+                        help='Run as leader or warm standby of the instances with the same --tail-id. Seconds a lease '
+                             'lasts without renewal. Requires the dynamodb or sqlite state store. 0 disables it')
+    parser.add_argument('--lease-owner', type=str, default=os.environ.get('LEASE_OWNER', None),
+                        help='Identifies this instance in the lease. Default: hostname:pid')
+    parser.add_argument('--checkpoint-interval', type=float,
+                        default=float(os.environ.get('CHECKPOINT_INTERVAL', 5.0)),
+                        help='Seconds between checkpoint commits')
+    parser.add_argument('--checkpoint-every', type=int, default=int(os.environ.get('CHECKPOINT_EVERY', 500)),
+                        help='Commit a checkpoint early once this many records were delivered by every sink')
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('METRICS_PORT', 0)),
+                        help='Serve Prometheus metrics on this port. With several replica sets, worker n uses '
+                             'port + n. 0 disables the endpoint')
     parser.add_argument('--set-timestamp', action='store_true', help='Adds timestamp to entry')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.replay_dir:
+        return args
+    if not args.mongo_host:
+        parser.error('--mongo-host is required')
+    if not (args.replica_set or args.shard_discovery or args.replica_set_config):
+        parser.error('one of --replica-set, --shard-discovery or --replica-set-config is required')
+    if (args.stdout_sink or args.pipe_sink) and (args.shard_discovery or args.replica_set_config) and \
+            not args.merge_by_cluster_time:
+        parser.error('--stdout-sink and --pipe-sink with several replica sets require --merge-by-cluster-time')
+    if args.end_ts and not args.start_ts:
+        parser.error('--end-ts requires --start-ts')
+    if args.initial_snapshot and args.merge_by_cluster_time:
+        # snapshot documents have no cluster time to be merged by
+        parser.error('--initial-snapshot cannot be combined with --merge-by-cluster-time')
+    if args.compaction_window and args.mode != 'full':
+        parser.error('--compaction-window requires --mode full')
+    if args.lease_seconds and args.state_store not in ('dynamodb', 'sqlite'):
+        parser.error('--lease-seconds requires the dynamodb or sqlite state store')
+    if args.lease_seconds and (args.end_ts or args.shard_discovery or args.replica_set_config):
+        parser.error('--lease-seconds requires a single replica set and cannot be combined with --end-ts')
+    if args.state_store == 'mongodb' and args.shard_discovery:
+        # the workers connect to the shards directly, and writes to a shard bypass mongos
+        parser.error('--state-store mongodb cannot be combined with --shard-discovery')
+    if args.state_store not in STORES:
+        try:
+            get_store_class(args.state_store)
+        except ValueError as ex:
+            parser.error(str(ex))
+    if args.end_ts and (args.mode == 'cdc' or args.shard_discovery or args.replica_set_config):
+        parser.error('--end-ts replays one replica set in oplog or full mode')
+    return args
 
-    if args.debug:
-        logging.getLogger('').setLevel(logging.DEBUG)
+
+def build_sinks(args: argparse.Namespace, identifier: str) -> list:
+    """
+    Creates the data sinks enabled in `args`.
+
+    :param args: argparse.Namespace
+    :param identifier: str. Tail identifier
+    :return: list of Sink
+    """
+    # sink modules are imported only for the sinks that are enabled
+    sinks = []
+    if args.console_sink:
+        sinks.append(get_sink_class('console')(identifier))
+    if args.stdout_sink:
+        sinks.append(get_sink_class('pipe')(identifier, batch_bytes=args.pipe_batch_bytes, linger=args.pipe_linger))
+    if args.pipe_sink:
+        sinks.append(get_sink_class('pipe')(identifier, path=args.pipe_sink, batch_bytes=args.pipe_batch_bytes,
+                                            linger=args.pipe_linger))
+    if args.kinesis_data_sink:
+        sinks.append(get_sink_class('kinesis')(identifier, args.kinesis_data_sink,
+                                               batch_size=args.kinesis_batch_size,
+                                               linger=args.kinesis_linger,
+                                               aggregate=args.kinesis_aggregate,
+                                               aggregation_buckets=args.kinesis_aggregation_buckets,
+                                               partition_strategy=args.kinesis_partition_strategy,
+                                               shard_map=args.kinesis_shard_map,
+                                               shard_map_refresh=args.kinesis_shard_map_refresh))
+    if args.file_sink:
+        sinks.append(get_sink_class('file')(identifier, args.file_sink,
+                                            codec='bson' if args.raw_bson and args.mode == 'oplog' else args.codec,
+                                            compression=args.file_compression,
+                                            segment_bytes=args.file_segment_bytes,
+                                            segment_age=args.file_segment_age))
+    if args.firehose_data_sink:
+        sinks.append(get_sink_class('firehose')(identifier, args.firehose_data_sink,
+                                                batch_size=args.firehose_batch_size,
+                                                linger=args.firehose_linger))
+    return sinks
+
+
+def build_store(args: argparse.Namespace, replica_set: str) -> StateStore:
+    """
+    Creates the checkpoint store selected in `args`, behind a write-through cache.
+
+    :param args: argparse.Namespace
+    :param replica_set: str. Replica set name
+    :return: StateStore
+    """
+    if args.state_store == 'none':
+        return NullStore()
+    store_class = get_store_class(args.state_store)
+    if args.state_store == 'sqlite':
+        store = store_class(args.tail_id, replica_set, path=args.state_path, sync_interval=args.state_sync_interval)
+    elif args.state_store == 'mongodb':
+        database, collection = args.state_namespace.split('.', 1)
+        store = store_class(args.tail_id, replica_set, database=database, collection=collection)
+    elif args.state_store == 'dynamodb':
+        # a renewal must fail well before the lease runs out
+        timeout = args.lease_seconds / 5 if args.lease_seconds else None
+        store = store_class(args.tail_id, replica_set, endpoint_url=args.state_endpoint_url, timeout=timeout)
+    else:
+        store = store_class(args.tail_id, replica_set)
+    return CachedStore(store)
+
+
+def build_client(args: argparse.Namespace, mongo_host: str = None, mongo_port: int = None, replica_set: str = None,
+                 sinks: list = None):
+    """
+    Creates a tail client configured from `args`, with its data sinks registered.
+
+    :param args: argparse.Namespace
+    :param mongo_host: str. Overrides `--mongo-host`. May be a comma separated list of `host:port`.
+    :param mongo_port: int. Overrides `--mongo-port`
+    :param replica_set: str. Overrides `--replica-set`
+    :param sinks: list of Sink. Registered instead of the sinks enabled in `args`. Optional.
+    :return: TailClient
+    """
+    mongo_host = mongo_host or args.mongo_host
+    mongo_port = mongo_port or args.mongo_port
+    replica_set = replica_set or args.replica_set
+    # a bounded replay must not move the checkpoint of the live tail
+    store = NullStore() if args.end_ts else build_store(args, replica_set)
     if args.mode == 'cdc':
-        raise NotImplementedError('CDC Mode not implemented')
+        client = ChangeStreamClient(mongo_host, mongo_port, args.tail_id, replica_set,
+                                    database=args.cdc_database, start_ts=args.start_ts,
+                                    batch_size=args.cdc_batch_size, max_await_time_ms=args.cdc_max_await_time_ms,
+                                    checkpoint_store=store)
     else:
-        if args.replica_set:
-            client = OplogClient(args.mongo_host, args.mongo_port, args.tail_id, args.replica_set)
-        else:
-            client = OplogClient(args.mongo_host, args.mongo_port, args.tail_id)
+        client = OplogClient(mongo_host, mongo_port, args.tail_id, replica_set, start_ts=args.start_ts,
+                             checkpoint_store=store)
 
-        if args.set_timestamp:
-            client.set_timestamp_suffix()
+    if args.mode != 'cdc':
+        client.set_oplog_filter(include_ns=args.include_ns, include_ns_regex=args.include_ns_regex,
+                                exclude_ns=args.exclude_ns, exclude_ns_regex=args.exclude_ns_regex,
+                                ops=args.ops, projection=args.projection)
 
-        if args.mode == 'full':
-            client.set_full_doc()
+    if args.set_timestamp:
+        client.set_timestamp_suffix()
+
+    if args.mode == 'full':
+        client.set_full_doc(batch_size=args.full_doc_batch_size, cache_size=args.full_doc_cache_size,
+                            secondary_reads=args.full_doc_secondary_reads)
+        if args.compaction_window:
+            client.set_compaction(window=args.compaction_window, max_keys=args.compaction_max_keys)
+
+    if args.catch_up_workers and args.mode != 'cdc':
+        client.set_parallel_catch_up(workers=args.catch_up_workers, slice_seconds=args.catch_up_slice_seconds,
+                                     min_lag=args.catch_up_min_lag)
+
+    if args.adaptive_batching and args.mode != 'cdc':
+        client.set_adaptive_batching(catch_up_lag=args.catch_up_lag, steady_lag=args.steady_lag,
+                                     catch_up_batch_size=args.catch_up_batch_size,
+                                     steady_batch_size=args.steady_batch_size,
+                                     steady_max_await_time_ms=args.steady_max_await_time_ms,
+                                     steady_linger=args.steady_linger)
+
+    if args.initial_snapshot and args.mode != 'cdc':
+        client.set_initial_snapshot(workers=args.snapshot_workers, partition_docs=args.snapshot_partition_docs,
+                                    batch_size=args.snapshot_batch_size)
+
+    client.set_codec(args.codec)
+    if args.raw_bson and args.mode == 'oplog':
+        client.set_raw_bson()
+    client.set_checkpoint_policy(args.checkpoint_interval, args.checkpoint_every)
+    if args.lease_seconds:
+        client.set_leader_election(args.lease_seconds, owner=args.lease_owner)
+
+    if args.sink_workers:
+        client.set_sink_workers(args.sink_workers, args.sink_queue_size)
+    if args.spill_dir:
+        client.set_spill(os.path.join(args.spill_dir, replica_set), max_bytes=args.spill_max_bytes,
+                         segment_bytes=args.spill_segment_bytes, fsync_interval=args.spill_fsync_interval)
+
+    for sink in sinks if sinks is not None else build_sinks(args, client.identifier):
+        client.register_data_sink(sink)
+    return client
+
+
+def main():
+    args = parse_args()
+    # stdout carries the records of --stdout-sink
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr if args.stdout_sink else sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(name)s - %(Func)s %(Op)s %(message)s')
+
+    if args.debug:
+        logging.getLogger('').setLevel(logging.DEBUG)
+
+    if args.replay_dir:
+        sinks = build_sinks(args, args.tail_id)
+        try:
+            FileReader(args.replay_dir).replay(sinks, args.replay_start_ts, args.replay_end_ts)
+        finally:
+            for sink in sinks:
+                sink.close()
+        return
+
+    if args.shard_discovery or args.replica_set_config:
+        if args.shard_discovery:
+            targets = discover_shards(args.mongo_host, args.mongo_port)
+        else:
+            targets = load_replica_sets(args.replica_set_config)
+        build_merge_sinks = functools.partial(build_sinks, args, args.tail_id) if args.merge_by_cluster_time else None
+        TailSupervisor(args, targets, build_client, build_merge_sinks=build_merge_sinks,
+                       merge_max_delay=args.merge_max_delay).run()
+        return
 
-        if args.console_sink:
-            client.register_data_sink(ConsoleSink(client.identifier))
-        if args.kinesis_data_sink:
-            client.register_data_sink(KinesisSink(client.identifier, args.kinesis_data_sink))
-        if args.firehose_data_sink:
-            client.register_data_sink(FirehoseSink(client.identifier, args.firehose_data_sink))
-        client.tail()
+    client = build_client(args)
+    if args.end_ts:
+        client.replay(args.start_ts, args.end_ts, workers=args.catch_up_workers or 4,
+                      slice_seconds=args.catch_up_slice_seconds)
+        return
+    if args.metrics_port:
+        metrics.instrument_client(client)
+        metrics.start_metrics_server(args.metrics_port)
+    if not client.start_tail():
+        # the lease was taken over, restart as a standby
+        sys.exit(1)
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,30 @@
+from ..helpers.plugins import LazyPlugin, load_plugin
+from .record import Record
 from .sink import Sink
+from .buffered import BufferedSink
 from .console import ConsoleSink
-from .kinesis import KinesisSink
-from .firehose import FirehoseSink
+from .file import FileSink
+from .pipe import PipeSink
+
+# sinks backed by an SDK are imported on first use, so that importing `pytails.sinks` does not load boto3
+SINKS = {
+    'console': 'pytails.sinks.console:ConsoleSink',
+    'file': 'pytails.sinks.file:FileSink',
+    'pipe': 'pytails.sinks.pipe:PipeSink',
+    'kinesis': 'pytails.sinks.kinesis:KinesisSink',
+    'firehose': 'pytails.sinks.firehose:FirehoseSink',
+}
+
+
+def get_sink_class(name: str) -> type:
+    """
+    Returns the sink class registered under `name`, importing its module on first use.
+
+    :param name: str. One of `SINKS`, or an entry point in the `pytails.sinks` group
+    :return: type. Subclass of Sink
+    """
+    return load_plugin(SINKS, 'pytails.sinks', name)
+
+
+KinesisSink = LazyPlugin(SINKS, 'pytails.sinks', 'kinesis')
+FirehoseSink = LazyPlugin(SINKS, 'pytails.sinks', 'firehose')
@@ -0,0 +1,220 @@
+import abc
+import logging
+import random
+import threading
+import time
+
+from .. import metrics
+from .sink import Sink
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedSink(Sink, metaclass=abc.ABCMeta):
+    """
+    Base class for sinks that deliver records in batches.
+
+    Records are buffered per instance and a batch is sent when it reaches `batch_size` records or `batch_bytes` bytes,
+    or when the oldest buffered record has waited `linger` seconds. Only the entries reported as failed by
+    `_put_batch` are re-sent, with jittered exponential backoff, until the whole batch is delivered. Records larger
+    than `max_record_bytes` can never be accepted by the service: they raise a ValueError and are not acknowledged,
+    so the checkpoint does not move past them.
+
+    If `_put_batch` raises, the undelivered entries stay in the buffer and are not acknowledged, so the next flush sends
+    them again. An error in the linger thread is logged and raised by the next `write_record` or `flush`.
+    """
+    max_batch_records = 500
+    max_batch_bytes = 5 * 1024 * 1024
+    max_record_bytes = 1024 * 1024
+    retry_backoff = 0.1
+    retry_backoff_max = 5.0
+
+    def __init__(self, identifier: str, batch_size: int = None, batch_bytes: int = None, linger: float = 1.0):
+        """
+        :param identifier: str. Tail identifier
+        :param batch_size: int. Maximum records per batch. Capped at `max_batch_records`.
+        :param batch_bytes: int. Maximum bytes per batch. Capped at `max_batch_bytes`.
+        :param linger: float. Seconds a record may wait in the buffer before a flush. `0` disables the timer.
+        """
+        super().__init__(identifier)
+        self.batch_size = min(batch_size or self.max_batch_records, self.max_batch_records)
+        self.batch_bytes = min(batch_bytes or self.max_batch_bytes, self.max_batch_bytes)
+        self.linger = linger
+        self._batch_size = self.batch_size
+        self._linger = linger
+        self._buffer = []
+        self._buffer_acks = []
+        self._buffer_bytes = 0
+        self._buffer_since = None
+        self._lock = threading.RLock()
+        self._error = None
+        self.__closed = threading.Event()
+        self.__linger_thread = None
+        if self.linger:
+            self.__linger_thread = threading.Thread(target=self.__linger_loop, daemon=True,
+                                                    name=f'{self.__class__.__name__}-linger')
+            self.__linger_thread.start()
+
+    @abc.abstractmethod
+    def _put_batch(self, records: list) -> list:
+        """
+        Sends a batch of buffered entries.
+
+        :param records: list. Entries as passed to `_buffer_record`
+        :return: list. Entries that failed and must be re-sent. Empty if the batch was delivered.
+        """
+        pass
+
+    def _buffer_record(self, entry: dict, size: int, ack=None, since: float = None) -> None:
+        """
+        Appends an entry to the buffer, sending the buffer first if the entry would not fit in the current batch.
+
+        :param entry: dict. Entry in the format expected by `_put_batch`
+        :param size: int. Number of bytes the entry counts against `batch_bytes`
+        :param ack: callable. Optional. Called once the batch containing the entry has been delivered.
+        :param since: float. `time.monotonic()` when the entry's oldest record was written, for `linger`. Default: now
+        :return:
+        """
+        self._raise_error()
+        self._check_record_size(size)
+        with self._lock:
+            if self._buffer and (len(self._buffer) >= self.batch_size or
+                                 self._buffer_bytes + size > self.batch_bytes):
+                self._flush_buffer()
+            since = since or time.monotonic()
+            if not self._buffer or since < self._buffer_since:
+                self._buffer_since = since
+            self._buffer.append(entry)
+            self._buffer_bytes += size
+            if ack:
+                self._buffer_acks.append(ack)
+            if len(self._buffer) >= self.batch_size or self._buffer_bytes >= self.batch_bytes or \
+                    self.__closed.is_set():
+                self._flush_buffer()
+
+    def _check_record_size(self, size: int, limit: int = None) -> None:
+        """
+        Raises a ValueError for a record the service can never accept.
+
+        :param size: int. Number of bytes the record counts against the limit
+        :param limit: int. Optional. Default: `max_record_bytes`
+        :return:
+        """
+        limit = limit or self.max_record_bytes
+        if size > limit:
+            logger.error(extra=dict(Func='Oversize', Op='DataSink',
+                                    Attributes={'identifier': self.identifier,
+                                                'datasink': self.__class__.__name__,
+                                                'size': size, 'limit': limit}), msg='')
+            raise ValueError(f'{self.__class__.__name__} cannot deliver a record of {size} bytes, the limit is {limit}')
+
+    def set_catch_up(self, catch_up: bool, steady_linger: float = None) -> None:
+        """
+        Sends batches of up to `max_batch_records` while catching up. In steady state, the configured batch size is
+        used and records linger at most `steady_linger` seconds.
+
+        :param catch_up: bool. True while the tail is far behind the head of the oplog
+        :param steady_linger: float. Longest linger in steady state. Optional.
+        :return:
+        """
+        with self._lock:
+            if catch_up:
+                self.batch_size = self.max_batch_records
+                self.linger = self._linger
+            else:
+                self.batch_size = self._batch_size
+                self.linger = min(self._linger, steady_linger) if steady_linger and self._linger else self._linger
+
+    def _seal(self, max_age: float = None) -> None:
+        """
+        Moves records a subclass holds outside the buffer, such as partially filled aggregates, into the buffer.
+        Called before every flush and linger check.
+
+        :param max_age: float. Only moves records held for at least this many seconds. Optional. Default: all records
+        """
+        pass
+
+    def flush(self) -> None:
+        """
+        Sends all buffered records, retrying failed entries until delivered.
+        """
+        self._raise_error()
+        with self._lock:
+            self._seal()
+            self._flush_buffer()
+
+    def _raise_error(self) -> None:
+        """
+        Raises the error the linger thread ran into, once.
+        """
+        error, self._error = self._error, None
+        if error:
+            raise error
+
+    def close(self) -> None:
+        """
+        Stops the linger timer and flushes the buffer.
+        """
+        self.__closed.set()
+        self.flush()
+
+    def _retry_delay(self, attempt: int) -> float:
+        # full jitter, so throttled sinks of several tailers do not retry in lockstep
+        return random.uniform(0, min(self.retry_backoff * (2 ** attempt), self.retry_backoff_max))
+
+    def _flush_buffer(self) -> None:
+        if not self._buffer:
+            return
+        records = self._buffer
+        acks = self._buffer_acks
+        size, since = self._buffer_bytes, self._buffer_since
+        self._buffer = []
+        self._buffer_acks = []
+        self._buffer_bytes = 0
+        self._buffer_since = None
+
+        name = self.__class__.__name__
+        attempt = 0
+        try:
+            while records:
+                start = time.perf_counter()
+                records = self._put_batch(records)
+                metrics.SINK_BATCH_SECONDS.observe(time.perf_counter() - start, name)
+                if records:
+                    metrics.SINK_RETRIES.inc(name)
+                    metrics.SINK_THROTTLED.inc(name, amount=len(records))
+                    delay = self._retry_delay(attempt)
+                    logger.warning(extra=dict(Func='Retry', Op='DataSink',
+                                              Attributes={'identifier': self.identifier,
+                                                          'datasink': self.__class__.__name__,
+                                                          'failed': len(records),
+                                                          'attempt': attempt + 1,
+                                                          'delay': delay}), msg='')
+                    time.sleep(delay)
+                    attempt += 1
+        except BaseException:
+            # the next flush re-sends what was not delivered, and its records are acknowledged only then
+            self._buffer = records + self._buffer
+            self._buffer_acks = acks + self._buffer_acks
+            self._buffer_bytes += size
+            self._buffer_since = since
+            raise
+        for ack in acks:
+            ack()
+
+    def __linger_loop(self):
+        # `linger` changes with `set_catch_up`
+        while not self.__closed.wait(max(self.linger / 2, 0.01)):
+            if self._error is not None:
+                # waits until the error has been raised to the writer
+                continue
+            try:
+                with self._lock:
+                    self._seal(self.linger)
+                    if self._buffer and time.monotonic() - self._buffer_since >= self.linger:
+                        self._flush_buffer()
+            except Exception as ex:
+                logger.exception(ex, extra=dict(Func='Linger', Op='DataSink',
+                                                Attributes={'identifier': self.identifier,
+                                                            'datasink': self.__class__.__name__}))
+                self._error = ex
@@ -1,24 +1,26 @@
-from bson import json_util
-from bson.json_util import JSONOptions, DatetimeRepresentation, JSONMode
-
 import logging
+from .record import Record
 from .sink import Sink
 
 logger = logging.getLogger(__name__)
 
 
 class ConsoleSink(Sink):
+    """
+    Logs every record at INFO level. Meant for debugging. Use `PipeSink` to feed records to other processes.
+    """
 
-    def write_record(self, obj: dict) -> None:
+    def write_record(self, record: Record, ack=None) -> None:
         """
         Prints the document via a INFO log
 
-        :param obj: dict.
+        :param record: Record.
+        :param ack: callable. Optional. Called once the record is logged.
         :return:
         """
-        opts = JSONOptions(strict_number_long=False, datetime_representation=DatetimeRepresentation.ISO8601,
-                           json_mode=JSONMode.RELAXED)
-        obj_str = json_util.dumps(obj)
+        obj_str = record.text
         logger.info(extra=dict(Func='Record', Op='Tail',
                                Attributes={'identifier': self.identifier,
                                            'record': obj_str}), msg=obj_str)
+        if ack:
+            ack()
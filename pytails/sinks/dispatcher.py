@@ -0,0 +1,132 @@
+import logging
+import queue
+import threading
+
+from .. import metrics
+from .record import Record
+
+logger = logging.getLogger(__name__)
+
+
+class SinkDispatcher:
+    """
+    Delivers records to data sinks on worker threads so a slow sink does not stall the tailing cursor.
+
+    Every sink gets its own pool of `workers` threads, each draining a bounded queue. Records are hash-partitioned on
+    their key (namespace and `_id`), so changes to the same document always go through the same worker and stay in
+    order, while different documents are written in parallel. When a queue is full, `dispatch` blocks, which applies
+    backpressure to the reader.
+
+    Once a write fails, the workers stop writing and drop the records still queued without acknowledging them, so no
+    record is delivered after an earlier change of its document was lost and the checkpoint stays before the failed
+    record. The error is raised by the next `dispatch`, `check` or `join`.
+    """
+    __stop = object()
+
+    def __init__(self, sinks, workers: int = 4, queue_size: int = 1000):
+        """
+        :param sinks: iterable of Sink
+        :param workers: int. Worker threads per sink
+        :param queue_size: int. Maximum records queued per worker
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self._lanes = {}
+        self.__threads = []
+        self.__error = None
+        self.__counter = 0
+        for sink in sinks:
+            lanes = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+            self._lanes[sink] = lanes
+            for i, lane in enumerate(lanes):
+                t = threading.Thread(target=self.__drain, args=(sink, lane), daemon=True,
+                                     name=f'{sink.__class__.__name__}-{i}')
+                t.start()
+                self.__threads.append(t)
+
+    def dispatch(self, record: Record, ack=None) -> None:
+        """
+        Queues a record for every sink. Blocks while the target queue is full.
+
+        :param record: Record. Records with the same key are written in order. Records without a key are spread
+                       round robin.
+        :param ack: callable. Optional. Passed to every sink with the record.
+        :return:
+        """
+        self.check()
+        lane = self._lane_index(record.key)
+        for lanes in self._lanes.values():
+            lanes[lane].put((record, ack))
+
+    def _lane_index(self, key) -> int:
+        if key is None:
+            self.__counter += 1
+            return self.__counter % self.workers
+        try:
+            return hash(key) % self.workers
+        except TypeError:
+            # `_id` can be an embedded document
+            return hash(repr(key)) % self.workers
+
+    def check(self) -> None:
+        """
+        Raises the error of a failed write, if any.
+
+        :return:
+        """
+        if self.__error:
+            raise self.__error
+
+    def queue_depths(self) -> dict:
+        """
+        Returns the number of queued records per sink.
+
+        :return: dict. sink class name -> queued records
+        """
+        depths = {}
+        for sink, lanes in self._lanes.items():
+            name = sink.__class__.__name__
+            depths[name] = depths.get(name, 0) + sum(lane.qsize() for lane in lanes)
+        return depths
+
+    def join(self) -> None:
+        """
+        Waits until every queued record has been written. Workers keep running.
+
+        :return:
+        """
+        for lanes in self._lanes.values():
+            for lane in lanes:
+                lane.join()
+        self.check()
+
+    def close(self) -> None:
+        """
+        Waits until every queued record has been written and stops the worker threads.
+
+        :return:
+        """
+        for lanes in self._lanes.values():
+            for lane in lanes:
+                lane.put(self.__stop)
+        for t in self.__threads:
+            t.join()
+        self.__threads = []
+
+    def __drain(self, sink, lane: queue.Queue):
+        while True:
+            item = lane.get()
+            if item is self.__stop:
+                lane.task_done()
+                return
+            if self.__error:
+                lane.task_done()
+                continue
+            try:
+                metrics.timed_write(sink, *item)
+            except Exception as ex:
+                logger.exception(ex, extra=dict(Func='Write', Op='DataSink',
+                                                Attributes={'datasink': sink.__class__.__name__}))
+                self.__error = ex
+            finally:
+                lane.task_done()
@@ -0,0 +1,167 @@
+import gzip
+import logging
+import os
+import struct
+import time
+
+from ..helpers.bson_utils import bson_timestamp_to_int
+from .buffered import BufferedSink
+from .record import Record
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b'PTX2'
+# magic, codec, compression
+INDEX_HEADER = struct.Struct('>4s16s12s')
+# lowest and highest timestamp of a block, byte offset of the block in the segment. Blocks are not ordered by
+# timestamp: parallel sink workers and a merge `max_delay` deliver records out of order.
+INDEX_ENTRY = struct.Struct('>QQQ')
+
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def segment_extension(codec: str, compression: str = None) -> str:
+    """
+    Returns the file extension of segments written with `codec` and `compression`.
+
+    :param codec: str. Codec name
+    :param compression: str. None, `gzip` or `zstd`
+    :return: str
+    """
+    return ('.' + codec if codec in ('bson', 'msgpack') else '.ndjson') + COMPRESSION_EXTENSIONS[compression]
+
+
+def get_compressor(compression: str = None, level: int = None):
+    """
+    Returns a function compressing one block into an independent gzip member or zstd frame. Concatenated blocks are
+    a valid `.gz` or `.zst` file.
+
+    :param compression: str. None, `gzip` or `zstd`
+    :param level: int. Compression level. Optional.
+    :return: callable or None
+    """
+    if compression is None:
+        return None
+    if compression == 'gzip':
+        level = 6 if level is None else level
+        return lambda data: gzip.compress(data, compresslevel=level)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression requires the zstandard package: pip install zstandard')
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.compress
+    raise ValueError(f'Unknown compression {compression}. Available: gzip, zstd')
+
+
+class FileSink(BufferedSink):
+    """
+    Writes records to rotating segment files in a local directory.
+
+    Text records are written as newline delimited JSON, BSON and MessagePack records back to back. Every batch is
+    written as one block, compressed on its own with `gzip` or `zstd` if enabled, so the segment stays a valid
+    `.gz`/`.zst` file and any block can be decompressed without the ones before it. Each segment has a sidecar
+    `.idx` file with the lowest and highest timestamp and the byte offset of every block, which `FileReader` uses to
+    read only the blocks overlapping a time range. A new segment is started once the current one reaches
+    `segment_bytes` or is `segment_age` seconds old. Records are acknowledged once their block is written and, with
+    `fsync`, synced to disk.
+    """
+    max_batch_records = 10000
+    max_batch_bytes = 8 * 1024 * 1024
+    max_record_bytes = 32 * 1024 * 1024
+
+    def __init__(self, identifier: str, directory: str, codec: str = 'json', compression: str = None,
+                 compression_level: int = None, segment_bytes: int = 256 * 1024 * 1024,
+                 segment_age: float = 3600.0, batch_size: int = None, linger: float = 1.0, fsync: bool = True):
+        """
+        :param identifier: str. Tail identifier
+        :param directory: str. Directory the segments are written to. Created if missing.
+        :param codec: str. Name of the codec records are encoded with. Stored in the index for `FileReader`.
+        :param compression: str. None, `gzip` or `zstd`. Default: None
+        :param compression_level: int. Optional.
+        :param segment_bytes: int. Segment size that starts a new segment. Default: 256 MiB
+        :param segment_age: float. Seconds after which a new segment is started. Default: 3600
+        :param batch_size: int. Maximum records per block. Default: 10000
+        :param linger: float. Seconds a record may be buffered before it is written. Default: 1.0
+        :param fsync: bool. Syncs every block to disk before acknowledging it. Default: True
+        """
+        self.directory = directory
+        self.codec = codec
+        self.compression = compression
+        self._compress = get_compressor(compression, compression_level)
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.fsync = fsync
+        self._extension = segment_extension(codec, compression)
+        self._segment = None
+        self._index = None
+        self._segment_opened = None
+        self._last_ts = 0
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(identifier, batch_size=batch_size, linger=linger)
+
+    def write_record(self, record: Record, ack=None) -> None:
+        """
+        Buffers the record for the next block.
+
+        :param record: Record.
+        :param ack: callable. Optional. Called once the block containing the record has been written.
+        :return:
+        """
+        # BSON is length prefixed, only text records need a delimiter
+        data = record.data if record.binary else record.data + b'\n'
+        ts = bson_timestamp_to_int(record.ts) if record.ts is not None else None
+        self._buffer_record((data, ts), len(data), ack)
+
+    def _put_batch(self, records: list) -> list:
+        stamps = [ts for _, ts in records if ts is not None]
+        low, high = (min(stamps), max(stamps)) if stamps else (self._last_ts, self._last_ts)
+        self._last_ts = max(self._last_ts, high)
+        if self._segment is None or self._segment.tell() >= self.segment_bytes or \
+                time.monotonic() - self._segment_opened >= self.segment_age:
+            self._rotate(low)
+        block = b''.join(data for data, _ in records)
+        if self._compress:
+            block = self._compress(block)
+        offset = self._segment.tell()
+        self._segment.write(block)
+        self._segment.flush()
+        self._index.write(INDEX_ENTRY.pack(low, high, offset))
+        self._index.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+            os.fsync(self._index.fileno())
+        return []
+
+    def _rotate(self, ts: int) -> None:
+        self._close_segment()
+        name = f'{ts:020d}'
+        n = 0
+        while os.path.exists(os.path.join(self.directory, name + '.idx')) or \
+                os.path.exists(os.path.join(self.directory, name + self._extension)):
+            n += 1
+            name = f'{ts:020d}-{n}'
+        path = os.path.join(self.directory, name)
+        self._segment = open(path + self._extension, 'wb')
+        self._index = open(path + '.idx', 'wb')
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, self.codec.encode('ascii'),
+                                            (self.compression or '').encode('ascii')))
+        self._segment_opened = time.monotonic()
+        logger.info(extra=dict(Func='Rotate', Op='DataSink',
+                               Attributes={'identifier': self.identifier, 'datasink': self.__class__.__name__,
+                                           'segment': path + self._extension}), msg='')
+
+    def _close_segment(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = self._index = None
+
+    def close(self) -> None:
+        """
+        Writes the buffered records and closes the current segment.
+        """
+        super().close()
+        with self._lock:
+            self._close_segment()
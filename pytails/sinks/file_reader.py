@@ -0,0 +1,237 @@
+import glob
+import gzip
+import io
+import logging
+import mmap
+import os
+import struct
+
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
+
+from ..helpers.bson_utils import bson_timestamp_to_int, int_to_bson_timestamp
+from ..helpers.oplog_utils import oplog_doc_key
+from .file import INDEX_ENTRY, INDEX_HEADER, INDEX_MAGIC, segment_extension
+from .record import Record
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentIndex:
+    """
+    Memory-mapped `.idx` file of a segment written by `FileSink`. Blocks are in the order they were written, which
+    is not timestamp order once records are delivered out of order, so lookups scan the timestamp range of every
+    block.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: str. Path of the `.idx` file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(INDEX_HEADER.size)
+            if len(header) < INDEX_HEADER.size:
+                raise ValueError(f'Truncated segment index {path}')
+            magic, codec, compression = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f'Not a segment index {path}')
+            self.codec = codec.rstrip(b'\0').decode('ascii')
+            self.compression = compression.rstrip(b'\0').decode('ascii') or None
+            size = os.fstat(f.fileno()).st_size
+            # a crash can leave a partially written last entry
+            self._count = (size - INDEX_HEADER.size) // INDEX_ENTRY.size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._count else None
+
+    def __len__(self):
+        return self._count
+
+    def entry(self, i: int) -> tuple:
+        """
+        Returns `(lowest timestamp, highest timestamp, byte offset)` of block `i`.
+        """
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return INDEX_ENTRY.unpack_from(self._map, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+
+    def blocks(self, start: int = None, end: int = None) -> list:
+        """
+        Returns the blocks that may hold records from `start` up to and including `end`. The size of the last block
+        is None, it runs to the end of the segment, including any block whose index entry was lost in a crash.
+
+        :param start: int. Timestamp as 64 bit integer. Optional.
+        :param end: int. Timestamp as 64 bit integer. Optional.
+        :return: list of `(byte offset, size)`
+        """
+        if not self._count:
+            return [(0, None)]
+        entries = [self.entry(i) for i in range(self._count)]
+        blocks = []
+        for i, (low, high, offset) in enumerate(entries):
+            # the unindexed tail can only be reached through the last block
+            last = i + 1 == self._count
+            if last or (start is None or high >= start) and (end is None or low <= end):
+                blocks.append((offset, None if last else entries[i + 1][2] - offset))
+        return blocks
+
+    @property
+    def data_path(self) -> str:
+        return self.path[:-len('.idx')] + segment_extension(self.codec, self.compression)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def record_meta(doc) -> tuple:
+    """
+    Returns the `(key, ts)` of a document written by pyTails, as far as the document shows them: oplog entries with
+    or without the `doc` wrapper, change events and full documents with the `ts` suffix. Full documents do not carry
+    their namespace, so their key is `(None, _id)`.
+
+    :param doc: dict.
+    :return: tuple. `(key, Timestamp)`, either may be None
+    """
+    inner = doc.get('doc', doc) if 'op' not in doc else doc
+    if not hasattr(inner, 'get'):
+        return None, None
+    if 'op' in inner and 'ns' in inner:
+        return oplog_doc_key(inner), inner.get('ts')
+    if 'documentKey' in inner:
+        ns = inner.get('ns', {})
+        return (f"{ns.get('db')}.{ns.get('coll')}", inner['documentKey'].get('_id')), inner.get('clusterTime')
+    ts = doc.get('ts')
+    if isinstance(ts, int):
+        ts = int_to_bson_timestamp(ts)
+    return ((None, inner['_id']) if '_id' in inner else None), ts
+
+
+class FileReader:
+    """
+    Reads records written by `FileSink` back from a directory of segments, from any timestamp on, in the order they
+    were written.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: str. Directory the segments were written to
+        """
+        self.directory = directory
+
+    def segments(self) -> list:
+        """
+        Returns the indexes of all segments, oldest first.
+
+        :return: list of SegmentIndex
+        """
+        paths = glob.glob(os.path.join(self.directory, '*.idx'))
+        return [SegmentIndex(path) for path in sorted(paths, key=_segment_order)]
+
+    def read(self, start_ts=None, end_ts=None):
+        """
+        Yields the records with a timestamp from `start_ts` up to and including `end_ts`, in the order they were
+        written. Records whose timestamp cannot be told from the document are yielded if they are in a block read.
+
+        :param start_ts: Timestamp. Optional. Reads from the first record if not set.
+        :param end_ts: Timestamp. Optional. Reads to the last record if not set.
+        :return: generator of Record
+        """
+        start = bson_timestamp_to_int(start_ts) if start_ts is not None else None
+        end = bson_timestamp_to_int(end_ts) if end_ts is not None else None
+        segments = self.segments()
+        try:
+            for segment in segments:
+                for record in self._read_segment(segment, segment.blocks(start, end)):
+                    ts = bson_timestamp_to_int(record.ts) if record.ts is not None else None
+                    if ts is not None and (start is not None and ts < start or end is not None and ts > end):
+                        continue
+                    yield record
+        finally:
+            for segment in segments:
+                segment.close()
+
+    def replay(self, sinks: list, start_ts=None, end_ts=None) -> int:
+        """
+        Writes the records from `start_ts` up to and including `end_ts` to `sinks` and flushes them.
+
+        :param sinks: list of Sink.
+        :param start_ts: Timestamp. Optional.
+        :param end_ts: Timestamp. Optional.
+        :return: int. Number of records replayed
+        """
+        count = 0
+        for record in self.read(start_ts, end_ts):
+            for sink in sinks:
+                sink.write_record(record)
+            count += 1
+        for sink in sinks:
+            sink.flush()
+        logger.info(extra=dict(Func='Replay', Op='DataSink',
+                               Attributes={'directory': self.directory, 'records': count,
+                                           'start_ts': bson_timestamp_to_int(start_ts) if start_ts else None,
+                                           'end_ts': bson_timestamp_to_int(end_ts) if end_ts else None}), msg='')
+        return count
+
+    def _read_segment(self, segment: SegmentIndex, blocks: list):
+        with open(segment.data_path, 'rb') as f:
+            for offset, size in blocks:
+                f.seek(offset)
+                stream = f if size is None else io.BytesIO(f.read(size))
+                if segment.compression == 'gzip':
+                    stream = gzip.GzipFile(fileobj=stream, mode='rb')
+                elif segment.compression == 'zstd':
+                    import zstandard
+                    stream = zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+                if segment.codec == 'bson':
+                    yield from self._read_bson(stream)
+                elif segment.codec == 'msgpack':
+                    raise ValueError('Segments written with the msgpack codec cannot be replayed')
+                else:
+                    for line in _lines(stream):
+                        doc = json_util.loads(line)
+                        key, ts = record_meta(doc)
+                        yield Record.from_data(doc, line, False, key, ts)
+
+    @staticmethod
+    def _read_bson(stream):
+        while True:
+            prefix = _read_exact(stream, 4)
+            if not prefix:
+                return
+            data = prefix + _read_exact(stream, struct.unpack('<i', prefix)[0] - 4)
+            doc = RawBSONDocument(data)
+            key, ts = record_meta(doc)
+            yield Record.from_data(doc, data, True, key, ts)
+
+
+def _segment_order(path: str) -> tuple:
+    # `<first ts>` or `<first ts>-<n>` for segments starting at the same timestamp
+    ts, _, n = os.path.basename(path)[:-len('.idx')].partition('-')
+    return int(ts), int(n or 0)
+
+
+def _read_exact(stream, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _lines(stream, chunk_size: int = 1024 * 1024):
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+    if pending:
+        yield pending
@@ -1,41 +1,64 @@
-import time
-
 import boto3
-from botocore.exceptions import ClientError
-from bson import json_util
+from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, \
+    ReadTimeoutError
 
-from .sink import Sink
+from .buffered import BufferedSink
+from .record import Record
 
 
-class FirehoseSink(Sink):
+class FirehoseSink(BufferedSink):
     """
     Enables writing documents to an AWS Kinesis Firehose Delivery Stream.
+
+    Records are sent with PutRecordBatch in batches of up to 500 records or 4 MiB. Records rejected in a
+    PutRecordBatch response are re-sent on their own, so a throttled batch is never dropped.
     """
     firehose_stream_name = None
     __firehose_client = None
 
-    _buffer = []
+    max_batch_bytes = 4 * 1024 * 1024
+    max_record_bytes = 1000 * 1024
+
+    _retryable_errors = ('ServiceUnavailableException', 'ThrottlingException', 'InternalFailure',
+                         'LimitExceededException')
+    # the request may not have reached Firehose, so the whole batch is sent again
+    _retryable_exceptions = (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError)
 
-    def __init__(self, identifier: str, firehose_stream_name: str):
-        super().__init__(identifier)
-        self.__firehose_client = boto3.client('firehose', verify=False)
+    def __init__(self, identifier: str, firehose_stream_name: str, batch_size: int = None, linger: float = 1.0,
+                 client=None):
+        """
+        :param identifier: str. Tail identifier
+        :param firehose_stream_name: str. Firehose Delivery Stream name. Not ARN
+        :param batch_size: int. Maximum records per PutRecordBatch call. Default: 500
+        :param linger: float. Seconds a record may be buffered before it is sent. Default: 1.0
+        :param client: Firehose client. Optional. Default: `boto3.client('firehose')`
+        """
+        self.__firehose_client = client or boto3.client('firehose', verify=False)
         self.firehose_stream_name = firehose_stream_name
+        super().__init__(identifier, batch_size=batch_size, linger=linger)
 
-    def write_record(self, obj: dict) -> None:
+    def write_record(self, record: Record, ack=None) -> None:
         """
-        Writes document to a Firehose Data Stream as a single record.
+        Buffers document for the next PutRecordBatch to the Firehose Delivery Stream.
 
-        :param obj: dict.
+        :param record: Record.
+        :param ack: callable. Optional. Called once the record has been accepted by Firehose.
         :return:
         """
-        obj_str = f'{json_util.dumps(obj)}\n'
-        self._buffer.append({'Data': obj_str})
-        if len(self._buffer) == 500:
-            try:
-                self.__firehose_client.put_record_batch(DeliveryStreamName=self.firehose_stream_name,
-                                                        Records=self._buffer)
-                self._buffer = []
-            except ClientError as ex:
-                if ex.response['Error']['Code'] == 'ServiceUnavailableException':
-                    time.sleep(1)
-                    self.write_record(obj)
+        # BSON is length prefixed, only text records need a delimiter
+        data = record.data if record.binary else record.data + b'\n'
+        self._buffer_record({'Data': data}, len(data), ack)
+
+    def _put_batch(self, records: list) -> list:
+        try:
+            resp = self.__firehose_client.put_record_batch(DeliveryStreamName=self.firehose_stream_name,
+                                                           Records=records)
+        except self._retryable_exceptions:
+            return records
+        except ClientError as ex:
+            if ex.response['Error']['Code'] in self._retryable_errors:
+                return records
+            raise ex
+        if not resp.get('FailedPutCount'):
+            return []
+        return [rec for rec, res in zip(records, resp['RequestResponses']) if 'ErrorCode' in res]
@@ -1,41 +1,183 @@
+import hashlib
 import time
 import uuid
 
 import boto3
-from botocore.exceptions import ClientError
-from bson import json_util
+from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, \
+    ReadTimeoutError
 
-from .sink import Sink
+from .buffered import BufferedSink
+from .kinesis_shards import KinesisShardMap
+from .kpl import RecordAggregator
+from .record import Record
 
 
-class KinesisSink(Sink):
+class KinesisSink(BufferedSink):
     """
-    Enables writing documents to an AWS Kinesis Data Stream
+    Enables writing documents to an AWS Kinesis Data Stream.
+
+    Records are sent with PutRecords in batches of up to 500 records or 5 MB. Records rejected in a PutRecords
+    response are re-sent, so a throttled batch is never dropped. Kinesis accepts the other records of the batch, so
+    every later record with the partition key of a rejected one is re-sent with it, in order: the last record written
+    for a key is always the last one delivered, at the cost of delivering some records twice.
+
+    The partition key is derived from the record according to `partition_strategy`:
+
+    - `ns_id`: namespace and `_id` of the changed document. Keeps per-document order.
+    - `ns`: namespace only. Keeps per-collection order.
+    - `field:<path>`: value of a dotted path in the written document, e.g. `field:doc.o.tenant`. Falls back to
+      `ns_id` if the path is missing.
+
+    With `shard_map`, records are routed with explicit hash keys that spread partition keys evenly over the open
+    shards, see `KinesisShardMap`.
+
+    With `aggregate`, many records are packed into each Kinesis record in the KPL aggregation format. Records are
+    aggregated per shard with `shard_map`, or per bucket of the partition key hash otherwise, and every aggregate is
+    pinned to a fixed explicit hash key, so all records with the same partition key still land on the same shard in
+    order.
     """
     kinesis_stream_name = None
     __kinesis_client = None
 
-    def __init__(self, identifier: str, kinesis_stream_name: str):
-        super().__init__(identifier)
-        self.__kinesis_client = boto3.client('kinesis')
+    max_record_bytes = 1024 * 1024
+
+    _retryable_errors = ('ProvisionedThroughputExceededException', 'InternalFailure', 'ServiceUnavailable',
+                         'ThrottlingException', 'LimitExceededException')
+    # the request may not have reached Kinesis, so the whole batch is sent again
+    _retryable_exceptions = (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError)
+
+    def __init__(self, identifier: str, kinesis_stream_name: str, batch_size: int = None, linger: float = 1.0,
+                 aggregate: bool = False, aggregation_buckets: int = 64, partition_strategy: str = 'ns_id',
+                 shard_map: bool = False, shard_map_refresh: float = 300.0, client=None):
+        """
+        :param identifier: str. Tail identifier
+        :param kinesis_stream_name: str. Kinesis Data Stream name. Not ARN
+        :param batch_size: int. Maximum records per PutRecords call. Default: 500
+        :param linger: float. Seconds a record may be buffered before it is sent. Default: 1.0
+        :param aggregate: bool. Packs records into KPL aggregated records. Default: False
+        :param aggregation_buckets: int. Aggregates built in parallel without `shard_map`. Should be at least the number
+                                    of shards.
+        :param partition_strategy: str. `ns_id`, `ns` or `field:<path>`. Default: `ns_id`
+        :param shard_map: bool. Routes records with explicit hash keys from ListShards. Default: False
+        :param shard_map_refresh: float. Seconds between ListShards calls. Default: 300
+        :param client: Kinesis client. Optional. Default: `boto3.client('kinesis')`
+        """
+        self.__kinesis_client = client or boto3.client('kinesis')
         self.kinesis_stream_name = kinesis_stream_name
+        self.aggregate = aggregate
+        self.aggregation_buckets = aggregation_buckets
+        self._aggregates = {}
+        if partition_strategy not in ('ns_id', 'ns') and not partition_strategy.startswith('field:'):
+            raise ValueError(f'Unknown partition strategy {partition_strategy}')
+        self.partition_strategy = partition_strategy
+        self._field_path = partition_strategy[len('field:'):].split('.') if partition_strategy.startswith(
+            'field:') else None
+        self._shard_map = None
+        if shard_map:
+            self._shard_map = KinesisShardMap(self.__kinesis_client, kinesis_stream_name, shard_map_refresh)
+            self._shard_map.load()
+        super().__init__(identifier, batch_size=batch_size, linger=linger)
 
-    def write_record(self, obj: dict) -> None:
+    def write_record(self, record: Record, ack=None) -> None:
         """
-        Writes document to Kinesis Data Stream.
+        Buffers document for the next PutRecords batch to Kinesis Data Stream.
 
-        :param obj:
+        :param record: Record.
+        :param ack: callable. Optional. Called once the record has been accepted by Kinesis.
         :return:
         """
-        obj_str = json_util.dumps(obj)
-        try:
+        part_key = self._partition_key(record)
+        if self._shard_map and self._shard_map.stale:
+            self._refresh_shard_map()
+        if self.aggregate:
+            self._aggregate_record(part_key, record.data, ack)
+            return
+        entry = {'Data': record.data, 'PartitionKey': part_key}
+        hash_key = self._shard_map.explicit_hash_key(part_key) if self._shard_map else None
+        if hash_key is not None:
+            entry['ExplicitHashKey'] = hash_key
+        self._buffer_record(entry, len(record.data) + len(part_key), ack)
+
+    def _partition_key(self, record: Record) -> str:
+        if self._field_path:
+            value = record.doc
             try:
-                part_key = obj['o']['_id']['$oid']
-            except:
-                part_key = str(uuid.uuid4())
-            self.__kinesis_client.put_record(StreamName=self.kinesis_stream_name,
-                                             Data=obj_str,
-                                             PartitionKey=part_key)
+                for part in self._field_path:
+                    value = value[part]
+                return str(value)[:256]
+            except (KeyError, TypeError, IndexError):
+                pass
+        if record.key is None:
+            return str(uuid.uuid4())
+        ns, _id = record.key
+        if self.partition_strategy == 'ns':
+            return ns[:256]
+        # Kinesis partition keys are limited to 256 characters
+        return f'{ns}:{_id}'[:256]
+
+    def _refresh_shard_map(self) -> None:
+        with self._lock:
+            # aggregates are keyed by shard index, which a changed shard map invalidates
+            self._seal()
+            self._shard_map.load()
+
+    def _aggregate_record(self, part_key: str, data: bytes, ack=None) -> None:
+        self._raise_error()
+        # leaves room for the aggregation framing, a record alone in an aggregate must still fit a Kinesis record
+        self._check_record_size(len(data) + len(part_key), self.max_record_bytes - 256)
+        bucket = self._shard_map.shard_index(part_key) if self._shard_map else None
+        if bucket is None:
+            bucket = int(hashlib.md5(part_key.encode('utf-8')).hexdigest(), 16) % self.aggregation_buckets
+        with self._lock:
+            aggregator, acks, _ = self._aggregates.get(bucket, (None, None, None))
+            if aggregator is not None and not aggregator.fits(part_key, data):
+                self._seal_bucket(bucket)
+                aggregator = None
+            if aggregator is None:
+                aggregator, acks = RecordAggregator(self.max_record_bytes - 256), []
+                self._aggregates[bucket] = (aggregator, acks, time.monotonic())
+            aggregator.add(part_key, data)
+            if ack:
+                acks.append(ack)
+
+    def _bucket_hash_key(self, bucket: int) -> str:
+        if self._shard_map and self._shard_map.shards:
+            return self._shard_map.shards[bucket][1]
+        # midpoint of the bucket's slice of the 128 bit hash key space
+        width = 2 ** 128 // self.aggregation_buckets
+        return str(bucket * width + width // 2)
+
+    def _seal_bucket(self, bucket: int) -> None:
+        aggregator, acks, opened = self._aggregates.pop(bucket)
+        data = aggregator.serialize()
+        part_key = f'aggregate-{bucket}'
+        self._buffer_record({'Data': data, 'PartitionKey': part_key,
+                             'ExplicitHashKey': self._bucket_hash_key(bucket)},
+                            len(data) + len(part_key), lambda: [ack() for ack in acks], since=opened)
+
+    def _seal(self, max_age: float = None) -> None:
+        # a bucket keeps filling until its first record has lingered, so busy buckets still send full aggregates
+        now = time.monotonic()
+        for bucket, (_, _, opened) in list(self._aggregates.items()):
+            if max_age is None or now - opened >= max_age:
+                self._seal_bucket(bucket)
+
+    def _put_batch(self, records: list) -> list:
+        try:
+            resp = self.__kinesis_client.put_records(StreamName=self.kinesis_stream_name, Records=records)
+        except self._retryable_exceptions:
+            return records
         except ClientError as ex:
-            if ex.response['Error']['Code'] == 'ProvisionedThroughputExceededException':
-                time.sleep(1)
+            if ex.response['Error']['Code'] in self._retryable_errors:
+                return records
+            raise ex
+        if not resp.get('FailedRecordCount'):
+            return []
+        failed = []
+        failed_keys = set()
+        for rec, res in zip(records, resp['Records']):
+            # aggregates of the same bucket share a partition key as well as an explicit hash key
+            if 'ErrorCode' in res or rec['PartitionKey'] in failed_keys:
+                failed.append(rec)
+                failed_keys.add(rec['PartitionKey'])
+        return failed
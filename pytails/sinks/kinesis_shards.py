@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class KinesisShardMap:
+    """
+    Open shards of a Kinesis Data Stream, read with ListShards.
+
+    Partition keys are spread evenly over the open shards by their MD5 hash, and each is sent with an explicit hash
+    key at the middle of its shard's hash key range. Unlike plain partition key hashing, every shard gets the same
+    share of keys even when shard hash key ranges are uneven. The map is re-read every `refresh` seconds, so shard
+    splits and merges are picked up. Keys can move to another shard when the shard count changes. If ListShards returns
+    no open shards, the previous map is kept. Without any map, keys are left to plain partition key hashing.
+    """
+
+    def __init__(self, kinesis_client, stream_name: str, refresh: float = 300.0):
+        """
+        :param kinesis_client: boto3 Kinesis client
+        :param stream_name: str. Kinesis Data Stream name
+        :param refresh: float. Seconds between ListShards calls
+        """
+        self.__client = kinesis_client
+        self.stream_name = stream_name
+        self.refresh = refresh
+        self.shards = []
+        self._loaded_at = None
+
+    def load(self) -> list:
+        """
+        Reads the open shards of the stream.
+
+        :return: list of `(shard id, explicit hash key)` ordered by hash key range
+        """
+        shards = []
+        kwargs = dict(StreamName=self.stream_name)
+        while True:
+            resp = self.__client.list_shards(**kwargs)
+            for shard in resp['Shards']:
+                # closed shards (parents of splits and merges) have an ending sequence number
+                if 'EndingSequenceNumber' in shard.get('SequenceNumberRange', {}):
+                    continue
+                start = int(shard['HashKeyRange']['StartingHashKey'])
+                end = int(shard['HashKeyRange']['EndingHashKey'])
+                shards.append((start, shard['ShardId'], str(start + (end - start) // 2)))
+            if not resp.get('NextToken'):
+                break
+            kwargs = dict(NextToken=resp['NextToken'])
+        self._loaded_at = time.monotonic()
+        if not shards and self.shards:
+            # e.g. a stream being deleted and re-created, routing keeps working until shards are back
+            logger.warning(extra=dict(Func='Load', Op='ShardMap',
+                                      Attributes={'stream': self.stream_name, 'kept': len(self.shards)}),
+                           msg='No open shards, keeping the previous shard map')
+            return self.shards
+        self.shards = [(shard_id, hash_key) for _, shard_id, hash_key in sorted(shards)]
+        logger.info(extra=dict(Func='Load', Op='ShardMap',
+                               Attributes={'stream': self.stream_name, 'shards': len(self.shards)}), msg='')
+        return self.shards
+
+    @property
+    def stale(self) -> bool:
+        """
+        Returns True if the map has not been loaded or is older than `refresh` seconds.
+        """
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh
+
+    def shard_index(self, partition_key: str) -> int:
+        """
+        Returns the index of the shard `partition_key` is assigned to.
+
+        :param partition_key: str.
+        :return: int. None if no open shards are known
+        """
+        if not self.shards:
+            return None
+        return int(hashlib.md5(partition_key.encode('utf-8')).hexdigest(), 16) % len(self.shards)
+
+    def explicit_hash_key(self, partition_key: str) -> str:
+        """
+        Returns the explicit hash key that routes `partition_key` to its assigned shard.
+
+        :param partition_key: str.
+        :return: str. None if no open shards are known
+        """
+        index = self.shard_index(partition_key)
+        return None if index is None else self.shards[index][1]
@@ -0,0 +1,160 @@
+import hashlib
+
+# https://github.com/awslabs/amazon-kinesis-producer/blob/master/aggregation-format.md
+KPL_MAGIC = b'\xf3\x89\x9a\xc2'
+_DIGEST_SIZE = 16
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(buf: bytes, pos: int):
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _bytes_field(number: int, value: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _int_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+class RecordAggregator:
+    """
+    Packs user records into a single Kinesis record in the KPL aggregation format: a magic header, the
+    `AggregatedRecord` protobuf message and its MD5 digest. Consumers using the KCL deaggregate the user records
+    transparently, each with its own partition key.
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024 - 256):
+        """
+        :param max_bytes: int. Maximum size of the serialized aggregated record
+        """
+        self.max_bytes = max_bytes
+        self._partition_keys = {}
+        self._hash_keys = {}
+        self._tables = bytearray()
+        self._records = bytearray()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def size(self) -> int:
+        """
+        Returns the size of the serialized aggregated record.
+        """
+        return len(KPL_MAGIC) + len(self._tables) + len(self._records) + _DIGEST_SIZE
+
+    def _encode(self, partition_key: str, data: bytes, explicit_hash_key: str = None):
+        tables = b''
+        pk_index = self._partition_keys.get(partition_key)
+        if pk_index is None:
+            pk_index = len(self._partition_keys)
+            tables += _bytes_field(1, partition_key.encode('utf-8'))
+        record = _int_field(1, pk_index)
+        ehk_index = None
+        if explicit_hash_key is not None:
+            ehk_index = self._hash_keys.get(explicit_hash_key)
+            if ehk_index is None:
+                ehk_index = len(self._hash_keys)
+                tables += _bytes_field(2, explicit_hash_key.encode('utf-8'))
+            record += _int_field(2, ehk_index)
+        record += _bytes_field(3, data)
+        return tables, _bytes_field(3, record), pk_index, ehk_index
+
+    def fits(self, partition_key: str, data: bytes, explicit_hash_key: str = None) -> bool:
+        """
+        Returns True if the user record can be added without exceeding `max_bytes`. An empty aggregator always
+        accepts a record.
+        """
+        if not self._count:
+            return True
+        tables, record, _, _ = self._encode(partition_key, data, explicit_hash_key)
+        return self.size + len(tables) + len(record) <= self.max_bytes
+
+    def add(self, partition_key: str, data: bytes, explicit_hash_key: str = None) -> None:
+        """
+        Adds a user record.
+
+        :param partition_key: str. Partition key of the user record
+        :param data: bytes. User record
+        :param explicit_hash_key: str. Explicit hash key of the user record. Optional.
+        :return:
+        """
+        tables, record, pk_index, ehk_index = self._encode(partition_key, data, explicit_hash_key)
+        self._partition_keys.setdefault(partition_key, pk_index)
+        if explicit_hash_key is not None:
+            self._hash_keys.setdefault(explicit_hash_key, ehk_index)
+        # protobuf allows repeated fields to be interleaved, so tables and records are kept apart
+        self._tables += tables
+        self._records += record
+        self._count += 1
+
+    def serialize(self) -> bytes:
+        """
+        Returns the aggregated record.
+
+        :return: bytes
+        """
+        body = bytes(self._tables + self._records)
+        return KPL_MAGIC + body + hashlib.md5(body).digest()
+
+
+def deaggregate(data: bytes) -> list:
+    """
+    Splits a Kinesis record into its user records. Records not in the KPL aggregation format are returned as is.
+
+    :param data: bytes. Kinesis record data
+    :return: list of `(partition_key, explicit_hash_key, data)`. Keys are None for non-aggregated records.
+    """
+    if not data.startswith(KPL_MAGIC) or len(data) < len(KPL_MAGIC) + _DIGEST_SIZE:
+        return [(None, None, data)]
+    body = data[len(KPL_MAGIC):-_DIGEST_SIZE]
+    if hashlib.md5(body).digest() != data[-_DIGEST_SIZE:]:
+        return [(None, None, data)]
+
+    partition_keys, hash_keys, records = [], [], []
+    pos = 0
+    while pos < len(body):
+        tag, pos = _read_varint(body, pos)
+        length, pos = _read_varint(body, pos)
+        value = body[pos:pos + length]
+        pos += length
+        if tag >> 3 == 1:
+            partition_keys.append(value.decode('utf-8'))
+        elif tag >> 3 == 2:
+            hash_keys.append(value.decode('utf-8'))
+        elif tag >> 3 == 3:
+            records.append(value)
+
+    out = []
+    for record in records:
+        fields = {}
+        pos = 0
+        while pos < len(record):
+            tag, pos = _read_varint(record, pos)
+            if tag & 7 == 0:
+                fields[tag >> 3], pos = _read_varint(record, pos)
+            else:
+                length, pos = _read_varint(record, pos)
+                fields[tag >> 3] = record[pos:pos + length]
+                pos += length
+        ehk = hash_keys[fields[2]] if 2 in fields else None
+        out.append((partition_keys[fields[1]], ehk, bytes(fields[3])))
+    return out
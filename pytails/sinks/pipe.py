@@ -0,0 +1,104 @@
+import errno
+import logging
+import os
+import sys
+
+from .buffered import BufferedSink
+from .record import Record
+
+logger = logging.getLogger(__name__)
+
+
+class PipeSink(BufferedSink):
+    """
+    Writes records as newline delimited JSON to stdout, a named pipe or a file, for local consumers such as `jq` or
+    `vector`.
+
+    Records are written as they were serialized, without going through logging. Batches are joined and written with a
+    single call once `batch_bytes` are buffered or the oldest record has waited `linger` seconds. A slow reader blocks
+    the write, which applies backpressure to tailing through the sink buffer, and records are only acknowledged once
+    written. Records encoded with a binary codec are converted to Extended JSON.
+
+    If the reader goes away (`EPIPE`), the sink stops accepting records and raises `BrokenPipeError`, so tailing stops
+    without checkpointing records that were never read.
+    """
+    max_batch_records = 100000
+    max_batch_bytes = 16 * 1024 * 1024
+    max_record_bytes = 64 * 1024 * 1024
+
+    def __init__(self, identifier: str, path: str = None, stream=None, batch_bytes: int = 1024 * 1024,
+                 linger: float = 0.1):
+        """
+        :param identifier: str. Tail identifier
+        :param path: str. Named pipe or file to write to. Optional. Default: stdout
+        :param stream: binary file object to write to instead of `path`. Optional.
+        :param batch_bytes: int. Bytes buffered before a write. Default: 1 MiB
+        :param linger: float. Seconds a record may be buffered before it is written. Default: 0.1
+        """
+        self.path = path
+        self._owns_stream = stream is None and path is not None
+        if stream is None:
+            # opening a named pipe blocks until a reader opens it
+            stream = open(path, 'ab') if path else sys.stdout.buffer
+        self._stream = stream
+        self._broken = None
+        super().__init__(identifier, batch_bytes=batch_bytes, linger=linger)
+
+    def write_record(self, record: Record, ack=None) -> None:
+        """
+        Buffers the record for the next write.
+
+        :param record: Record.
+        :param ack: callable. Optional. Called once the record has been written.
+        :return:
+        """
+        if self._broken:
+            raise self._broken
+        data = record.text.encode('utf-8') if record.binary else record.data
+        self._buffer_record(data + b'\n', len(data) + 1, ack)
+
+    def _put_batch(self, records: list) -> list:
+        if self._broken:
+            raise self._broken
+        try:
+            self._stream.write(b''.join(records))
+            self._stream.flush()
+        except BrokenPipeError as ex:
+            self._on_broken_pipe(ex)
+            raise
+        except OSError as ex:
+            if ex.errno != errno.EPIPE:
+                raise
+            self._on_broken_pipe(ex)
+            raise BrokenPipeError(*ex.args) from ex
+        return []
+
+    def _on_broken_pipe(self, ex: OSError) -> None:
+        self._broken = ex
+        logger.error(extra=dict(Func='Write', Op='DataSink',
+                                Attributes={'identifier': self.identifier, 'datasink': self.__class__.__name__,
+                                            'path': self.path or 'stdout'}), msg='Reader closed the pipe')
+        if not self._owns_stream:
+            # keep the interpreter from failing again when it flushes stdout at exit
+            try:
+                os.dup2(os.open(os.devnull, os.O_WRONLY), self._stream.fileno())
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    def flush(self) -> None:
+        if self._broken:
+            return
+        super().flush()
+
+    def close(self) -> None:
+        """
+        Writes the buffered records and closes the pipe or file, if the sink opened it.
+        """
+        try:
+            super().close()
+        finally:
+            if self._owns_stream:
+                try:
+                    self._stream.close()
+                except BrokenPipeError:
+                    pass
@@ -0,0 +1,68 @@
+from bson import json_util
+
+from ..helpers.codecs import Codec
+
+
+class Record:
+    """
+    A record written to data sinks. The document is serialized once, when the record is created, and every sink
+    reuses the same bytes.
+    """
+    __slots__ = ('_doc', 'key', 'ts', 'data', 'binary', '_text', '_decode')
+
+    def __init__(self, doc, codec: Codec, key=None, ts=None):
+        """
+        :param doc: dict. Document to write
+        :param codec: Codec. Serializes `doc`
+        :param key: hashable. `(namespace, _id)` of the changed document. Optional.
+        :param ts: Timestamp. oplog or cluster time of the change. Optional.
+        """
+        self._doc = doc
+        self.key = key
+        self.ts = ts
+        self.data = codec.encode(doc)
+        self.binary = codec.binary
+        self._text = None
+        self._decode = None
+
+    @classmethod
+    def from_data(cls, doc, data: bytes, binary: bool = False, key=None, ts=None, decode=None):
+        """
+        Returns a record for a document that is already serialized, e.g. read back from a file, without encoding it
+        again.
+
+        :param doc: dict. Decoded document. None to decode it with `decode` when first accessed.
+        :param data: bytes. Serialized document
+        :param binary: bool. True if `data` is not UTF-8 text
+        :param key: hashable. `(namespace, _id)` of the changed document. Optional.
+        :param ts: Timestamp. oplog or cluster time of the change. Optional.
+        :param decode: callable. Optional. `decode(data)` returns the document, e.g. `Codec.decode`
+        :return: Record
+        """
+        record = cls.__new__(cls)
+        record._doc = doc
+        record.key = key
+        record.ts = ts
+        record.data = data
+        record.binary = binary
+        record._text = None
+        record._decode = decode
+        return record
+
+    @property
+    def doc(self):
+        if self._doc is None and self._decode is not None:
+            self._doc = self._decode(self.data)
+        return self._doc
+
+    @property
+    def text(self) -> str:
+        """
+        Returns the record as text, for sinks that can only write text. Records encoded with a binary codec are
+        converted to Extended JSON.
+
+        :return: str
+        """
+        if self._text is None:
+            self._text = json_util.dumps(self.doc) if self.binary else self.data.decode('utf-8')
+        return self._text
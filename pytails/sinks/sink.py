@@ -1,5 +1,7 @@
 import abc
 
+from .record import Record
+
 
 class Sink(metaclass=abc.ABCMeta):
     identifier = None
@@ -8,10 +10,33 @@ class Sink(metaclass=abc.ABCMeta):
         self.identifier = identifier
 
     @abc.abstractmethod
-    def write_record(self, obj: dict) -> None:
+    def write_record(self, record: Record, ack=None) -> None:
         """
         Method to write record to sink
 
-        :param obj:
+        :param record: Record. Serialized record
+        :param ack: callable. Optional. Must be called once the record has been delivered.
         """
         pass
+
+    def set_catch_up(self, catch_up: bool, steady_linger: float = None) -> None:
+        """
+        Tunes batching for catching up with the oplog or for low latency near its head. Sinks that do not batch
+        ignore it.
+
+        :param catch_up: bool. True while the tail is far behind the head of the oplog
+        :param steady_linger: float. Longest linger in steady state. Optional.
+        """
+        pass
+
+    def flush(self) -> None:
+        """
+        Delivers any buffered records. Sinks that write synchronously have nothing to flush.
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Flushes the sink and releases any resources held by it.
+        """
+        self.flush()
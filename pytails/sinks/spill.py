@@ -0,0 +1,251 @@
+import glob
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from bson import BSON
+
+from .record import Record
+
+logger = logging.getLogger(__name__)
+
+SPILL_EXTENSION = '.spill'
+
+
+class SpillQueue:
+    """
+    Local write-ahead queue between the tailing cursor and the data sinks.
+
+    Records are appended to segment files in the spill directory and delivered from a background thread, so the
+    reader keeps pulling at full speed while slow or throttled sinks work through the backlog at their own rate.
+    Each entry is a BSON document holding the serialized record, its key and timestamp, so entries are length
+    prefixed and the record is not encoded again. Segments are synced to disk at most every `fsync_interval`
+    seconds and deleted once every entry in them has been delivered. `put` only blocks when the spilled records
+    would exceed `max_bytes` on disk.
+
+    Acknowledgements stay in memory and are passed on with the delivered record, so checkpoints only move past
+    spilled records once the sinks have delivered them. Segments left behind by a previous run are delivered first,
+    without acknowledgements: their records are newer than the last checkpoint and are read again from the oplog,
+    but they can no longer be once the oplog has rolled over.
+    """
+
+    def __init__(self, directory: str, deliver, max_bytes: int = 1024 * 1024 * 1024,
+                 segment_bytes: int = 64 * 1024 * 1024, fsync_interval: float = 1.0, decode=None,
+                 recover: bool = True):
+        """
+        :param directory: str. Directory the segments are written to. Created if missing.
+        :param deliver: callable. `deliver(record, ack)`, called in order from the delivery thread
+        :param max_bytes: int. Disk budget. `put` blocks while the spilled records exceed it. Default: 1 GiB
+        :param segment_bytes: int. Segment size that starts a new segment. Default: 64 MiB
+        :param fsync_interval: float. Seconds between syncs of the current segment to disk. None never syncs.
+                               Default: 1.0
+        :param decode: callable. Optional. Decodes the document of delivered records when a sink needs it,
+                       e.g. `Codec.decode`
+        :param recover: bool. Delivers segments left by a previous run. Deletes them if False. Default: True
+        """
+        self.directory = directory
+        self.deliver = deliver
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.decode = decode
+        self.__cond = threading.Condition()
+        # (path, live). Entries of live segments have an acknowledgement in `__acks`
+        self.__segments = deque()
+        self.__acks = deque()
+        self.__writer = None
+        self.__write_path = None
+        self.__dirty = False
+        self.__synced = time.monotonic()
+        self.__bytes = 0
+        self.__pending = 0
+        self.__seq = 0
+        self.__closing = False
+        self.__error = None
+        os.makedirs(directory, exist_ok=True)
+        self.__load(recover)
+        self.__thread = threading.Thread(target=self.__drain, daemon=True, name='SpillQueue')
+        self.__thread.start()
+
+    def __load(self, recover: bool) -> None:
+        for path in sorted(glob.glob(os.path.join(self.directory, '*' + SPILL_EXTENSION))):
+            if recover:
+                self.__segments.append((path, False))
+                self.__bytes += os.path.getsize(path)
+            else:
+                os.remove(path)
+        if self.__segments:
+            self.__seq = int(os.path.basename(self.__segments[-1][0])[:-len(SPILL_EXTENSION)])
+            logger.info(extra=dict(Func='Recover', Op='Spill',
+                                   Attributes={'directory': self.directory, 'segments': len(self.__segments),
+                                               'bytes': self.__bytes}), msg='')
+
+    @property
+    def spilled_bytes(self) -> int:
+        """
+        Returns the bytes of segments not yet delivered and deleted.
+        """
+        return self.__bytes
+
+    @property
+    def pending(self) -> int:
+        """
+        Returns the number of records put but not yet delivered.
+        """
+        return self.__pending
+
+    def put(self, record: Record, ack=None) -> None:
+        """
+        Appends a record to the spill queue. Blocks while the disk budget is used up.
+
+        :param record: Record.
+        :param ack: callable. Optional. Passed to `deliver` with the record.
+        :return:
+        """
+        if self.__error:
+            raise self.__error
+        entry = BSON.encode({'d': record.data, 'b': record.binary,
+                             'k': list(record.key) if record.key is not None else None, 't': record.ts})
+        with self.__cond:
+            if self.__bytes + len(entry) > self.max_bytes and self.__bytes:
+                logger.warning(extra=dict(Func='Put', Op='Spill',
+                                          Attributes={'directory': self.directory, 'bytes': self.__bytes,
+                                                      'max_bytes': self.max_bytes}), msg='Spill budget used up')
+                # the current segment is only deleted once it is finished
+                self.__rotate()
+                self.__cond.notify_all()
+                while self.__bytes + len(entry) > self.max_bytes and self.__bytes and not self.__error:
+                    self.__cond.wait(1.0)
+                if self.__error:
+                    raise self.__error
+            if self.__writer is None or self.__writer.tell() >= self.segment_bytes:
+                self.__rotate()
+            self.__writer.write(entry)
+            self.__acks.append(ack)
+            self.__bytes += len(entry)
+            self.__pending += 1
+            self.__dirty = True
+            if self.fsync_interval is not None and time.monotonic() - self.__synced >= self.fsync_interval:
+                self.__sync()
+            self.__cond.notify_all()
+
+    def join(self) -> None:
+        """
+        Waits until every record put has been delivered.
+
+        :return:
+        """
+        with self.__cond:
+            while self.__pending and not self.__error:
+                self.__cond.wait(1.0)
+        if self.__error:
+            raise self.__error
+
+    def close(self) -> None:
+        """
+        Delivers every spilled record and stops the delivery thread. Segments are kept if delivery failed.
+
+        :return:
+        """
+        with self.__cond:
+            self.__closing = True
+            self.__cond.notify_all()
+        self.__thread.join()
+        with self.__cond:
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
+
+    def __rotate(self) -> None:
+        if self.__writer is not None:
+            self.__sync()
+            self.__writer.close()
+        self.__seq += 1
+        self.__write_path = os.path.join(self.directory, f'{self.__seq:012d}{SPILL_EXTENSION}')
+        self.__writer = open(self.__write_path, 'wb')
+        self.__segments.append((self.__write_path, True))
+
+    def __sync(self) -> None:
+        self.__writer.flush()
+        if self.fsync_interval is not None:
+            os.fsync(self.__writer.fileno())
+        self.__dirty = False
+        self.__synced = time.monotonic()
+
+    def __next_segment(self):
+        with self.__cond:
+            while not self.__segments:
+                if self.__closing or self.__error:
+                    return None
+                self.__cond.wait()
+            return self.__segments[0]
+
+    def __drain(self) -> None:
+        while True:
+            segment = self.__next_segment()
+            if segment is None:
+                return
+            path, live = segment
+            try:
+                with open(path, 'rb') as reader:
+                    self.__drain_segment(reader, path, live)
+            except Exception as ex:
+                logger.exception(ex, extra=dict(Func='Deliver', Op='Spill', Attributes={'segment': path}))
+                with self.__cond:
+                    self.__error = ex
+                    self.__cond.notify_all()
+                return
+            with self.__cond:
+                self.__segments.popleft()
+                self.__bytes -= os.path.getsize(path)
+                os.remove(path)
+                self.__cond.notify_all()
+
+    def __drain_segment(self, reader, path: str, live: bool) -> None:
+        while True:
+            position = reader.tell()
+            entry = _read_entry(reader)
+            if entry is not None:
+                self.__deliver(entry, live)
+                continue
+            reader.seek(position)
+            with self.__cond:
+                if path != self.__write_path:
+                    # a finished segment, or one a crash left with a partial last entry
+                    return
+                if self.__dirty:
+                    self.__writer.flush()
+                    self.__dirty = False
+                    continue
+                if self.__closing:
+                    self.__writer.close()
+                    self.__writer = self.__write_path = None
+                    return
+                if self.__writer.tell() > position:
+                    # the rest of the entry is being written
+                    continue
+                self.__cond.wait()
+
+    def __deliver(self, entry: bytes, live: bool) -> None:
+        doc = BSON(entry).decode()
+        key = tuple(doc['k']) if doc['k'] is not None else None
+        record = Record.from_data(None, doc['d'], doc['b'], key, doc['t'], self.decode)
+        self.deliver(record, self.__acks.popleft() if live else None)
+        if live:
+            with self.__cond:
+                self.__pending -= 1
+                if not self.__pending:
+                    self.__cond.notify_all()
+
+
+def _read_entry(reader):
+    prefix = reader.read(4)
+    if len(prefix) < 4:
+        return None
+    size = int.from_bytes(prefix, 'little')
+    body = reader.read(size - 4)
+    if len(body) < size - 4:
+        return None
+    return prefix + body
@@ -1,2 +1,26 @@
-from .ddb_store import DynamoDbStore
+from ..helpers.plugins import LazyPlugin, load_plugin
 from .null_store import NullStore
+from .sqlite_store import SqliteStore
+from .mongo_store import MongoDbStore
+from .cached_store import CachedStore
+
+# `DynamoDbStore` is imported on first use, so that importing `pytails.state` does not load boto3
+STORES = {
+    'dynamodb': 'pytails.state.ddb_store:DynamoDbStore',
+    'sqlite': 'pytails.state.sqlite_store:SqliteStore',
+    'mongodb': 'pytails.state.mongo_store:MongoDbStore',
+    'none': 'pytails.state.null_store:NullStore',
+}
+
+
+def get_store_class(name: str) -> type:
+    """
+    Returns the checkpoint store class registered under `name`, importing its module on first use.
+
+    :param name: str. One of `STORES`, or an entry point in the `pytails.stores` group
+    :return: type. Subclass of StateStore
+    """
+    return load_plugin(STORES, 'pytails.stores', name)
+
+
+DynamoDbStore = LazyPlugin(STORES, 'pytails.stores', 'dynamodb')
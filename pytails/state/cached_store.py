@@ -0,0 +1,76 @@
+import threading
+
+from ..helpers.bson_utils import int_to_bson_timestamp
+from .store import StateStore
+
+
+class CachedStore(StateStore):
+    """
+    Write-through cache in front of another store. Checkpoints are written to the store and kept in memory, so the
+    checkpoint of the tail is read from the store at most once.
+    """
+    __missing = object()
+
+    def __init__(self, store: StateStore):
+        """
+        :param store: StateStore. Store checkpoints are written to
+        """
+        self.store = store
+        self._lock = threading.Lock()
+        self._ts = self.__missing
+        self._resume_token = self.__missing
+
+    def __getattr__(self, name):
+        # store specific attributes, e.g. `namespace`
+        if name == 'store':
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def setup_store(self):
+        self.store.setup_store()
+
+    def attach(self, client) -> None:
+        self.store.attach(client)
+
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
+        self.store.save_state(ldt, conn, resume_token=resume_token)
+        with self._lock:
+            self._ts = int_to_bson_timestamp(ldt)
+            if resume_token:
+                self._resume_token = resume_token
+
+    def read_state_by_key(self):
+        with self._lock:
+            if self._ts is self.__missing:
+                self._ts = self.store.read_state_by_key()
+            return self._ts
+
+    def read_resume_token_by_key(self):
+        with self._lock:
+            if self._resume_token is self.__missing:
+                self._resume_token = self.store.read_resume_token_by_key()
+            return self._resume_token
+
+    def read_all_state(self) -> list:
+        return self.store.read_all_state()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._ts = self.__missing
+            self._resume_token = self.__missing
+        self.store.invalidate()
+
+    def acquire_lease(self, owner: str, duration: float) -> bool:
+        return self.store.acquire_lease(owner, duration)
+
+    def release_lease(self, owner: str) -> None:
+        self.store.release_lease(owner)
+
+    def read_lease(self) -> tuple:
+        return self.store.read_lease()
+
+    def fence(self, owner: str = None, on_lost=None) -> None:
+        self.store.fence(owner, on_lost)
+
+    def close(self) -> None:
+        self.store.close()
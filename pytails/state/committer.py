@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .. import metrics
+from ..helpers.bson_utils import bson_timestamp_to_int
+from .store import LeaseLost, StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointCommitter:
+    """
+    Commits checkpoints from a background thread, only up to records every data sink has acknowledged.
+
+    Every record written to the sinks is tracked in read order with the number of sinks that still have to deliver
+    it. The low watermark is the newest record such that it and every record before it have been acknowledged by
+    all sinks. The watermark is committed every `interval` seconds, or sooner once `count` records have been
+    acknowledged since the last commit. A watermark that has not moved since the last commit is not written again.
+    """
+    __store = None
+    __thread = None
+
+    def __init__(self, store: StateStore, conn, interval: float = 5.0, count: int = 500):
+        """
+        :param store: StateStore. Store checkpoints are committed to
+        :param conn: callable. Returns the connection string saved with the checkpoint
+        :param interval: float. Seconds between commits
+        :param count: int. Acknowledged records that trigger an early commit
+        """
+        self.__store = store
+        self.__conn = conn
+        self.interval = interval
+        self.count = count
+        # re-entrant: stop_tail runs from a signal handler that may interrupt `track` on the same thread
+        self.__lock = threading.RLock()
+        self.__commit_lock = threading.RLock()
+        self.__wakeup = threading.Event()
+        self.__stopped = threading.Event()
+        self.__inflight = OrderedDict()
+        self.__seq = 0
+        self.__acked_since_commit = 0
+        self.__watermark = None
+        self.__committed = None
+
+    @property
+    def watermark(self):
+        """
+        Returns `(ts, resume_token)` of the newest record delivered by every sink, or None.
+        """
+        return self.__watermark
+
+    @property
+    def committed(self):
+        """
+        Returns `(ts, resume_token)` of the last committed checkpoint, or None.
+        """
+        return self.__committed
+
+    @property
+    def pending(self) -> int:
+        """
+        Returns the number of records written but not yet acknowledged by every sink.
+        """
+        return len(self.__inflight)
+
+    def track(self, ts, sinks: int, resume_token: dict = None):
+        """
+        Starts tracking a record that is about to be written to `sinks` data sinks.
+
+        :param ts: Timestamp. oplog or cluster time of the record
+        :param sinks: int. Number of sinks that will acknowledge the record
+        :param resume_token: dict. Change stream resume token. Optional.
+        :return: callable. To be called once by each sink after it delivered the record.
+        """
+        if not self.__thread:
+            self.start()
+        with self.__lock:
+            self.__seq += 1
+            seq = self.__seq
+            self.__inflight[seq] = [sinks, ts, resume_token]
+            if sinks <= 0:
+                self.__advance()
+        return lambda: self.__ack(seq)
+
+    def __ack(self, seq: int):
+        with self.__lock:
+            entry = self.__inflight.get(seq)
+            if entry is None:
+                return
+            entry[0] -= 1
+            if entry[0] <= 0 and seq == next(iter(self.__inflight)):
+                self.__advance()
+
+    def __advance(self):
+        # pop every fully acknowledged record at the head of the queue
+        while self.__inflight:
+            seq, (remaining, ts, resume_token) = next(iter(self.__inflight.items()))
+            if remaining > 0:
+                break
+            self.__inflight.popitem(last=False)
+            self.__watermark = (ts, resume_token)
+            self.__acked_since_commit += 1
+        if self.__acked_since_commit >= self.count:
+            self.__wakeup.set()
+
+    def commit(self) -> bool:
+        """
+        Saves the current watermark to the store unless it was already saved.
+
+        :return: bool. True if a checkpoint was written
+        """
+        with self.__commit_lock:
+            with self.__lock:
+                watermark = self.__watermark
+                self.__acked_since_commit = 0
+            if watermark is None or watermark == self.__committed:
+                return False
+            ts, resume_token = watermark
+            logger.debug(extra=dict(Func='Checkpoint', Op='Commit',
+                                    Attributes={'checkpoint': bson_timestamp_to_int(ts),
+                                                'pending': self.pending}), msg='')
+            start = time.perf_counter()
+            self.__store.save_state(bson_timestamp_to_int(ts), self.__conn(), resume_token=resume_token)
+            metrics.CHECKPOINT_SECONDS.observe(time.perf_counter() - start)
+            metrics.CHECKPOINT_COMMITS.inc()
+            self.__committed = watermark
+            return True
+
+    def start(self) -> None:
+        """
+        Starts the background commit thread.
+
+        :return:
+        """
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, daemon=True, name='CheckpointCommitter')
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background thread and commits the final watermark.
+
+        :return:
+        """
+        self.__stopped.set()
+        self.__wakeup.set()
+        if self.__thread and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        self.__thread = None
+        try:
+            self.commit()
+        except LeaseLost as ex:
+            # another instance tails from its own checkpoint now
+            logger.warning(ex, extra=dict(Func='Checkpoint', Op='Commit'))
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            self.__wakeup.wait(self.interval)
+            self.__wakeup.clear()
+            if self.__stopped.is_set():
+                return
+            try:
+                self.commit()
+            except Exception as ex:
+                logger.exception(ex, extra=dict(Func='Checkpoint', Op='Commit'))
@@ -1,7 +1,9 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import boto3
-from botocore.exceptions import ClientError
+from bson import json_util
 
 import logging
 from ..helpers.bson_utils import int_to_bson_timestamp
@@ -13,6 +15,13 @@ logger = logging.getLogger(__name__)
 class DynamoDbStore(StateStore):
     """
     Enables AWS DynamoDB as a checkpoint state store.
+
+    Importing boto3 and discovering or creating the table run on a background thread, so they overlap with
+    connecting to MongoDB and setting up the sinks. The first read or write waits for it and raises any error it
+    failed with.
+
+    The item of a tail also holds its lease, taken and renewed with conditional writes, see `acquire_lease`. A fenced
+    store only saves checkpoints while the lease is free or held by `lease_owner`, see `StateStore.fence`.
     """
     __store = None
     state_key_cluster = None
@@ -21,10 +30,49 @@ class DynamoDbStore(StateStore):
     _state_partition_key_rs = 'replicaset'
     _store_name = 'pytails_checkpoints'
 
-    def __init__(self, cluster: str, replica_set: str):
-        self.setup_store()
+    def __init__(self, cluster: str, replica_set: str, table=None, scan_segments: int = 1, endpoint_url: str = None,
+                 timeout: float = None):
+        """
+        :param cluster: str. Cluster name
+        :param replica_set: str. Replica set name
+        :param table: DynamoDB Table resource. Optional. Skips table discovery and creation.
+        :param scan_segments: int. Segments scanned in parallel by `read_all_state`. Default: 1
+        :param endpoint_url: str. DynamoDB endpoint, e.g. a local DynamoDB for testing. Optional. Default: AWS
+        :param timeout: float. Seconds a request may take to connect and to read, tried at most twice. Keeps lease
+                        renewals well within the lease. Optional. Default: botocore defaults, 60 seconds with retries
+        """
         self.state_key_cluster = cluster
         self.state_key_replicaset = replica_set
+        self.endpoint_url = endpoint_url
+        self.timeout = timeout
+        self.scan_segments = max(1, scan_segments)
+        self._ready = threading.Event()
+        self._setup_error = None
+        if table is not None:
+            self.__store = table
+            self._ready.set()
+        else:
+            threading.Thread(target=self._setup, name=f'ddb-setup-{replica_set}', daemon=True).start()
+
+    @property
+    def _key(self) -> dict:
+        return {self._state_partition_key_cluster: self.state_key_cluster,
+                self._state_partition_key_rs: self.state_key_replicaset}
+
+    def _setup(self) -> None:
+        try:
+            self.setup_store()
+        except Exception as ex:
+            self._setup_error = ex
+        finally:
+            self._ready.set()
+
+    @property
+    def _table(self):
+        self._ready.wait()
+        if self._setup_error is not None:
+            raise self._setup_error
+        return self.__store
 
     def setup_store(self):
         """
@@ -32,8 +80,17 @@ class DynamoDbStore(StateStore):
 
         :return:
         """
-        ddb = boto3.resource('dynamodb')
-        ddb_client = boto3.client('dynamodb', verify=False)
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        config = None
+        if self.timeout:
+            config = Config(connect_timeout=self.timeout, read_timeout=self.timeout, retries={'max_attempts': 1})
+        # the default session is not safe to create clients from on several threads
+        session = boto3.session.Session()
+        ddb = session.resource('dynamodb', endpoint_url=self.endpoint_url, config=config)
+        ddb_client = session.client('dynamodb', verify=False, endpoint_url=self.endpoint_url, config=config)
         create_table = False
         try:
             ddb_client.describe_table(TableName=self._store_name)
@@ -73,21 +130,41 @@ class DynamoDbStore(StateStore):
                                             )
             self.__store.meta.client.get_waiter('table_exists').wait(TableName=self._store_name)
 
-    def save_state(self, ldt: int, conn: str):
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
         """
         Commits state
 
         :param ldt: int. Last Document Time
         :param conn: str. Connection string of tail client.
+        :param resume_token: dict. Change stream resume token. Optional.
         :return:
         """
-        self.__store.update_item(Key={self._state_partition_key_cluster: self.state_key_cluster,
-                                      self._state_partition_key_rs: self.state_key_replicaset},
-                                 UpdateExpression='SET ldt=:ldt, updated_at=:upd, conn=:conn',
-                                 ExpressionAttributeValues={':ldt': ldt,
-                                                            ':upd': datetime.utcnow().isoformat(),
-                                                            ':conn': conn}
-                                 )
+        update = 'SET ldt=:ldt, updated_at=:upd, conn=:conn'
+        values = {':ldt': ldt,
+                  ':upd': datetime.utcnow().isoformat(),
+                  ':conn': conn}
+        if resume_token:
+            update += ', resume_token=:rt'
+            values[':rt'] = json_util.dumps(resume_token)
+        if not self.lease_owner:
+            self._table.update_item(Key=self._key,
+                                    UpdateExpression=update,
+                                    ExpressionAttributeValues=values
+                                    )
+            return
+        from botocore.exceptions import ClientError
+
+        values[':me'] = self.lease_owner
+        try:
+            self._table.update_item(Key=self._key,
+                                    UpdateExpression=update,
+                                    ConditionExpression='lease_owner = :me OR attribute_not_exists(lease_owner)',
+                                    ExpressionAttributeValues=values
+                                    )
+        except ClientError as ex:
+            if ex.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise ex
+            self._lease_refused()
 
     def read_state_by_key(self):
         """
@@ -95,10 +172,8 @@ class DynamoDbStore(StateStore):
 
         :return:
         """
-        resp = self.__store.get_item(
-            Key={self._state_partition_key_cluster: self.state_key_cluster,
-                 self._state_partition_key_rs: self.state_key_replicaset})
-        if resp and 'Item' in resp:
+        resp = self._table.get_item(Key=self._key, ConsistentRead=True)
+        if resp and 'ldt' in resp.get('Item', {}):
             ldt = int_to_bson_timestamp(int(resp['Item']['ldt']))
             logger.debug(extra=dict(Func='State', Op='Read',
                                     Attributes={'cluster': self.state_key_cluster,
@@ -109,12 +184,90 @@ class DynamoDbStore(StateStore):
         else:
             return None
 
+    def read_resume_token_by_key(self):
+        """
+        Retrieves the change stream resume token for current MongoDB connection.
+
+        :return: dict or None
+        """
+        resp = self._table.get_item(Key=self._key, ConsistentRead=True)
+        if resp and 'Item' in resp and 'resume_token' in resp['Item']:
+            return json_util.loads(resp['Item']['resume_token'])
+        return None
+
+    def acquire_lease(self, owner: str, duration: float) -> bool:
+        """
+        Takes or renews the lease on the checkpoint item of this tail with one conditional update. Expiry is
+        compared with the clock of the calling host.
+
+        :param owner: str. Identifies the instance taking the lease
+        :param duration: float. Seconds until the lease expires unless it is renewed
+        :return: bool. True if `owner` holds the lease
+        """
+        from botocore.exceptions import ClientError
+
+        now = int(time.time() * 1000)
+        try:
+            self._table.update_item(Key=self._key,
+                                    UpdateExpression='SET lease_owner=:owner, lease_expires=:expires',
+                                    ConditionExpression='attribute_not_exists(lease_owner) OR lease_owner = :owner '
+                                                        'OR lease_expires < :now',
+                                    ExpressionAttributeValues={':owner': owner, ':now': now,
+                                                               ':expires': now + int(duration * 1000)})
+        except ClientError as ex:
+            if ex.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def release_lease(self, owner: str) -> None:
+        """
+        Ends the lease if `owner` holds it.
+
+        :param owner: str.
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            self._table.update_item(Key=self._key,
+                                    UpdateExpression='REMOVE lease_owner, lease_expires',
+                                    ConditionExpression='lease_owner = :owner',
+                                    ExpressionAttributeValues={':owner': owner})
+        except ClientError as ex:
+            if ex.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def read_lease(self) -> tuple:
+        """
+        Returns the holder of the lease and its expiry in epoch milliseconds, or `(None, None)`.
+
+        :return: tuple
+        """
+        item = self._table.get_item(Key=self._key, ConsistentRead=True).get('Item', {})
+        expires = item.get('lease_expires')
+        return item.get('lease_owner'), int(expires) if expires is not None else None
+
     def read_all_state(self) -> list:
         """
-        Retrieves the entire state store
+        Retrieves the entire state store. Follows `LastEvaluatedKey` across scan pages, so state past the 1 MB page
+        limit is included. With `scan_segments` above 1 the segments are scanned in parallel.
 
         :return: list.
         """
-        resp = self.__store.scan(ConsistentRead=True)
-        if 'Items' in resp:
-            return resp['Items']
+        if self.scan_segments == 1:
+            return self._scan()
+        with ThreadPoolExecutor(max_workers=self.scan_segments, thread_name_prefix='ddb-scan') as pool:
+            segments = pool.map(self._scan, range(self.scan_segments))
+            return [item for items in segments for item in items]
+
+    def _scan(self, segment: int = None) -> list:
+        kwargs = dict(ConsistentRead=True)
+        if segment is not None:
+            kwargs.update(Segment=segment, TotalSegments=self.scan_segments)
+        items = []
+        while True:
+            resp = self._table.scan(**kwargs)
+            items.extend(resp.get('Items', []))
+            if 'LastEvaluatedKey' not in resp:
+                return items
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
@@ -0,0 +1,151 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+from .. import metrics
+from .store import StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Elects one of several instances running the same tail through a lease kept with its checkpoint.
+
+    Every `heartbeat` seconds a background thread takes or renews the lease with a conditional write, see
+    `StateStore.acquire_lease`. A standby takes over once the lease has expired or was released. The leader steps down
+    as soon as a renewal is refused, or once it could not renew for `lease_seconds - heartbeat` seconds. It thus
+    stops before a standby can take over, as long as the clocks of the hosts differ by less than `heartbeat`. That
+    deadline is kept by a separate watchdog thread, so a renewal blocked on an unreachable store does not delay it.
+
+    While elected, the store is fenced with the owner, see `StateStore.fence`, so checkpoints are only saved while this
+    instance holds the lease. A refused checkpoint counts as losing the lease.
+    """
+
+    def __init__(self, store: StateStore, owner: str = None, lease_seconds: float = 10.0, heartbeat: float = None):
+        """
+        :param store: StateStore. Store that supports leases, e.g. DynamoDbStore or SqliteStore
+        :param owner: str. Identifies this instance. Optional. Default: `hostname:pid`
+        :param lease_seconds: float. Seconds a lease lasts without renewal. Default: 10.0
+        :param heartbeat: float. Seconds between renewals, and between attempts of a standby. Default: a third of
+                          `lease_seconds`
+        """
+        self.store = store
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+        self.heartbeat = heartbeat or lease_seconds / 3
+        self.on_lost = None
+        self._elected = threading.Event()
+        self._lost = threading.Event()
+        self._stopped = threading.Event()
+        self._valid_until = 0
+        self._thread = None
+        self._watchdog = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._elected.is_set()
+
+    @property
+    def lost(self) -> bool:
+        """
+        True once this instance was the leader and had to step down.
+        """
+        return self._lost.is_set()
+
+    def start(self, on_lost=None) -> None:
+        """
+        Starts taking and renewing the lease in the background.
+
+        :param on_lost: callable. Called from the background thread when this instance steps down. Optional.
+        """
+        self.on_lost = on_lost
+        self._thread = threading.Thread(target=self._run, name='LeaderElection', daemon=True)
+        self._thread.start()
+        self._watchdog = threading.Thread(target=self._watch, name='LeaseWatchdog', daemon=True)
+        self._watchdog.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits until this instance is the leader.
+
+        :param timeout: float. Seconds. Optional.
+        :return: bool. True if this instance is the leader
+        """
+        return self._elected.wait(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.renew()
+            self._stopped.wait(self.heartbeat)
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            wait = self.heartbeat
+            if self._elected.is_set():
+                wait = self._valid_until - self.heartbeat - time.monotonic()
+                if wait <= 0:
+                    self._step_down('lease not renewed')
+                    return
+            self._stopped.wait(min(wait, self.heartbeat))
+
+    def renew(self) -> None:
+        """
+        Takes or renews the lease once.
+        """
+        started = time.monotonic()
+        try:
+            acquired = self.store.acquire_lease(self.owner, self.lease_seconds)
+        except Exception as ex:
+            logger.warning(ex, extra=dict(Func='Renew', Op='Lease', Attributes={'owner': self.owner}))
+            acquired = None
+        if acquired:
+            self._valid_until = started + self.lease_seconds
+            if not self._elected.is_set() and not self._stopped.is_set():
+                logger.info(extra=dict(Func='Elected', Op='Lease',
+                                       Attributes={'owner': self.owner, 'lease_seconds': self.lease_seconds}), msg='')
+                metrics.LEADER.set(1)
+                self.store.fence(self.owner, on_lost=self.__on_refused)
+                self._elected.set()
+        elif self._elected.is_set() and (acquired is False or time.monotonic() >= self._valid_until - self.heartbeat):
+            self._step_down('lease taken' if acquired is False else 'lease not renewed')
+
+    def __on_refused(self) -> None:
+        self._step_down('checkpoint refused')
+
+    def _step_down(self, reason: str) -> None:
+        with self._lock:
+            # the renewal, the watchdog and a refused checkpoint may all notice it
+            if not self._elected.is_set():
+                return
+            self._elected.clear()
+        logger.error(extra=dict(Func='StepDown', Op='Lease', Attributes={'owner': self.owner, 'reason': reason}),
+                     msg='')
+        metrics.LEADER.set(0)
+        self._lost.set()
+        self._stopped.set()
+        if self.on_lost:
+            self.on_lost()
+
+    def stop(self) -> None:
+        """
+        Stops renewing and releases the lease if this instance holds it, so a standby takes over right away.
+        """
+        self._stopped.set()
+        for thread in (self._thread, self._watchdog):
+            if thread and thread is not threading.current_thread():
+                # a renewal may still be blocked on the store, until its request times out
+                thread.join(self.lease_seconds)
+        with self._lock:
+            elected = self._elected.is_set()
+            self._elected.clear()
+        if elected:
+            metrics.LEADER.set(0)
+            try:
+                self.store.release_lease(self.owner)
+            except Exception as ex:
+                logger.warning(ex, extra=dict(Func='Release', Op='Lease', Attributes={'owner': self.owner}))
+        self.store.fence(None)
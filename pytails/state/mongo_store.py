@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime
+
+from bson.int64 import Int64
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+
+from ..helpers.bson_utils import int_to_bson_timestamp
+from .store import StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class MongoDbStore(StateStore):
+    """
+    Keeps checkpoints in a collection on the tailed cluster, so they travel with it in backups and restores.
+
+    One document per tail, `{_id: {cluster, replicaset}, ldt, updated_at, conn, resume_token}`. The resume token
+    is stored as a BSON document. By default the store uses the connection of the tail client it is registered
+    with. Writes to the checkpoint collection show up in the oplog, so tail clients skip its namespace.
+    """
+
+    def __init__(self, cluster: str, replica_set: str, client: MongoClient = None, database: str = 'pytails',
+                 collection: str = 'checkpoints', write_concern: WriteConcern = None):
+        """
+        :param cluster: str. Cluster name
+        :param replica_set: str. Replica set name
+        :param client: MongoClient. Optional. Default: the connection of the tail client, see `attach`
+        :param database: str. Default: pytails
+        :param collection: str. Default: checkpoints
+        :param write_concern: WriteConcern. Optional. Default: `w=1`, as a checkpoint only needs to be newer than
+                              the oplog position it resumes from
+        """
+        self.state_key_cluster = cluster
+        self.state_key_replicaset = replica_set
+        self.database = database
+        self.collection = collection
+        self.write_concern = write_concern or WriteConcern(w=1)
+        self.__store = None
+        if client is not None:
+            self.attach(client)
+
+    @property
+    def namespace(self) -> str:
+        return f'{self.database}.{self.collection}'
+
+    @property
+    def _key(self) -> dict:
+        return {'cluster': self.state_key_cluster, 'replicaset': self.state_key_replicaset}
+
+    def attach(self, client: MongoClient) -> None:
+        """
+        Uses `client` unless the store was created with its own.
+
+        :param client: MongoClient.
+        :return:
+        """
+        if self.__store is None:
+            self.__store = client[self.database].get_collection(self.collection, write_concern=self.write_concern)
+            self.setup_store()
+
+    def setup_store(self):
+        # documents are looked up by `_id`, no further indexes are needed
+        pass
+
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
+        """
+        Commits state
+
+        :param ldt: int. Last Document Time
+        :param conn: str. Connection string of tail client.
+        :param resume_token: dict. Change stream resume token. Optional.
+        :return:
+        """
+        update = {'ldt': Int64(ldt), 'updated_at': datetime.utcnow().isoformat(), 'conn': conn}
+        if resume_token:
+            update['resume_token'] = resume_token
+        self.__store.update_one({'_id': self._key}, {'$set': update}, upsert=True)
+
+    def read_state_by_key(self):
+        """
+        Retrieves state for current MongoDB connection.
+
+        :return: Timestamp or None
+        """
+        item = self.__store.find_one({'_id': self._key}, projection={'ldt': 1})
+        if item and 'ldt' in item:
+            logger.debug(extra=dict(Func='State', Op='Read',
+                                    Attributes={'cluster': self.state_key_cluster,
+                                                'replica_set': self.state_key_replicaset,
+                                                'store': self.namespace, 'checkpoint': item['ldt']}), msg='')
+            return int_to_bson_timestamp(int(item['ldt']))
+        return None
+
+    def read_resume_token_by_key(self):
+        """
+        Retrieves the change stream resume token for current MongoDB connection.
+
+        :return: dict or None
+        """
+        item = self.__store.find_one({'_id': self._key}, projection={'resume_token': 1})
+        return item.get('resume_token') if item else None
+
+    def read_all_state(self) -> list:
+        """
+        Retrieves the entire state store
+
+        :return: list.
+        """
+        items = []
+        for item in self.__store.find():
+            key = item.pop('_id')
+            item.update(key)
+            items.append(item)
+        return items
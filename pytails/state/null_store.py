@@ -5,11 +5,14 @@ class NullStore(StateStore):
     def setup_store(self):
         pass
 
-    def save_state(self, ldt: int, conn: str):
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
         pass
 
     def read_state_by_key(self):
         pass
 
+    def read_resume_token_by_key(self):
+        pass
+
     def read_all_state(self) -> list:
         pass
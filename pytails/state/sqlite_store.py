@@ -0,0 +1,187 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from bson import json_util
+
+from ..helpers.bson_utils import int_to_bson_timestamp
+from .store import StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteStore(StateStore):
+    """
+    Keeps checkpoints in a local SQLite database, for deployments that do not need them to survive the host.
+
+    The database runs in WAL mode with `synchronous=NORMAL`, so saving a checkpoint is a local write without an
+    fsync. The WAL is synced to disk at most every `sync_interval` seconds, batching the fsyncs of all checkpoints
+    saved in between. Several tail processes can share one database file, and take turns through the lease, see
+    `acquire_lease`. A fenced store only saves checkpoints while the lease is free or held by `lease_owner`.
+    """
+    _store_name = 'pytails_checkpoints'
+
+    def __init__(self, cluster: str, replica_set: str, path: str = 'pytails_checkpoints.db',
+                 sync_interval: float = 1.0):
+        """
+        :param cluster: str. Cluster name
+        :param replica_set: str. Replica set name
+        :param path: str. Database file. Created if missing.
+        :param sync_interval: float. Seconds between syncs to disk. `0` syncs every checkpoint. Default: 1.0
+        """
+        self.state_key_cluster = cluster
+        self.state_key_replicaset = replica_set
+        self.path = path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._synced = time.monotonic()
+        self._conn = None
+        self.setup_store()
+
+    def setup_store(self):
+        """
+        Opens the database and creates the checkpoint table.
+
+        :return:
+        """
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=' + ('FULL' if not self.sync_interval else 'NORMAL'))
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS {self._store_name} ('
+                           'cluster TEXT NOT NULL, replicaset TEXT NOT NULL, ldt INTEGER, updated_at TEXT, '
+                           'conn TEXT, resume_token TEXT, lease_owner TEXT, lease_expires INTEGER, '
+                           'PRIMARY KEY (cluster, replicaset))')
+        columns = {row[1] for row in self._conn.execute(f'PRAGMA table_info({self._store_name})')}
+        # databases created before leases were supported
+        for column, kind in (('lease_owner', 'TEXT'), ('lease_expires', 'INTEGER')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE {self._store_name} ADD COLUMN {column} {kind}')
+
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
+        """
+        Commits state
+
+        :param ldt: int. Last Document Time
+        :param conn: str. Connection string of tail client.
+        :param resume_token: dict. Change stream resume token. Optional.
+        :return:
+        """
+        sql = (f'INSERT INTO {self._store_name} '
+               '(cluster, replicaset, ldt, updated_at, conn, resume_token) VALUES (?, ?, ?, ?, ?, ?) '
+               'ON CONFLICT (cluster, replicaset) DO UPDATE SET ldt=excluded.ldt, '
+               'updated_at=excluded.updated_at, conn=excluded.conn, '
+               'resume_token=COALESCE(excluded.resume_token, resume_token)')
+        params = (self.state_key_cluster, self.state_key_replicaset, ldt, datetime.utcnow().isoformat(), conn,
+                  json_util.dumps(resume_token) if resume_token else None)
+        owner = self.lease_owner
+        if owner:
+            sql += ' WHERE lease_owner IS NULL OR lease_owner = ?'
+            params += (owner,)
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            if owner and cursor.rowcount != 1:
+                self._lease_refused()
+            if self.sync_interval and time.monotonic() - self._synced >= self.sync_interval:
+                # moves the WAL into the database, syncing both
+                self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+                self._synced = time.monotonic()
+
+    def _read_item(self):
+        with self._lock:
+            return self._conn.execute(f'SELECT ldt, resume_token FROM {self._store_name} '
+                                      'WHERE cluster = ? AND replicaset = ?',
+                                      (self.state_key_cluster, self.state_key_replicaset)).fetchone()
+
+    def read_state_by_key(self):
+        """
+        Retrieves state for current MongoDB connection.
+
+        :return: Timestamp or None
+        """
+        row = self._read_item()
+        if row and row[0] is not None:
+            logger.debug(extra=dict(Func='State', Op='Read',
+                                    Attributes={'cluster': self.state_key_cluster,
+                                                'replica_set': self.state_key_replicaset,
+                                                'store': self.path, 'checkpoint': row[0]}), msg='')
+            return int_to_bson_timestamp(row[0])
+        return None
+
+    def read_resume_token_by_key(self):
+        """
+        Retrieves the change stream resume token for current MongoDB connection.
+
+        :return: dict or None
+        """
+        row = self._read_item()
+        if row and row[1]:
+            return json_util.loads(row[1])
+        return None
+
+    def read_all_state(self) -> list:
+        """
+        Retrieves the entire state store
+
+        :return: list.
+        """
+        with self._lock:
+            cursor = self._conn.execute(f'SELECT cluster, replicaset, ldt, updated_at, conn, resume_token '
+                                        f'FROM {self._store_name}')
+            columns = [c[0] for c in cursor.description]
+            return [{k: v for k, v in zip(columns, row) if v is not None} for row in cursor.fetchall()]
+
+    def acquire_lease(self, owner: str, duration: float) -> bool:
+        """
+        Takes or renews the lease on the checkpoint of this tail with one conditional upsert. Expiry is compared
+        with the clock of the calling host.
+
+        :param owner: str. Identifies the instance taking the lease
+        :param duration: float. Seconds until the lease expires unless it is renewed
+        :return: bool. True if `owner` holds the lease
+        """
+        now = int(time.time() * 1000)
+        with self._lock:
+            cursor = self._conn.execute(f'INSERT INTO {self._store_name} '
+                                        '(cluster, replicaset, lease_owner, lease_expires) VALUES (?, ?, ?, ?) '
+                                        'ON CONFLICT (cluster, replicaset) DO UPDATE SET '
+                                        'lease_owner=excluded.lease_owner, lease_expires=excluded.lease_expires '
+                                        'WHERE lease_owner IS NULL OR lease_owner = excluded.lease_owner '
+                                        'OR lease_expires < ?',
+                                        (self.state_key_cluster, self.state_key_replicaset, owner,
+                                         now + int(duration * 1000), now))
+            return cursor.rowcount == 1
+
+    def release_lease(self, owner: str) -> None:
+        """
+        Ends the lease if `owner` holds it.
+
+        :param owner: str.
+        """
+        with self._lock:
+            self._conn.execute(f'UPDATE {self._store_name} SET lease_owner = NULL, lease_expires = NULL '
+                               'WHERE cluster = ? AND replicaset = ? AND lease_owner = ?',
+                               (self.state_key_cluster, self.state_key_replicaset, owner))
+
+    def read_lease(self) -> tuple:
+        """
+        Returns the holder of the lease and its expiry in epoch milliseconds, or `(None, None)`.
+
+        :return: tuple
+        """
+        with self._lock:
+            row = self._conn.execute(f'SELECT lease_owner, lease_expires FROM {self._store_name} '
+                                     'WHERE cluster = ? AND replicaset = ?',
+                                     (self.state_key_cluster, self.state_key_replicaset)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def close(self) -> None:
+        """
+        Syncs and closes the database.
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+                self._conn.close()
+                self._conn = None
@@ -1,19 +1,98 @@
 import abc
 
 
+class LeaseLost(Exception):
+    """
+    Raised by `save_state` of a fenced store when another instance holds the lease, see `StateStore.fence`.
+    """
+    pass
+
+
 class StateStore(metaclass=abc.ABCMeta):
+    lease_owner = None
+    on_lease_lost = None
+
     @abc.abstractmethod
     def setup_store(self):
         pass
 
     @abc.abstractmethod
-    def save_state(self, ldt: int, conn: str):
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
         pass
 
     @abc.abstractmethod
     def read_state_by_key(self):
         pass
 
+    @abc.abstractmethod
+    def read_resume_token_by_key(self):
+        pass
+
     @abc.abstractmethod
     def read_all_state(self) -> list:
         pass
+
+    def attach(self, client) -> None:
+        """
+        Called with the MongoClient of the tail client once it is connected. Stores that keep checkpoints on the
+        tailed cluster use it.
+        """
+        pass
+
+    def invalidate(self) -> None:
+        """
+        Drops any checkpoint kept in memory, so the next read goes to the backend. Called by a standby that takes over
+        from another instance.
+        """
+        pass
+
+    def acquire_lease(self, owner: str, duration: float) -> bool:
+        """
+        Takes or renews the lease on the checkpoint of this tail for `duration` seconds. Succeeds if the lease is
+        free, has expired or is already held by `owner`. Stores that support leases make this a single conditional
+        write. See `pytails.state.lease.LeaderElection`.
+
+        :param owner: str. Identifies the instance taking the lease
+        :param duration: float. Seconds until the lease expires unless it is renewed
+        :return: bool. True if `owner` holds the lease
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} does not support leases')
+
+    def release_lease(self, owner: str) -> None:
+        """
+        Ends the lease if `owner` holds it, so a standby can take over without waiting for it to expire.
+
+        :param owner: str.
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} does not support leases')
+
+    def read_lease(self) -> tuple:
+        """
+        Returns the holder of the lease and its expiry in epoch milliseconds, or `(None, None)`.
+
+        :return: tuple
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} does not support leases')
+
+    def fence(self, owner: str = None, on_lost=None) -> None:
+        """
+        Makes `save_state` write only while `owner` holds the lease or the lease is free, checked in the same
+        conditional write, so an instance that lost its lease cannot move the checkpoint of the new leader. A refused
+        write calls `on_lost` and raises LeaseLost. Stores that support leases honour the fence.
+
+        :param owner: str. Lease owner the checkpoint is written for. `None` lifts the fence.
+        :param on_lost: callable. Called when a write is refused. Optional.
+        """
+        self.lease_owner = owner
+        self.on_lease_lost = on_lost
+
+    def _lease_refused(self) -> None:
+        if self.on_lease_lost:
+            self.on_lease_lost()
+        raise LeaseLost(f'Checkpoint not saved, {self.lease_owner} no longer holds the lease')
+
+    def close(self) -> None:
+        """
+        Releases any resources held by the store.
+        """
+        pass
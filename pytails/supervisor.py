@@ -0,0 +1,353 @@
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from collections import deque
+
+from pymongo import MongoClient
+
+from . import metrics
+from .helpers.bson_utils import bson_timestamp_to_int
+from .sinks import Record, Sink
+
+logger = logging.getLogger(__name__)
+
+
+def discover_shards(mongo_host: str, mongo_port: int) -> list:
+    """
+    Lists the shards of a sharded cluster from `config.shards` on a mongos.
+
+    :param mongo_host: mongos Hostname or IP Address
+    :param mongo_port: mongos port number
+    :return: list of dict with `replica_set` and `hosts` (comma separated `host:port`)
+    """
+    client = MongoClient(host=mongo_host, port=mongo_port)
+    try:
+        targets = []
+        for shard in client.config.shards.find():
+            replica_set, hosts = shard['host'].split('/', 1)
+            targets.append({'replica_set': replica_set, 'hosts': hosts})
+    finally:
+        client.close()
+    logger.info(extra=dict(Func='Discover', Op='Shards',
+                           Attributes={'host': mongo_host, 'port': mongo_port,
+                                       'shards': [t['replica_set'] for t in targets]}), msg='')
+    return targets
+
+
+def load_replica_sets(path: str) -> list:
+    """
+    Reads the replica sets to tail from a JSON file of the form
+    `[{"replica_set": "rs1", "hosts": ["host1:27017", "host2:27017"]}]`.
+
+    :param path: str. File path
+    :return: list of dict with `replica_set` and `hosts` (comma separated `host:port`)
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        hosts = entry['hosts']
+        if not isinstance(hosts, str):
+            hosts = ','.join(hosts)
+        targets.append({'replica_set': entry['replica_set'], 'hosts': hosts})
+    return targets
+
+
+class MergeQueueSink(Sink):
+    """
+    Hands records from a worker process to the supervisor, which merges all replica sets in cluster time order.
+
+    Records are acknowledged once the supervisor reports over `ack_queue` that every merge sink has delivered them, so
+    a worker's checkpoint never moves past records that were only queued.
+    """
+
+    def __init__(self, identifier: str, merge_queue, source: str, ack_queue=None, generation: int = 0,
+                 close_timeout: float = 10.0):
+        """
+        :param identifier: str. Tail identifier
+        :param merge_queue: multiprocessing.Queue. Records for the supervisor
+        :param source: str. Replica set name
+        :param ack_queue: multiprocessing.Queue. Sequence numbers of the records the supervisor has delivered. Optional.
+        :param generation: int. Worker start count, so acks for a previous worker process are ignored
+        :param close_timeout: float. Seconds `close` waits for the acks of queued records
+        """
+        super().__init__(identifier)
+        self.__queue = merge_queue
+        self.source = source
+        self.generation = generation
+        self.close_timeout = close_timeout
+        self.__ack_queue = ack_queue
+        self.__pending = {}
+        self.__seq = 0
+        self.__acked = threading.Condition()
+        if ack_queue is not None:
+            threading.Thread(target=self.__receive_acks, daemon=True, name='MergeQueueAcks').start()
+
+    def write_record(self, record: Record, ack=None) -> None:
+        """
+        Queues the record for the supervisor. Blocks while the queue is full.
+
+        :param record: Record.
+        :param ack: callable. Optional. Called once the supervisor has delivered the record to every merge sink.
+        :return:
+        """
+        seq = None
+        if ack and self.__ack_queue is not None:
+            with self.__acked:
+                self.__seq += 1
+                seq = self.__seq
+                self.__pending[seq] = ack
+        self.__queue.put((self.source, self.generation, bson_timestamp_to_int(record.ts), seq, record))
+
+    def __receive_acks(self):
+        while True:
+            seq = self.__ack_queue.get()
+            with self.__acked:
+                ack = self.__pending.pop(seq, None)
+                self.__acked.notify_all()
+            if ack:
+                ack()
+
+    def close(self) -> None:
+        """
+        Waits up to `close_timeout` seconds for the acks of queued records, so the final checkpoint covers them.
+        """
+        with self.__acked:
+            self.__acked.wait_for(lambda: not self.__pending, self.close_timeout)
+
+
+class ClusterTimeMerger:
+    """
+    Merges the records of several replica sets into cluster time order.
+
+    A record is written once every replica set has a later record queued, or once it has waited `max_delay` seconds
+    for an idle replica set, which bounds latency at the cost of ordering against that replica set. A record's ack is
+    called once every sink has delivered it.
+    """
+
+    def __init__(self, sources: list, sinks: list, max_delay: float = 1.0):
+        """
+        :param sources: list of str. Replica set names
+        :param sinks: list of Sink. Sinks the merged stream is written to
+        :param max_delay: float. Seconds a record may wait for idle replica sets
+        """
+        self.sinks = sinks
+        self.max_delay = max_delay
+        self.__heads = {source: deque() for source in sources}
+
+    def add(self, source: str, ts: int, record: Record, ack=None) -> None:
+        """
+        Queues a record and writes every record that is now in order.
+
+        :param source: str. Replica set name
+        :param ts: int. Cluster time of the record
+        :param record: Record.
+        :param ack: callable. Optional. Called once every sink has delivered the record.
+        :return:
+        """
+        self.__heads.setdefault(source, deque()).append((time.monotonic(), ts, record, ack))
+        self.emit()
+
+    def emit(self, force: bool = False) -> None:
+        """
+        Writes queued records in cluster time order while it is safe to do so.
+
+        :param force: bool. Writes every queued record regardless of idle replica sets.
+        :return:
+        """
+        while True:
+            ready = [q for q in self.__heads.values() if q]
+            if not ready:
+                return
+            head = min(ready, key=lambda q: q[0][1])
+            arrived, ts, record, ack = head[0]
+            if not force and len(ready) < len(self.__heads) and time.monotonic() - arrived < self.max_delay:
+                return
+            head.popleft()
+            if ack and not self.sinks:
+                ack()
+            elif ack:
+                ack = _delivered_by_all(len(self.sinks), ack)
+            for sink in self.sinks:
+                sink.write_record(record, ack)
+
+
+def _delivered_by_all(sinks: int, ack):
+    """
+    Returns an ack for each of `sinks` sinks that calls `ack` once all of them were called.
+    """
+    remaining = [sinks]
+    lock = threading.Lock()
+
+    def _ack():
+        with lock:
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done:
+            ack()
+    return _ack
+
+
+class TailSupervisor:
+    """
+    Tails several replica sets, each in its own worker process, and restarts workers that exit.
+
+    Every worker checkpoints under its own replica set name. With `build_merge_sinks`, workers hand their records to
+    the supervisor, which writes them to the merge sinks in cluster time order and reports every delivered record back
+    to its worker. The merge sinks are built once the workers are started, so their threads and connections are not
+    inherited by the worker processes.
+    """
+    restart_backoff = 1.0
+    restart_backoff_max = 60.0
+    healthy_after = 60.0
+
+    def __init__(self, args, targets: list, build_client, build_merge_sinks=None, merge_max_delay: float = 1.0):
+        """
+        :param args: argparse.Namespace. Passed to `build_client` in every worker
+        :param targets: list of dict with `replica_set` and `hosts`
+        :param build_client: callable. `build_client(args, hosts, None, replica_set, sinks=...)` returning a TailClient
+        :param build_merge_sinks: callable. Returns the list of Sink the merged stream is written to. Optional. Enables
+                                  merging by cluster time.
+        :param merge_max_delay: float. Seconds a record may wait for idle replica sets when merging
+        """
+        self.args = args
+        self.targets = targets
+        self.build_client = build_client
+        self.build_merge_sinks = build_merge_sinks
+        self.merge_sinks = None
+        self.merge_max_delay = merge_max_delay
+        self.__workers = {}
+        self.__stopping = threading.Event()
+        self.__merge_queue = multiprocessing.Queue(maxsize=10000) if build_merge_sinks is not None else None
+
+    def run(self) -> None:
+        """
+        Starts a worker per replica set and supervises them until SIGINT or SIGTERM.
+
+        :return:
+        """
+        signal.signal(signal.SIGINT, self.__stop_handler)
+        signal.signal(signal.SIGTERM, self.__stop_handler)
+
+        for target in self.targets:
+            self.__workers[target['replica_set']] = {'target': target, 'process': None, 'failures': 0,
+                                                     'started': 0, 'restart_at': 0, 'generation': 0,
+                                                     'acks': None}
+            self.__start(target['replica_set'])
+
+        merger = None
+        if self.__merge_queue is not None:
+            self.merge_sinks = self.build_merge_sinks()
+            merger = threading.Thread(target=self.__merge, daemon=True, name='ClusterTimeMerger')
+            merger.start()
+
+        while not self.__stopping.wait(1):
+            self.__check_workers()
+
+        for worker in self.__workers.values():
+            if worker['process'] and worker['process'].is_alive():
+                # SIGTERM lets the worker flush its sinks and checkpoint
+                worker['process'].terminate()
+        for worker in self.__workers.values():
+            if worker['process']:
+                worker['process'].join(30)
+                if worker['process'].is_alive():
+                    worker['process'].kill()
+        if merger:
+            merger.join()
+            for sink in self.merge_sinks:
+                sink.close()
+
+    def stop(self) -> None:
+        """
+        Stops all workers gracefully.
+
+        :return:
+        """
+        self.__stopping.set()
+
+    def __stop_handler(self, signum, frame):
+        self.stop()
+
+    def __start(self, replica_set: str):
+        worker = self.__workers[replica_set]
+        metrics_port = getattr(self.args, 'metrics_port', 0)
+        if metrics_port:
+            metrics_port += list(self.__workers).index(replica_set)
+        worker['generation'] += 1
+        worker['acks'] = multiprocessing.Queue() if self.__merge_queue is not None else None
+        process = multiprocessing.Process(target=_run_worker, name=f'pytails-{replica_set}',
+                                          args=(self.build_client, self.args, worker['target'],
+                                                self.__merge_queue, metrics_port, worker['acks'],
+                                                worker['generation']))
+        process.start()
+        worker['process'] = process
+        worker['started'] = time.monotonic()
+        logger.info(extra=dict(Func='Start', Op='Worker',
+                               Attributes={'replica_set': replica_set, 'hosts': worker['target']['hosts'],
+                                           'pid': process.pid}), msg='')
+
+    def __check_workers(self):
+        now = time.monotonic()
+        for replica_set, worker in self.__workers.items():
+            process = worker['process']
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                if now - worker['started'] >= self.healthy_after:
+                    worker['failures'] = 0
+                delay = min(self.restart_backoff * (2 ** worker['failures']), self.restart_backoff_max)
+                worker['failures'] += 1
+                worker['restart_at'] = now + delay
+                worker['process'] = None
+                logger.warning(extra=dict(Func='Exit', Op='Worker',
+                                          Attributes={'replica_set': replica_set, 'exitcode': process.exitcode,
+                                                      'restart_in': delay}), msg='')
+            if now >= worker['restart_at']:
+                self.__start(replica_set)
+
+    def __merge(self):
+        merger = ClusterTimeMerger(list(self.__workers), self.merge_sinks, self.merge_max_delay)
+        while not self.__stopping.is_set() or any(w['process'] and w['process'].is_alive()
+                                                   for w in self.__workers.values()):
+            try:
+                self.__add(merger, self.__merge_queue.get(timeout=0.1))
+            except queue.Empty:
+                merger.emit()
+        while True:
+            try:
+                self.__add(merger, self.__merge_queue.get_nowait())
+            except queue.Empty:
+                break
+        merger.emit(force=True)
+
+    def __add(self, merger: ClusterTimeMerger, item: tuple) -> None:
+        source, generation, ts, seq, record = item
+        merger.add(source, ts, record, self.__ack(source, generation, seq) if seq is not None else None)
+
+    def __ack(self, source: str, generation: int, seq: int):
+        worker = self.__workers[source]
+        acks = worker['acks']
+
+        def _ack():
+            # a restarted worker re-reads from its checkpoint and numbers its records anew
+            if worker['generation'] == generation:
+                acks.put(seq)
+        return _ack
+
+
+def _run_worker(build_client, args, target: dict, merge_queue, metrics_port: int = 0, ack_queue=None,
+                generation: int = 0) -> None:
+    sinks = None
+    if merge_queue is not None:
+        sinks = [MergeQueueSink(f"{args.tail_id}:{target['replica_set']}", merge_queue, target['replica_set'],
+                                ack_queue=ack_queue, generation=generation)]
+    client = build_client(args, target['hosts'], None, target['replica_set'], sinks=sinks)
+    if metrics_port:
+        metrics.instrument_client(client)
+        metrics.start_metrics_server(metrics_port)
+    client.tail()
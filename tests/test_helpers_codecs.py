@@ -0,0 +1,26 @@
+import datetime
+import sys
+import unittest
+from unittest import mock
+
+from bson import Decimal128, Int64, ObjectId, SON, Timestamp
+
+from ..pytails.helpers.codecs import FastJsonCodec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class TestFastJsonCodec(unittest.TestCase):
+    @unittest.skipUnless(orjson, 'orjson is not installed')
+    def test_encoders_agree(self):
+        with mock.patch.dict(sys.modules, {'orjson': None}):
+            fallback = FastJsonCodec()
+        doc = {'_id': ObjectId('5f1d7a3e9b1e8a3c4d5e6f70'), 'ts': Timestamp(1700000000, 3),
+               'at': datetime.datetime(2020, 1, 2, 3, 4, 5, 678000),
+               'utc': datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+               'price': Decimal128('12.50'), 'n': Int64(5), 'nested': SON([('a', [1, 'x', None])])}
+        self.assertEqual(FastJsonCodec().encode(doc), fallback.encode(doc))
+        self.assertEqual(FastJsonCodec().decode(FastJsonCodec().encode(doc))['at'], doc['at'])
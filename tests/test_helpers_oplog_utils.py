@@ -0,0 +1,45 @@
+import unittest
+
+from bson import Timestamp
+from bson.regex import Regex
+
+from ..pytails.helpers.oplog_utils import oplog_doc_key, build_oplog_query, build_oplog_projection, \
+    namespace_matches
+
+
+class TestOplogUtils(unittest.TestCase):
+    ts = Timestamp(1575198733, 1)
+
+    def test_oplog_doc_key_update(self):
+        doc = {'op': 'u', 'ns': 'db.coll', 'o': {'$set': {'a': 1}}, 'o2': {'_id': 5}}
+        self.assertEqual(oplog_doc_key(doc), ('db.coll', 5))
+
+    def test_oplog_doc_key_noop(self):
+        self.assertIsNone(oplog_doc_key({'op': 'n', 'ns': '', 'o': {'msg': 'periodic noop'}}))
+
+    def test_build_oplog_query_ts_only(self):
+        self.assertEqual(build_oplog_query(self.ts), {'ts': {'$gte': self.ts}})
+
+    def test_build_oplog_query_filters(self):
+        actual = build_oplog_query(self.ts, include_ns=['db.a'], include_ns_regex=['^tenant_'],
+                                   exclude_ns_regex=['\\.tmp$'], ops=['i', 'u', 'd'])
+        expected = {'ts': {'$gte': self.ts},
+                    'op': {'$in': ['i', 'u', 'd']},
+                    '$and': [{'$or': [{'ns': {'$in': ['db.a']}}, {'ns': {'$regex': '^tenant_'}}]},
+                             {'ns': {'$not': Regex('\\.tmp$')}}]}
+        self.assertEqual(actual, expected)
+
+    def test_build_oplog_projection_adds_required_fields(self):
+        self.assertEqual(build_oplog_projection(['o']),
+                         {'o': 1, 'ts': 1, 'op': 1, 'ns': 1, 'o2._id': 1})
+
+    def test_build_oplog_projection_none(self):
+        self.assertIsNone(build_oplog_projection([]))
+
+    def test_namespace_matches(self):
+        self.assertTrue(namespace_matches('db.orders'))
+        self.assertTrue(namespace_matches('db.orders', include_ns=['db.orders'], ops=['i']))
+        self.assertTrue(namespace_matches('db.orders', include_ns=['db.users'], include_ns_regex=[r'^db\.ord']))
+        self.assertFalse(namespace_matches('db.users', include_ns=['db.orders']))
+        self.assertFalse(namespace_matches('db.tmp_1', exclude_ns_regex=[r'\.tmp_']))
+        self.assertFalse(namespace_matches('db.orders', exclude_ns=['db.orders']))
@@ -0,0 +1,42 @@
+import unittest
+from urllib.request import urlopen
+
+from ..pytails.metrics import Counter, Gauge, Histogram, Registry, start_metrics_server
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        written = registry.register(Counter('written_total', 'Records written', ('sink',)))
+        depth = registry.register(Gauge('depth', 'Queue depth', callback=lambda: 3))
+        latency = registry.register(Histogram('latency_seconds', 'Latency', ('sink',), buckets=(0.1, 1)))
+        written.inc('KinesisSink')
+        written.inc('KinesisSink', amount=2)
+        latency.observe(0.05, 'KinesisSink')
+        latency.observe(0.5, 'KinesisSink')
+        latency.observe(2, 'KinesisSink')
+        lines = registry.render().splitlines()
+
+        self.assertIn('# TYPE written_total counter', lines)
+        self.assertIn('written_total{sink="KinesisSink"} 3', lines)
+        self.assertIn('depth 3', lines)
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{sink="KinesisSink",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{sink="KinesisSink",le="1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{sink="KinesisSink",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_sum{sink="KinesisSink"} 2.55', lines)
+        self.assertIn('latency_seconds_count{sink="KinesisSink"} 3', lines)
+
+    def test_gauge_callback_none_is_skipped(self):
+        gauge = Gauge('lag', 'Lag', callback=lambda: None)
+        self.assertEqual(gauge.samples(), [])
+
+    def test_server(self):
+        registry = Registry()
+        registry.register(Counter('read_total', 'Read')).inc()
+        server = start_metrics_server(0, '127.0.0.1', registry)
+        try:
+            body = urlopen(f'http://127.0.0.1:{server.server_port}/metrics').read().decode('utf-8')
+        finally:
+            server.shutdown()
+        self.assertIn('read_total 1', body)
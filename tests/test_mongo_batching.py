@@ -0,0 +1,32 @@
+import unittest
+
+from ..pytails.helpers.backoff import Backoff
+from ..pytails.mongo.batching import AdaptiveBatching
+
+
+class TestAdaptiveBatching(unittest.TestCase):
+    def test_modes_with_hysteresis(self):
+        batching = AdaptiveBatching(catch_up_lag=60, steady_lag=5, catch_up_batch_size=5000, steady_batch_size=100,
+                                    check_interval=10)
+        self.assertTrue(batching.due())
+        self.assertEqual(batching.mode, AdaptiveBatching.CATCH_UP)
+        self.assertFalse(batching.update(30))
+        self.assertTrue(batching.update(2))
+        self.assertFalse(batching.due())
+        self.assertEqual((batching.batch_size, batching.max_await_time_ms), (100, 100))
+        self.assertFalse(batching.update(30))
+        self.assertFalse(batching.update(None))
+        self.assertEqual(batching.mode, AdaptiveBatching.STEADY)
+        self.assertTrue(batching.update(120))
+        self.assertEqual((batching.batch_size, batching.max_await_time_ms), (5000, 1000))
+
+
+class TestBackoff(unittest.TestCase):
+    def test_bounded_and_reset(self):
+        backoff = Backoff(initial=0.1, maximum=1.0)
+        delays = [backoff.next() for _ in range(10)]
+        self.assertTrue(all(0 <= d <= 1.0 for d in delays))
+        self.assertTrue(all(d <= 0.1 * 2 ** i for i, d in enumerate(delays)))
+        self.assertEqual(backoff.attempt, 10)
+        backoff.reset()
+        self.assertLessEqual(backoff.next(), 0.1)
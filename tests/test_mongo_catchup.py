@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from bson import Timestamp
+
+from ..pytails.helpers.oplog_utils import build_oplog_query
+from ..pytails.mongo.catchup import ParallelOplogReader, time_slices
+from ..pytails.mongo.oplog_client import OplogClient
+from ..pytails.sinks import Sink
+from ..pytails.state.null_store import NullStore
+
+
+class _Cursor(list):
+    def close(self):
+        pass
+
+
+class _Oplog:
+    def __init__(self, entries):
+        self.entries = entries
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def find(self, query, projection=None, oplog_replay=False, batch_size=None):
+        with self.lock:
+            self.queries.append(query)
+        # later slices answer first
+        time.sleep(0.01 * (1000 - query['ts']['$gte'].time) / 100)
+        return _Cursor(e for e in self.entries
+                       if query['ts']['$gte'] <= e['ts'] < query['ts']['$lt'] and
+                       ('op' not in query or e['op'] in query['op']['$in']))
+
+
+class _Sink(Sink):
+    def __init__(self):
+        super().__init__('test')
+        self.written = []
+
+    def write_record(self, record, ack=None) -> None:
+        self.written.append(record.ts)
+        if ack:
+            ack()
+
+
+class _Client(OplogClient):
+    def __init__(self, entries, head, *args, **kwargs):
+        self.options = dict(timestamp_suffix=False, full_doc=False, raw_bson=False)
+        self.oplog = _Oplog(entries)
+        self.head = head
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        self._client = SimpleNamespace(address=('fake', 27017))
+
+    def _oplog(self):
+        return self.oplog
+
+    def get_last_write_ts(self) -> Timestamp:
+        return self.head
+
+
+class TestParallelOplogReader(unittest.TestCase):
+    def test_time_slices(self):
+        slices = time_slices(Timestamp(100, 5), Timestamp(250, 1), 60)
+        self.assertEqual(slices[0], (Timestamp(100, 5), Timestamp(160, 5)))
+        self.assertEqual(slices[-1], (Timestamp(220, 5), Timestamp(250, 2)))
+        self.assertEqual(len(slices), 3)
+        self.assertEqual(time_slices(Timestamp(100, 2), Timestamp(100, 1), 60), [])
+
+    def test_yields_in_oplog_order(self):
+        entries = [{'ts': Timestamp(t, i), 'op': 'n' if t % 7 == 0 else 'i', 'o': {'_id': t}}
+                   for t in range(100, 1000) for i in (1, 2)]
+        oplog = _Oplog(entries)
+        reader = ParallelOplogReader(oplog, Timestamp(100, 2), Timestamp(900, 1), oplog_filter={'ops': ['i']},
+                                     workers=4, slice_seconds=50, batch_size=7, prefetch=2)
+        read = [e['ts'] for e in reader]
+        expected = [e['ts'] for e in entries if Timestamp(100, 2) <= e['ts'] <= Timestamp(900, 1) and e['op'] == 'i']
+        self.assertEqual(read, expected)
+        self.assertEqual(len(oplog.queries), 16)
+
+    def test_stop(self):
+        entries = [{'ts': Timestamp(t, 1), 'op': 'i', 'o': {'_id': t}} for t in range(100, 1000)]
+        reader = ParallelOplogReader(_Oplog(entries), Timestamp(100, 1), Timestamp(999, 1), workers=2,
+                                     slice_seconds=10, batch_size=5, prefetch=1)
+        read = []
+        for entry in reader:
+            read.append(entry)
+            if len(read) == 30:
+                reader.stop()
+        self.assertLess(len(read), 100)
+
+
+class TestCatchUp(unittest.TestCase):
+    def test_tail_resumes_after_head(self):
+        entries = [{'ts': Timestamp(t, 1), 'op': 'i', 'ns': 'db.c', 'o': {'_id': t}} for t in range(100, 200)]
+        head = Timestamp(150, 1)
+        client = _Client(entries, head, 'fake', 27017, 'cluster', 'rs0', start_ts=Timestamp(100, 1),
+                         checkpoint_store=NullStore())
+        sink = _Sink()
+        client.register_data_sink(sink)
+        client.set_parallel_catch_up(workers=2, slice_seconds=10, min_lag=0)
+        self.assertEqual(client.catch_up(), 51)
+        self.assertEqual(sink.written, [e['ts'] for e in entries[:51]])
+        # the tailable cursor starts after the head entry
+        query = build_oplog_query(client.ts)
+        tailed = [e['ts'] for e in entries if e['ts'] >= query['ts']['$gte']]
+        self.assertEqual(tailed[0], Timestamp(151, 1))
+        client._committer.stop()
@@ -0,0 +1,122 @@
+import unittest
+
+from bson import Timestamp
+from pymongo.errors import AutoReconnect
+
+from ..pytails.mongo.cdc_client import ChangeStreamClient
+from ..pytails.sinks import Sink
+from ..pytails.state.null_store import NullStore
+
+
+def _change(n: int, op: str = 'insert') -> dict:
+    change = {'_id': {'_data': f'token-{n}'}, 'operationType': op, 'clusterTime': Timestamp(n, 1)}
+    if op != 'invalidate':
+        change.update(ns={'db': 'db', 'coll': 'c'}, documentKey={'_id': n}, fullDocument={'_id': n})
+    return change
+
+
+class _Stream:
+    def __init__(self, events: list):
+        self.events = events
+        self.alive = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def try_next(self):
+        event = self.events.pop(0)
+        if isinstance(event, Exception):
+            raise event
+        if event is not None and event['operationType'] == 'invalidate':
+            self.alive = False
+        return event
+
+    def close(self):
+        self.alive = False
+
+
+class _Client:
+    address = ('fake', 27017)
+
+    def __init__(self, version: str, streams: list):
+        self.version = version
+        self.streams = streams
+        self.watches = []
+
+    def server_info(self) -> dict:
+        return {'version': self.version}
+
+    def get_database(self, name):
+        return self
+
+    def watch(self, **kwargs):
+        self.watches.append(kwargs)
+        return _Stream(self.streams.pop(0))
+
+
+class _Store(NullStore):
+    def __init__(self, resume_token: dict = None):
+        self.resume_token = resume_token
+
+    def read_resume_token_by_key(self):
+        return self.resume_token
+
+
+class _Sink(Sink):
+    def __init__(self):
+        super().__init__('test')
+        self.records = []
+
+    def write_record(self, record, ack=None) -> None:
+        self.records.append(record.doc['doc']['operationType'])
+        if ack:
+            ack()
+
+
+class _ChangeStreamClient(ChangeStreamClient):
+    def __init__(self, client, *args, **kwargs):
+        self.fake = client
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        self._client = self.fake
+
+    def check_sinks(self) -> None:
+        # an empty batch ends the test
+        self.stop_tail()
+
+
+class TestChangeStreamClient(unittest.TestCase):
+    def _tail(self, version: str, streams: list, resume_token: dict = None) -> tuple:
+        client = _Client(version, streams)
+        cdc = _ChangeStreamClient(client, 'fake', 27017, 'cluster', 'rs0', database='db',
+                                  checkpoint_store=_Store(resume_token))
+        sink = _Sink()
+        cdc.register_data_sink(sink)
+        cdc.tail()
+        return client, cdc, sink
+
+    def test_resumes_after_last_event(self):
+        streams = [[_change(1), _change(2), AutoReconnect('primary stepped down')], [_change(3), None]]
+        client, cdc, sink = self._tail('4.0.12', streams, resume_token={'_data': 'token-0'})
+        self.assertEqual([w.get('resume_after') for w in client.watches],
+                         [{'_data': 'token-0'}, {'_data': 'token-2'}])
+        self.assertEqual(sink.records, ['insert'] * 3)
+        self.assertEqual(cdc.resume_token, {'_data': 'token-3'})
+
+    def test_invalidate_stops_before_4_2(self):
+        streams = [[_change(1), _change(2, 'drop'), _change(3, 'invalidate')]]
+        client, cdc, sink = self._tail('4.0.12', streams)
+        self.assertEqual(len(client.watches), 1)
+        self.assertEqual(sink.records, ['insert', 'drop'])
+        self.assertEqual(cdc.resume_token, {'_data': 'token-2'})
+
+    def test_invalidate_starts_after_on_4_2(self):
+        streams = [[_change(1), _change(2, 'invalidate')], [_change(3), None]]
+        client, cdc, sink = self._tail('4.2.1', streams)
+        self.assertEqual(client.watches[1]['start_after'], {'_data': 'token-2'})
+        self.assertNotIn('resume_after', client.watches[1])
+        self.assertEqual(sink.records, ['insert', 'invalidate', 'insert'])
@@ -0,0 +1,139 @@
+import unittest
+from types import SimpleNamespace
+
+from bson import Timestamp
+
+from ..pytails.mongo.compaction import CompactionWindow
+from ..pytails.mongo.oplog_client import OplogClient
+from ..pytails.sinks import Sink
+from ..pytails.state.null_store import NullStore
+
+
+def _entry(t: int, op: str, _id, ns: str = 'db.c') -> dict:
+    if op == 'u':
+        return {'ts': Timestamp(t, 1), 'op': op, 'ns': ns, 'o': {'$set': {'n': t}}, 'o2': {'_id': _id}}
+    return {'ts': Timestamp(t, 1), 'op': op, 'ns': ns, 'o': {'_id': _id}}
+
+
+class _Collection:
+    def __init__(self, client):
+        self.client = client
+
+    def find(self, query, session=None):
+        self.client.lookups.extend(query['_id']['$in'])
+        return [{'_id': _id, 'n': 1} for _id in query['_id']['$in']]
+
+
+class _Client:
+    address = ('fake', 27017)
+
+    def __init__(self):
+        self.lookups = []
+
+    def get_database(self, name):
+        return self
+
+    def get_collection(self, name, read_preference=None):
+        return _Collection(self)
+
+    def start_session(self):
+        return self
+
+    def __enter__(self):
+        return SimpleNamespace(operation_time=None)
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Sink(Sink):
+    def __init__(self):
+        super().__init__('test')
+        self.records = []
+        self.acks = []
+
+    def write_record(self, record, ack=None) -> None:
+        self.records.append(record)
+        self.acks.append(ack)
+
+
+class _Client_(OplogClient):
+    def __init__(self, *args, **kwargs):
+        self.options = dict(timestamp_suffix=False, full_doc=False, raw_bson=False)
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        self._client = _Client()
+
+
+class TestCompactionWindow(unittest.TestCase):
+    def test_latest_change_wins(self):
+        window = CompactionWindow(window=60, max_keys=3)
+        self.assertEqual(window.add(_entry(1, 'i', 1)), ([], None))
+        window.add(_entry(2, 'u', 2))
+        window.add(_entry(3, 'u', 1))
+        window.add(_entry(4, 'd', 2))
+        self.assertEqual(len(window), 2)
+        docs, end_ts = window.add(_entry(5, 'i', 3))
+        self.assertEqual([(d['ts'].time, d['op']) for d in docs], [(3, 'u'), (4, 'd'), (5, 'i')])
+        self.assertEqual(end_ts, Timestamp(5, 1))
+        self.assertEqual(window.flush(), ([], None))
+
+    def test_embedded_document_id(self):
+        window = CompactionWindow(window=60)
+        window.add(_entry(1, 'u', {'a': 1, 'b': 2}))
+        window.add(_entry(2, 'u', {'a': 1, 'b': 3}))
+        window.add(_entry(3, 'd', {'a': 1, 'b': 2}))
+        docs, _ = window.flush()
+        self.assertEqual([(d['ts'].time, d['op']) for d in docs], [(2, 'u'), (3, 'd')])
+
+    def test_insert_then_update_or_delete(self):
+        window = CompactionWindow(window=60)
+        window.add(_entry(1, 'i', 1))
+        window.add(_entry(2, 'u', 1))
+        window.add(_entry(3, 'i', 2))
+        window.add(_entry(4, 'd', 2))
+        # a document deleted before and inserted again is still deleted in the end
+        window.add(_entry(5, 'd', 3))
+        window.add(_entry(6, 'i', 3))
+        window.add(_entry(7, 'd', 3))
+        docs, end_ts = window.flush()
+        # the update carries the full document an insert would have, and the document inserted and deleted within
+        # the window is not written at all
+        self.assertEqual([(d['ts'].time, d['op']) for d in docs], [(2, 'u'), (7, 'd')])
+        self.assertEqual(end_ts, Timestamp(7, 1))
+
+    def test_dropped_entries_do_not_reopen_the_window(self):
+        window = CompactionWindow(window=60)
+        window.add(_entry(1, 'i', 1))
+        window.add(_entry(2, 'd', 1))
+        self.assertEqual(len(window), 0)
+        window._opened -= 60
+        self.assertEqual(window.add(_entry(3, 'i', 2)), ([_entry(3, 'i', 2)], Timestamp(3, 1)))
+
+    def test_checkpoint_covers_flushed_windows(self):
+        client = _Client_('fake', 27017, 'cluster', 'rs0', start_ts=Timestamp(1, 1), checkpoint_store=NullStore())
+        sink = _Sink()
+        client.register_data_sink(sink)
+        client.set_full_doc()
+        client.set_compaction(window=60)
+        for t in range(2, 12):
+            client.process_doc(_entry(t, 'u', t % 2))
+        self.assertEqual(sink.records, [])
+        client.flush_full_docs()
+        self.assertEqual(client._client.lookups, [0, 1])
+        self.assertEqual([r.ts for r in sink.records], [Timestamp(10, 1), Timestamp(11, 1)])
+
+        sink.acks[0]()
+        self.assertEqual(client._committer.watermark[0], Timestamp(10, 1))
+        sink.acks[1]()
+        self.assertEqual(client._committer.watermark[0], Timestamp(11, 1))
+        # entries in an open window hold the checkpoint back
+        client.process_doc(_entry(12, 'd', 0))
+        self.assertEqual(client._committer.watermark[0], Timestamp(11, 1))
+        client._committer.stop()
+
+    def test_requires_full_doc(self):
+        client = _Client_('fake', 27017, 'cluster', 'rs0', start_ts=Timestamp(1, 1), checkpoint_store=NullStore())
+        with self.assertRaises(ValueError):
+            client.set_compaction()
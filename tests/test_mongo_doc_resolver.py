@@ -0,0 +1,95 @@
+import unittest
+from types import SimpleNamespace
+
+from bson import Timestamp
+
+from ..pytails.mongo.doc_resolver import FullDocumentResolver
+
+
+def _entry(t: int, op: str, _id, ns: str = 'db.c') -> dict:
+    if op == 'u':
+        return {'ts': Timestamp(t, 1), 'op': op, 'ns': ns, 'o': {'$set': {'n': t}}, 'o2': {'_id': _id}}
+    return {'ts': Timestamp(t, 1), 'op': op, 'ns': ns, 'o': {'_id': _id}}
+
+
+class _Client:
+    def __init__(self, docs: dict, operation_time=None):
+        self.docs = docs
+        self.queries = []
+        # cluster time reported for reads, None like a standalone server
+        self.operation_time = operation_time
+
+    def get_database(self, name):
+        return self
+
+    def get_collection(self, name, read_preference=None):
+        return self
+
+    def start_session(self):
+        return self
+
+    def __enter__(self):
+        return SimpleNamespace(operation_time=self.operation_time)
+
+    def __exit__(self, *exc):
+        return False
+
+    def find(self, query, session=None):
+        ids = query['_id']['$in']
+        self.queries.append(ids)
+        return [dict(self.docs[repr(_id)]) for _id in ids if repr(_id) in self.docs]
+
+
+class TestFullDocumentResolver(unittest.TestCase):
+    def test_batches_lookups(self):
+        client = _Client({repr(n): {'_id': n, 'v': n} for n in range(5)})
+        resolver = FullDocumentResolver(client, batch_size=4, max_wait=60)
+        self.assertEqual(resolver.add(_entry(1, 'i', 0)), [])
+        self.assertEqual(resolver.add(_entry(2, 'u', 1)), [])
+        self.assertEqual(resolver.add(_entry(3, 'u', 0)), [])
+        resolved = resolver.add(_entry(4, 'd', 2))
+        # one query for the batch, deletes are not fetched and repeated documents are fetched once
+        self.assertEqual(client.queries, [[0, 1]])
+        self.assertEqual([(doc['ts'].time, key, full) for doc, key, full in resolved],
+                         [(1, ('db.c', 0), {'_id': 0, 'v': 0}), (2, ('db.c', 1), {'_id': 1, 'v': 1}),
+                          (3, ('db.c', 0), {'_id': 0, 'v': 0}), (4, ('db.c', 2), None)])
+
+    def test_cache_is_invalidated_by_later_changes(self):
+        client = _Client({repr(1): {'_id': 1, 'v': 1}})
+        resolver = FullDocumentResolver(client, batch_size=1)
+        resolver.add(_entry(1, 'u', 1))
+        self.assertEqual(len(client.queries), 1)
+        # an older entry is served from the cache
+        resolver.add({'ts': Timestamp(1, 1), 'op': 'u', 'ns': 'db.c', 'o': {}, 'o2': {'_id': 1}})
+        self.assertEqual(len(client.queries), 1)
+        resolver.add(_entry(2, 'u', 1))
+        self.assertEqual(len(client.queries), 2)
+
+    def test_cache_serves_entries_up_to_the_read_time(self):
+        client = _Client({repr(1): {'_id': 1, 'v': 1}, repr(2): {'_id': 2, 'v': 2}}, operation_time=Timestamp(5, 1))
+        resolver = FullDocumentResolver(client, batch_size=1)
+        resolver.add(_entry(1, 'u', 1))
+        self.assertEqual(client.queries, [[1]])
+        # the document was read at 5:1, so it is current for later entries up to then
+        resolved = resolver.add(_entry(3, 'u', 1))
+        self.assertEqual(client.queries, [[1]])
+        self.assertEqual(resolved[0][2], {'_id': 1, 'v': 1})
+        resolver.add(_entry(5, 'u', 1))
+        self.assertEqual(client.queries, [[1]])
+        resolver.add(_entry(6, 'u', 1))
+        self.assertEqual(client.queries, [[1], [1]])
+        # deletes are only known as of their own entry
+        client.operation_time = Timestamp(9, 1)
+        resolver.add(_entry(7, 'd', 2))
+        resolver.add(_entry(8, 'i', 2))
+        self.assertEqual(client.queries, [[1], [1], [2]])
+
+    def test_embedded_document_id(self):
+        _id = {'a': 1, 'b': 'x'}
+        client = _Client({repr(_id): {'_id': _id, 'v': 1}})
+        resolver = FullDocumentResolver(client, batch_size=2)
+        resolver.add(_entry(1, 'u', _id))
+        resolved = resolver.add(_entry(2, 'u', dict(_id)))
+        self.assertEqual(client.queries, [[_id]])
+        self.assertEqual([full for _, _, full in resolved], [{'_id': _id, 'v': 1}] * 2)
+        self.assertEqual(resolved[0][1], ('db.c', _id))
@@ -0,0 +1,83 @@
+import unittest
+
+from bson import BSON, Timestamp
+from bson.raw_bson import RawBSONDocument
+
+from ..pytails.helpers.oplog_utils import hashable_doc_key
+from ..pytails.mongo.oplog_client import OplogClient
+from ..pytails.sinks import Sink
+from ..pytails.state.null_store import NullStore
+
+
+def _raw(entry: dict) -> RawBSONDocument:
+    return RawBSONDocument(BSON.encode(entry))
+
+
+class _Client:
+    address = ('fake', 27017)
+
+
+class _Sink(Sink):
+    def __init__(self):
+        super().__init__('test')
+        self.records = []
+        self.acks = []
+
+    def write_record(self, record, ack=None) -> None:
+        self.records.append(record)
+        self.acks.append(ack)
+
+
+class _Client_(OplogClient):
+    def __init__(self, *args, **kwargs):
+        self.options = dict(timestamp_suffix=False, full_doc=False, raw_bson=False)
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        self._client = _Client()
+
+
+class TestRawBson(unittest.TestCase):
+    def client(self) -> _Client_:
+        return _Client_('fake', 27017, 'cluster', 'rs0', start_ts=Timestamp(1, 1), checkpoint_store=NullStore())
+
+    def test_entries_are_written_unchanged(self):
+        client = self.client()
+        sink = _Sink()
+        client.register_data_sink(sink)
+        client.set_raw_bson()
+        client.set_oplog_filter(projection=['o.status'])
+        self.assertEqual(client._oplog_projection, {'o.status': 1, 'ts': 1, 'op': 1, 'ns': 1, 'o._id': 1, 'o2._id': 1})
+        # entries as returned by the projected query
+        insert = _raw({'ts': Timestamp(2, 1), 'op': 'i', 'ns': 'db.c', 'o': {'_id': 1, 'status': 'new'}})
+        update = _raw({'ts': Timestamp(3, 1), 'op': 'u', 'ns': 'db.c', 'o': {'$set': {'status': 'done'}},
+                       'o2': {'_id': {'a': 1}}})
+        client.process_doc(insert)
+        client.process_doc(update)
+        self.assertEqual([r.data for r in sink.records], [insert.raw, update.raw])
+        self.assertTrue(all(r.binary for r in sink.records))
+        # an embedded `_id` stays a RawBSONDocument, which hashes like the decoded document
+        self.assertEqual([hashable_doc_key(r.key) for r in sink.records],
+                         [('db.c', 1), hashable_doc_key(('db.c', {'a': 1}))])
+        self.assertEqual([r.ts for r in sink.records], [Timestamp(2, 1), Timestamp(3, 1)])
+        self.assertEqual(client.ts, Timestamp(3, 1))
+
+        sink.acks[0]()
+        self.assertEqual(client._committer.watermark[0], Timestamp(2, 1))
+        sink.acks[1]()
+        self.assertEqual(client._committer.watermark[0], Timestamp(3, 1))
+        client._committer.stop()
+
+    def test_excludes_full_doc(self):
+        client = self.client()
+        client.set_raw_bson()
+        with self.assertRaises(ValueError):
+            client.set_full_doc()
+        with self.assertRaises(ValueError):
+            client.set_compaction()
+
+        client = self.client()
+        client.set_full_doc()
+        with self.assertRaises(ValueError):
+            client.set_raw_bson()
+        client._committer.stop()
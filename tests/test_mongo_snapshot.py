@@ -0,0 +1,101 @@
+import random
+import threading
+import unittest
+
+from ..pytails.mongo.snapshot import InitialSnapshot, split_points
+
+
+class _Cursor:
+    def __init__(self, docs: list):
+        self._docs = docs
+        self._min = self._max = None
+
+    def hint(self, index):
+        return self
+
+    def min(self, spec):
+        self._min = spec[0][1]
+        return self
+
+    def max(self, spec):
+        self._max = spec[0][1]
+        return self
+
+    def __iter__(self):
+        for doc in self._docs:
+            if (self._min is None or doc['_id'] >= self._min) and (self._max is None or doc['_id'] < self._max):
+                yield doc
+
+    def close(self):
+        pass
+
+
+class _Collection:
+    def __init__(self, ids: list, seed: int = 0):
+        self.docs = [{'_id': _id} for _id in sorted(ids)]
+        self._random = random.Random(seed)
+
+    def estimated_document_count(self) -> int:
+        return len(self.docs)
+
+    def aggregate(self, pipeline: list, allowDiskUse: bool = False) -> list:
+        # $sample picks documents at random, with repeats once the sample is larger than the collection
+        size = pipeline[0]['$sample']['size']
+        sample = [self._random.choice(self.docs) for _ in range(size)]
+        return sorted(({'_id': doc['_id']} for doc in sample), key=lambda d: d['_id'])
+
+    def find(self, query: dict, batch_size: int = None) -> _Cursor:
+        return _Cursor(self.docs)
+
+
+class _Client:
+    def __init__(self, collections: dict):
+        self.collections = collections
+
+    def __getitem__(self, db_name):
+        return self
+
+    def get_collection(self, name, **kwargs):
+        return self.collections[name]
+
+
+class TestSplitPoints(unittest.TestCase):
+    def test_ascending_distinct_points(self):
+        points = split_points(_Collection(range(1000)), partitions=8)
+        self.assertEqual(len(points), 7)
+        self.assertEqual(points, sorted(set(points)))
+        # roughly equal ranges
+        sizes = [b - a for a, b in zip([0] + points, points + [1000])]
+        self.assertLess(max(sizes), 3 * 1000 / 8)
+
+    def test_fewer_distinct_ids_than_partitions(self):
+        points = split_points(_Collection([1, 2, 3]), partitions=10)
+        self.assertEqual(points, sorted(set(points)))
+        self.assertLessEqual(len(points), 3)
+
+    def test_single_partition(self):
+        self.assertEqual(split_points(_Collection(range(10)), partitions=1), [])
+
+
+class TestInitialSnapshot(unittest.TestCase):
+    def test_ranges_cover_every_document_once(self):
+        client = _Client({'a': _Collection(range(0, 2000, 3)), 'b': _Collection(range(5))})
+        written = []
+        lock = threading.Lock()
+
+        def write(ns, doc):
+            with lock:
+                written.append((ns, doc['_id']))
+
+        snapshot = InitialSnapshot(client, ['db.a', 'db.b'], write, workers=3, partition_docs=50)
+        ranges = snapshot.ranges('db.a')
+        self.assertGreater(len(ranges), 5)
+        self.assertIsNone(ranges[0][1])
+        self.assertIsNone(ranges[-1][2])
+        for (_, _, upper), (_, lower, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(upper, lower)
+
+        counts = snapshot.run()
+        self.assertEqual(counts, {'db.a': len(range(0, 2000, 3)), 'db.b': 5})
+        self.assertEqual(sorted(written), sorted([('db.a', i) for i in range(0, 2000, 3)] +
+                                                 [('db.b', i) for i in range(5)]))
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from ..benchmarks.fakes import FakeKinesis
+from ..pytails.sinks import KinesisSink, get_sink_class
+from ..pytails.state import get_store_class
+from ..pytails.state.ddb_store import DynamoDbStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestPlugins(unittest.TestCase):
+    def test_entry_points_do_not_import_boto3(self):
+        for module in ('pytails.pytails', 'pytails.mongo.oplog_client', 'pytails.sinks', 'pytails.state'):
+            output = subprocess.check_output(
+                [sys.executable, '-c', f'import sys, {module}; print("boto3" in sys.modules)'], cwd=ROOT)
+            self.assertEqual(output.decode().strip(), 'False', module)
+
+    def test_registry(self):
+        self.assertEqual(get_sink_class('kinesis').__name__, 'KinesisSink')
+        self.assertEqual(get_store_class('sqlite').__name__, 'SqliteStore')
+        with self.assertRaises(ValueError):
+            get_sink_class('missing')
+
+    def test_lazy_exports(self):
+        from ..pytails.state import DynamoDbStore as LazyStore
+        sink_class = get_sink_class('kinesis')
+        self.assertIs(KinesisSink.resolve(), sink_class)
+        self.assertIs(LazyStore.resolve(), get_store_class('dynamodb'))
+        self.assertEqual(KinesisSink.max_record_bytes, sink_class.max_record_bytes)
+        sink = KinesisSink('test', 'stream', client=FakeKinesis(), linger=0)
+        self.assertIsInstance(sink, KinesisSink)
+        self.assertIsInstance(sink, sink_class)
+        self.assertTrue(issubclass(sink_class, KinesisSink))
+
+        class Subclass(KinesisSink):
+            pass
+
+        self.assertTrue(issubclass(Subclass, sink_class))
+
+    def test_dynamodb_setup_error_raised_on_first_use(self):
+        class FailingStore(DynamoDbStore):
+            def setup_store(self):
+                raise RuntimeError('no table')
+
+        store = FailingStore('cluster', 'rs0')
+        with self.assertRaises(RuntimeError):
+            store.read_state_by_key()
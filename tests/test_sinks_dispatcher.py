@@ -0,0 +1,81 @@
+import random
+import threading
+import time
+import unittest
+
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks import Sink
+from ..pytails.sinks.dispatcher import SinkDispatcher
+from ..pytails.sinks.record import Record
+
+
+class _Sink(Sink):
+    def __init__(self, fail_on=None):
+        super().__init__('test')
+        self.fail_on = fail_on
+        self.written = {}
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+    def write_record(self, record, ack=None) -> None:
+        if record.doc == self.fail_on:
+            raise ValueError('rejected')
+        with self._lock:
+            delay = self._random.random() / 1000
+        time.sleep(delay)
+        with self._lock:
+            self.written.setdefault(repr(record.key), []).append(record.doc['n'])
+        if ack:
+            ack()
+
+
+def _record(key, n: int) -> Record:
+    return Record({'n': n}, get_codec('json'), key=key)
+
+
+class TestSinkDispatcher(unittest.TestCase):
+    def test_per_key_order(self):
+        sinks = [_Sink(), _Sink()]
+        dispatcher = SinkDispatcher(sinks, workers=4, queue_size=10)
+        keys = [('db.c', i) for i in range(8)] + [('db.c', {'a': 1})]
+        acks = []
+        for n in range(300):
+            dispatcher.dispatch(_record(keys[n % len(keys)], n), lambda n=n: acks.append(n))
+        dispatcher.join()
+        dispatcher.close()
+        for sink in sinks:
+            self.assertEqual(set(sink.written), {repr(key) for key in keys})
+            for key, written in sink.written.items():
+                self.assertEqual(written, sorted(written))
+            self.assertEqual(sum(len(w) for w in sink.written.values()), 300)
+        self.assertEqual(sorted(acks), sorted(list(range(300)) * 2))
+
+    def test_records_are_spread_over_lanes(self):
+        dispatcher = SinkDispatcher([_Sink()], workers=4)
+        lanes = {dispatcher._lane_index(('db.c', i)) for i in range(100)}
+        self.assertEqual(lanes, {0, 1, 2, 3})
+        self.assertEqual(dispatcher._lane_index(('db.c', 5)), dispatcher._lane_index(('db.c', 5)))
+        dispatcher.close()
+
+    def test_error_propagation(self):
+        sink = _Sink(fail_on={'n': 5})
+        dispatcher = SinkDispatcher([sink], workers=1)
+        acks = []
+        for n in range(5):
+            dispatcher.dispatch(_record(('db.c', 1), n), lambda n=n: acks.append(n))
+        # held back until the failing record has been tried
+        block = threading.Event()
+        dispatcher.dispatch(Record({'n': 'wait'}, get_codec('json')), block.wait)
+        dispatcher.dispatch(_record(('db.c', 1), 5), lambda: acks.append(5))
+        dispatcher.dispatch(_record(('db.c', 1), 6), lambda: acks.append(6))
+        block.set()
+        with self.assertRaises(ValueError):
+            dispatcher.join()
+        with self.assertRaises(ValueError):
+            dispatcher.check()
+        with self.assertRaises(ValueError):
+            dispatcher.dispatch(_record(('db.c', 1), 7))
+        dispatcher.close()
+        # neither the failed record nor any later one is acknowledged, so the checkpoint stays before it
+        self.assertEqual(acks, [0, 1, 2, 3, 4])
+        self.assertEqual(sink.written[repr(('db.c', 1))], [0, 1, 2, 3, 4])
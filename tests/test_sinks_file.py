@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+
+from bson import Timestamp
+
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks.file import FileSink
+from ..pytails.sinks.file_reader import FileReader, SegmentIndex
+from ..pytails.sinks.record import Record
+
+
+class TestFileSink(unittest.TestCase):
+    def write(self, directory, codec='json', compression='gzip', count=100, order=None, **kwargs):
+        sink = FileSink('test', directory, codec=codec, compression=compression, batch_size=10, linger=0, **kwargs)
+        acks = []
+        for i in order or range(1, count + 1):
+            entry = {'ts': Timestamp(1000 + i, 1), 'op': 'i', 'ns': 'db.coll', 'o': {'_id': i}}
+            doc = entry if codec == 'bson' else {'doc': entry}
+            sink.write_record(Record(doc, get_codec(codec), ('db.coll', i), entry['ts']), lambda: acks.append(1))
+        sink.close()
+        return acks
+
+    def test_index_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            acks = self.write(directory)
+            self.assertEqual(len(acks), 100)
+            segments = FileReader(directory).segments()
+            self.assertEqual(len(segments), 1)
+            index = segments[0]
+            self.assertEqual((index.codec, index.compression), ('json', 'gzip'))
+            self.assertEqual(len(index), 10)
+            self.assertEqual(index.entry(0)[:2], ((1001 << 32) + 1, (1010 << 32) + 1))
+            self.assertEqual(index.entry(0)[2], 0)
+            self.assertEqual(index.blocks((1055 << 32) + 1, (1056 << 32) + 1),
+                             [(index.entry(5)[2], index.entry(6)[2] - index.entry(5)[2]), (index.entry(9)[2], None)])
+            self.assertEqual(len(index.blocks()), 10)
+            index.close()
+
+    def test_read_range(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write(directory, compression=None, segment_bytes=1000)
+            reader = FileReader(directory)
+            self.assertGreater(len(reader.segments()), 1)
+            records = list(reader.read(Timestamp(1050, 1), Timestamp(1060, 1)))
+            self.assertEqual([r.ts.time for r in records], list(range(1050, 1061)))
+            self.assertEqual(records[0].key, ('db.coll', 50))
+            self.assertEqual(len(list(reader.read())), 100)
+
+    def test_read_out_of_order_blocks(self):
+        # blocks delivered by parallel workers overlap and are not in timestamp order
+        order = [i + offset for i in range(1, 100, 20) for offset in (10, 0, 11, 1, 12, 2, 13, 3, 14, 4,
+                                                                     15, 5, 16, 6, 17, 7, 18, 8, 19, 9)]
+        with tempfile.TemporaryDirectory() as directory:
+            self.write(directory, compression=None, order=order, segment_bytes=1000)
+            reader = FileReader(directory)
+            records = list(reader.read(Timestamp(1005, 1), Timestamp(1012, 1)))
+            self.assertEqual(sorted(r.ts.time for r in records), list(range(1005, 1013)))
+            self.assertEqual([r.ts.time for r in records], [t for t in (1000 + i for i in order) if 1005 <= t <= 1012])
+            self.assertEqual(len(list(reader.read(Timestamp(1051, 1)))), 50)
+
+    def test_replay_bson(self):
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as target:
+            self.write(directory, codec='bson')
+            sink = FileSink('test', target, codec='bson', linger=0)
+            self.assertEqual(FileReader(directory).replay([sink], start_ts=Timestamp(1091, 1)), 10)
+            sink.close()
+            self.assertEqual([r.doc['o']['_id'] for r in FileReader(target).read()], list(range(91, 101)))
+
+    def test_truncated_index_entry(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write(directory, compression=None, count=20)
+            path = FileReader(directory).segments()[0].path
+            with open(path, 'ab') as f:
+                f.write(b'\0' * 5)
+            index = SegmentIndex(path)
+            self.assertEqual(len(index), 2)
+            index.close()
@@ -0,0 +1,56 @@
+import unittest
+
+from botocore.exceptions import ClientError, ConnectTimeoutError
+
+from ..benchmarks.fakes import FakeFirehose
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks.firehose import FirehoseSink
+from ..pytails.sinks.record import Record
+
+
+class _FailingFirehose(FakeFirehose):
+    """
+    Raises the queued exceptions from the next `put_record_batch` calls.
+    """
+
+    def __init__(self, *errors, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = list(errors)
+        self.delivered = []
+
+    def put_record_batch(self, DeliveryStreamName: str, Records: list) -> dict:
+        if self.errors:
+            raise self.errors.pop(0)
+        resp = super().put_record_batch(DeliveryStreamName, Records)
+        self.delivered.extend(rec['Data'] for rec, res in zip(Records, resp['RequestResponses'])
+                              if 'ErrorCode' not in res)
+        return resp
+
+
+def _record(n: int) -> Record:
+    return Record({'doc': {'_id': n}}, get_codec('json'))
+
+
+class TestFirehoseSink(unittest.TestCase):
+    def _sink(self, client, **kwargs) -> FirehoseSink:
+        sink = FirehoseSink('test', 'stream', client=client, **kwargs)
+        sink.retry_backoff = 0.001
+        return sink
+
+    def test_failing_put_record_batch_keeps_batch(self):
+        error = ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': ''}}, 'PutRecordBatch')
+        client = _FailingFirehose(ConnectTimeoutError(endpoint_url='https://firehose'), error,
+                                  throttle_rate=0.3, seed=2)
+        sink = self._sink(client, batch_size=10, linger=0)
+        acked = []
+        for n in range(5):
+            sink.write_record(_record(n), lambda n=n: acked.append(n))
+        with self.assertRaises(ClientError):
+            sink.flush()
+        self.assertEqual(acked, [])
+        self.assertEqual(client.delivered, [])
+        for n in range(5, 25):
+            sink.write_record(_record(n), lambda n=n: acked.append(n))
+        sink.close()
+        self.assertEqual(sorted(client.delivered), sorted(_record(n).data + b'\n' for n in range(25)))
+        self.assertEqual(acked, list(range(25)))
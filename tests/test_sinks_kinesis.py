@@ -0,0 +1,212 @@
+import time
+import unittest
+
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+from ..benchmarks.fakes import FakeKinesis
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks.kinesis import KinesisSink
+from ..pytails.sinks.kinesis_shards import KinesisShardMap
+from ..pytails.sinks.record import Record
+
+
+class _FailingKinesis(FakeKinesis):
+    """
+    Raises the queued exceptions from the next `put_records` calls.
+    """
+
+    def __init__(self, *errors, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = list(errors)
+        self.delivered = []
+
+    def put_records(self, StreamName: str, Records: list) -> dict:
+        if self.errors:
+            raise self.errors.pop(0)
+        resp = super().put_records(StreamName, Records)
+        self.delivered.extend(rec['Data'] for rec, res in zip(Records, resp['Records']) if 'ErrorCode' not in res)
+        return resp
+
+
+class _ReshardingKinesis(_FailingKinesis):
+    """
+    Lists no open shards while `shards` is 0.
+    """
+
+    def list_shards(self, **kwargs) -> dict:
+        return super().list_shards(**kwargs) if self.shards else {'Shards': []}
+
+    def put_records(self, StreamName: str, Records: list) -> dict:
+        self.hash_keys = [rec.get('ExplicitHashKey') for rec in Records]
+        return super().put_records(StreamName, Records)
+
+
+class _RejectingKinesis(_FailingKinesis):
+    """
+    Rejects the records at the queued indexes of the next `put_records` calls.
+    """
+
+    def __init__(self, *rejects, **kwargs):
+        super().__init__(**kwargs)
+        self.rejects = list(rejects)
+        self.keys = []
+
+    def put_records(self, StreamName: str, Records: list) -> dict:
+        reject = self.rejects.pop(0) if self.rejects else ()
+        self.keys.append([rec.get('ExplicitHashKey') for rec in Records])
+        results = []
+        for i, rec in enumerate(Records):
+            if i in reject:
+                results.append({'ErrorCode': 'ProvisionedThroughputExceededException', 'ErrorMessage': ''})
+            else:
+                self.delivered.append(rec['Data'])
+                results.append({'RecordId': str(len(self.delivered))})
+        return {'FailedRecordCount': len(reject), 'Records': results}
+
+
+def _record(n: int, version: int = 0) -> Record:
+    doc = {'_id': n, 'v': version} if version else {'_id': n}
+    return Record({'ns': 'db.c', 'doc': doc}, get_codec('json'), key=('db.c', n))
+
+
+def _sink(client, **kwargs) -> KinesisSink:
+    sink = KinesisSink('test', 'stream', client=client, **kwargs)
+    sink.retry_backoff = 0.001
+    return sink
+
+
+class TestKinesisSink(unittest.TestCase):
+    def test_partial_failure_retry(self):
+        client = _FailingKinesis(throttle_rate=0.5, seed=1)
+        sink = _sink(client, batch_size=20, linger=0)
+        acked = []
+        for n in range(100):
+            sink.write_record(_record(n), lambda n=n: acked.append((n, len(client.delivered))))
+        sink.close()
+        self.assertGreater(client.throttled, 0)
+        self.assertEqual(sorted(client.delivered), sorted(_record(n).data for n in range(100)))
+        self.assertEqual([n for n, _ in acked], list(range(100)))
+        # every record is acknowledged only once its whole batch was delivered
+        for n, delivered in acked:
+            self.assertGreaterEqual(delivered, (n // 20 + 1) * 20)
+
+    def test_rejected_record_holds_back_its_partition_key(self):
+        for shard_map in (False, True):
+            # the first version of document 1 is rejected, its second version in the same batch is accepted
+            client = _RejectingKinesis({0})
+            sink = _sink(client, linger=0, shard_map=shard_map)
+            acked = []
+            for n, version in ((1, 1), (2, 1), (1, 2), (3, 1)):
+                sink.write_record(_record(n, version), lambda n=n, version=version: acked.append((n, version)))
+            sink.flush()
+            # the accepted later version is sent again after the rejected one, so it is delivered last
+            self.assertEqual(client.delivered, [_record(2, 1).data, _record(1, 2).data, _record(3, 1).data,
+                                                _record(1, 1).data, _record(1, 2).data])
+            self.assertEqual(acked, [(1, 1), (2, 1), (1, 2), (3, 1)])
+            if shard_map:
+                self.assertEqual(len(set(client.keys[1])), 1)
+                self.assertIsNotNone(client.keys[1][0])
+
+    def test_oversize_record_raises(self):
+        for aggregate in (False, True):
+            client = _FailingKinesis()
+            sink = _sink(client, linger=0, aggregate=aggregate)
+            sink.max_record_bytes = 1024
+            acked = []
+            record = Record({'ns': 'db.c', 'doc': {'_id': 1, 'data': 'x' * 1024}}, get_codec('json'), key=('db.c', 1))
+            with self.assertRaises(ValueError):
+                sink.write_record(record, lambda: acked.append(1))
+            sink.write_record(_record(2), lambda: acked.append(2))
+            sink.flush()
+            self.assertEqual(acked, [2])
+            self.assertEqual(client.records, 1)
+
+    def test_backoff(self):
+        sink = _sink(FakeKinesis(), linger=0)
+        sink.retry_backoff, sink.retry_backoff_max = 0.1, 0.5
+        for attempt, limit in ((0, 0.1), (2, 0.4), (10, 0.5)):
+            for _ in range(50):
+                self.assertTrue(0 <= sink._retry_delay(attempt) <= limit)
+
+    def test_connection_errors_are_retried(self):
+        client = _FailingKinesis(EndpointConnectionError(endpoint_url='https://kinesis'),
+                                 ReadTimeoutError(endpoint_url='https://kinesis'))
+        sink = _sink(client, linger=0)
+        acked = []
+        sink.write_record(_record(1), lambda: acked.append(1))
+        sink.flush()
+        self.assertEqual(client.delivered, [_record(1).data])
+        self.assertEqual(acked, [1])
+
+    def test_error_keeps_batch(self):
+        error = ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': ''}}, 'PutRecords')
+        client = _FailingKinesis(error)
+        sink = _sink(client, linger=0)
+        acked = []
+        sink.write_record(_record(1), lambda: acked.append(1))
+        with self.assertRaises(ClientError):
+            sink.flush()
+        self.assertEqual(acked, [])
+        sink.write_record(_record(2), lambda: acked.append(2))
+        sink.flush()
+        self.assertEqual(client.delivered, [_record(1).data, _record(2).data])
+        self.assertEqual(acked, [1, 2])
+
+    def test_linger_error_is_raised_by_next_write(self):
+        error = ClientError({'Error': {'Code': 'AccessDeniedException', 'Message': ''}}, 'PutRecords')
+        client = _FailingKinesis(error)
+        sink = _sink(client, linger=0.05)
+        acked = []
+        sink.write_record(_record(1), lambda: acked.append(1))
+        deadline = time.monotonic() + 5
+        while client.errors and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        with self.assertRaises(ClientError):
+            sink.write_record(_record(2))
+        sink.close()
+        self.assertEqual(client.delivered, [_record(1).data])
+        self.assertEqual(acked, [1])
+
+    def test_seals_only_lingered_aggregates(self):
+        client = _FailingKinesis()
+        sink = _sink(client, linger=0, aggregate=True, aggregation_buckets=2)
+        for n in range(20):
+            sink.write_record(_record(n))
+        self.assertEqual(len(sink._aggregates), 2)
+        old, young = sorted(sink._aggregates)
+        aggregator, acks, opened = sink._aggregates[old]
+        sink._aggregates[old] = (aggregator, acks, opened - 10)
+        sink._seal(max_age=5)
+        self.assertEqual(list(sink._aggregates), [young])
+        # the sealed aggregate keeps the time of its first record
+        self.assertLessEqual(sink._buffer_since, opened - 10)
+        sink.flush()
+        self.assertEqual(sink._aggregates, {})
+        self.assertEqual(client.records, 20)
+
+
+class TestKinesisShardMap(unittest.TestCase):
+    def test_no_open_shards(self):
+        client = _ReshardingKinesis(shards=0)
+        shard_map = KinesisShardMap(client, 'stream')
+        self.assertEqual(shard_map.load(), [])
+        self.assertIsNone(shard_map.shard_index('key'))
+        self.assertIsNone(shard_map.explicit_hash_key('key'))
+        client.shards = 2
+        shards = shard_map.load()
+        self.assertEqual(len(shards), 2)
+        client.shards = 0
+        self.assertEqual(shard_map.load(), shards)
+        self.assertIn(shard_map.explicit_hash_key('key'), [hash_key for _, hash_key in shards])
+
+    def test_sink_without_open_shards(self):
+        for aggregate in (False, True):
+            client = _ReshardingKinesis(shards=0)
+            sink = _sink(client, linger=0, shard_map=True, aggregate=aggregate)
+            for n in range(10):
+                sink.write_record(_record(n))
+            sink.flush()
+            self.assertEqual(client.records, 10)
+            if not aggregate:
+                self.assertEqual(client.hash_keys, [None] * 10)
@@ -0,0 +1,32 @@
+import hashlib
+import unittest
+
+from ..pytails.sinks.kpl import KPL_MAGIC, RecordAggregator, deaggregate
+
+
+class TestRecordAggregator(unittest.TestCase):
+    def test_serialize_format(self):
+        agg = RecordAggregator()
+        agg.add('pk', b'data')
+        actual = agg.serialize()
+        # partition_key_table: "pk", records: {partition_key_index: 0, data: "data"}
+        body = b'\x0a\x02pk' + b'\x1a\x08\x08\x00\x1a\x04data'
+        self.assertEqual(actual, KPL_MAGIC + body + hashlib.md5(body).digest())
+        self.assertEqual(agg.size, len(actual))
+
+    def test_roundtrip_keeps_partition_keys(self):
+        agg = RecordAggregator()
+        records = [('a', None, b'1'), ('b', '42', b'2'), ('a', None, b'3' * 300)]
+        for pk, ehk, data in records:
+            agg.add(pk, data, ehk)
+        self.assertEqual(len(agg), 3)
+        self.assertEqual(deaggregate(agg.serialize()), records)
+
+    def test_fits_respects_max_bytes(self):
+        agg = RecordAggregator(max_bytes=100)
+        self.assertTrue(agg.fits('pk', b'x' * 200))
+        agg.add('pk', b'x' * 50)
+        self.assertFalse(agg.fits('pk', b'x' * 50))
+
+    def test_deaggregate_plain_record(self):
+        self.assertEqual(deaggregate(b'{"doc": 1}'), [(None, None, b'{"doc": 1}')])
@@ -0,0 +1,38 @@
+import io
+import os
+import unittest
+
+from bson import Timestamp
+
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks.pipe import PipeSink
+from ..pytails.sinks.record import Record
+
+
+class TestPipeSink(unittest.TestCase):
+    def test_writes_ndjson(self):
+        stream = io.BytesIO()
+        sink = PipeSink('test', stream=stream, batch_bytes=64, linger=0)
+        acks = []
+        for i in range(10):
+            sink.write_record(Record({'doc': {'_id': i}}, get_codec('fastjson')), lambda: acks.append(1))
+        sink.write_record(Record({'ts': Timestamp(1, 2), 'op': 'i'}, get_codec('bson')))
+        self.assertGreater(len(acks), 0)
+        sink.close()
+        lines = stream.getvalue().split(b'\n')
+        self.assertEqual(lines[0], b'{"doc":{"_id":0}}')
+        self.assertEqual(lines[10], b'{"ts": {"$timestamp": {"t": 1, "i": 2}}, "op": "i"}')
+        self.assertEqual(lines[11], b'')
+        self.assertEqual(len(acks), 10)
+
+    def test_broken_pipe(self):
+        read_fd, write_fd = os.pipe()
+        os.close(read_fd)
+        with os.fdopen(write_fd, 'wb') as stream:
+            sink = PipeSink('test', stream=stream, linger=0)
+            sink.write_record(Record({'doc': 1}, get_codec('json')))
+            with self.assertRaises(BrokenPipeError):
+                sink.flush()
+            with self.assertRaises(BrokenPipeError):
+                sink.write_record(Record({'doc': 2}, get_codec('json')))
+            sink.close()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from bson import Timestamp
+
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks.record import Record
+from ..pytails.sinks.spill import SPILL_EXTENSION, SpillQueue
+
+
+def record(i, codec=get_codec('json')):
+    return Record({'doc': {'_id': i}}, codec, ('db.coll', i), Timestamp(1000 + i, 1))
+
+
+class TestSpillQueue(unittest.TestCase):
+    def test_delivers_in_order_with_acks(self):
+        delivered, acks = [], []
+        with tempfile.TemporaryDirectory() as directory:
+            spill = SpillQueue(directory, lambda r, ack: (delivered.append(r), ack()), segment_bytes=1024,
+                               decode=get_codec('json').decode)
+            for i in range(200):
+                spill.put(record(i), lambda i=i: acks.append(i))
+            spill.join()
+            spill.close()
+            self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(acks, list(range(200)))
+        self.assertEqual([r.key for r in delivered], [('db.coll', i) for i in range(200)])
+        self.assertEqual(delivered[5].ts, Timestamp(1005, 1))
+        self.assertEqual(delivered[5].data, record(5).data)
+        self.assertEqual(delivered[5].doc, {'doc': {'_id': 5}})
+
+    def test_budget_blocks_reader(self):
+        release = threading.Event()
+        delivered = []
+
+        def deliver(r, ack):
+            release.wait()
+            delivered.append(r)
+
+        with tempfile.TemporaryDirectory() as directory:
+            spill = SpillQueue(directory, deliver, max_bytes=2048, segment_bytes=512)
+            writer = threading.Thread(target=lambda: [spill.put(record(i)) for i in range(200)])
+            writer.start()
+            writer.join(0.5)
+            self.assertTrue(writer.is_alive())
+            self.assertLessEqual(spill.spilled_bytes, 2048)
+            release.set()
+            writer.join()
+            spill.close()
+        self.assertEqual(len(delivered), 200)
+
+    def test_recovers_segments(self):
+        crashed = threading.Event()
+
+        def fail(r, ack):
+            crashed.wait()
+            raise IOError('sink down')
+
+        with tempfile.TemporaryDirectory() as directory:
+            spill = SpillQueue(directory, fail, fsync_interval=0)
+            for i in range(10):
+                spill.put(record(i))
+            crashed.set()
+            spill.close()
+            # a crash can leave a partial last entry
+            with open(os.path.join(directory, f'{1:012d}{SPILL_EXTENSION}'), 'ab') as f:
+                f.write(b'\x40\x00\x00\x00\x01')
+            delivered = []
+            recovered = SpillQueue(directory, lambda r, ack: delivered.append((r.key, ack)))
+            recovered.put(record(10), 'ack')
+            recovered.close()
+            self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(delivered[0], (('db.coll', 0), None))
+        self.assertEqual(delivered[-1], (('db.coll', 10), 'ack'))
+        self.assertEqual(len(delivered), 11)
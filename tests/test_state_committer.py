@@ -0,0 +1,50 @@
+import unittest
+
+from bson import Timestamp
+
+from ..pytails.state.committer import CheckpointCommitter
+from ..pytails.state.null_store import NullStore
+
+
+class RecordingStore(NullStore):
+    def __init__(self):
+        self.saved = []
+
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
+        self.saved.append(ldt)
+
+
+class TestCheckpointCommitter(unittest.TestCase):
+    def setUp(self):
+        self.store = RecordingStore()
+        self.committer = CheckpointCommitter(self.store, lambda: 'conn', interval=60, count=1000)
+
+    def tearDown(self):
+        self.committer.stop()
+
+    def test_watermark_waits_for_every_sink(self):
+        ack = self.committer.track(Timestamp(1, 1), 2)
+        ack()
+        self.assertIsNone(self.committer.watermark)
+        ack()
+        self.assertEqual(self.committer.watermark, (Timestamp(1, 1), None))
+
+    def test_watermark_is_contiguous(self):
+        first = self.committer.track(Timestamp(1, 1), 1)
+        second = self.committer.track(Timestamp(1, 2), 1)
+        second()
+        self.assertIsNone(self.committer.watermark)
+        first()
+        self.assertEqual(self.committer.watermark[0], Timestamp(1, 2))
+        self.assertEqual(self.committer.pending, 0)
+
+    def test_commit_skips_unchanged_watermark(self):
+        self.committer.track(Timestamp(1, 1), 1)()
+        self.assertTrue(self.committer.commit())
+        self.assertFalse(self.committer.commit())
+        self.assertEqual(len(self.store.saved), 1)
+
+    def test_stop_commits_final_watermark(self):
+        self.committer.track(Timestamp(1, 1), 1)()
+        self.committer.stop()
+        self.assertEqual(self.store.saved, [(1 << 32) + 1])
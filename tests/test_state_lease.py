@@ -0,0 +1,185 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from bson import Timestamp
+
+from ..benchmarks.fakes import FakeDynamoTable
+from ..pytails.helpers.bson_utils import bson_timestamp_to_int
+from ..pytails.mongo.oplog_client import OplogClient
+from ..pytails.state.cached_store import CachedStore
+from ..pytails.state.ddb_store import DynamoDbStore
+from ..pytails.state.lease import LeaderElection
+from ..pytails.state.sqlite_store import SqliteStore
+from ..pytails.state.store import LeaseLost
+
+
+class _Client:
+    address = ('fake', 27017)
+
+
+class _StandbyClient(OplogClient):
+    def __init__(self, *args, **kwargs):
+        self.options = dict(timestamp_suffix=False, full_doc=False, raw_bson=False)
+        self.tailed_from = None
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, mongo_host: str, mongo_port: int, replica_set: str = None) -> None:
+        self._client = _Client()
+
+    def get_last_write_ts(self):
+        return None
+
+    def tail(self) -> None:
+        self.tailed_from = self.ts
+
+
+class _HangingStore(SqliteStore):
+    """
+    Blocks every lease renewal after the first, like a store that cannot be reached.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hang = threading.Event()
+        self.renewals = 0
+
+    def acquire_lease(self, owner: str, duration: float) -> bool:
+        self.renewals += 1
+        if self.renewals > 1:
+            self.hang.wait()
+        return super().acquire_lease(owner, duration)
+
+
+class TestLease(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'state.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_dynamodb_lease(self):
+        table = FakeDynamoTable()
+        a, b = DynamoDbStore('c', 'rs0', table=table), DynamoDbStore('c', 'rs0', table=table)
+        self.assertTrue(a.acquire_lease('a', 10))
+        self.assertFalse(b.acquire_lease('b', 10))
+        self.assertTrue(a.acquire_lease('a', 10))
+        self.assertEqual(b.read_lease()[0], 'a')
+        # an item holding only the lease has no checkpoint
+        self.assertIsNone(b.read_state_by_key())
+        b.release_lease('b')
+        a.release_lease('a')
+        self.assertEqual(b.read_lease(), (None, None))
+        self.assertTrue(b.acquire_lease('b', 0))
+        time.sleep(0.01)
+        self.assertTrue(a.acquire_lease('a', 10))
+
+    def test_sqlite_lease_expires(self):
+        a, b = SqliteStore('c', 'rs0', path=self.path), SqliteStore('c', 'rs0', path=self.path)
+        a.save_state(bson_timestamp_to_int(Timestamp(10, 1)), 'conn')
+        self.assertTrue(a.acquire_lease('a', 0.1))
+        self.assertFalse(b.acquire_lease('b', 0.1))
+        time.sleep(0.15)
+        self.assertTrue(b.acquire_lease('b', 10))
+        self.assertFalse(a.acquire_lease('a', 10))
+        self.assertEqual(a.read_state_by_key(), Timestamp(10, 1))
+
+    def _assert_fenced(self, a, b):
+        ldt = bson_timestamp_to_int(Timestamp(10, 1))
+        lost = []
+        a.fence('a', on_lost=lambda: lost.append('a'))
+        # no lease taken yet
+        a.save_state(ldt, 'conn')
+        self.assertTrue(a.acquire_lease('a', 0.05))
+        a.save_state(ldt + 1, 'conn')
+        time.sleep(0.06)
+        self.assertTrue(b.acquire_lease('b', 10))
+        with self.assertRaises(LeaseLost):
+            a.save_state(ldt + 2, 'conn')
+        self.assertEqual(lost, ['a'])
+        self.assertEqual(b.read_state_by_key(), Timestamp(10, 2))
+        b.fence('b')
+        b.save_state(ldt + 3, 'conn')
+        a.fence(None)
+        a.save_state(ldt + 4, 'conn')
+        self.assertEqual(b.read_state_by_key(), Timestamp(10, 5))
+
+    def test_dynamodb_fenced_checkpoints(self):
+        table = FakeDynamoTable()
+        self._assert_fenced(DynamoDbStore('c', 'rs0', table=table), DynamoDbStore('c', 'rs0', table=table))
+
+    def test_sqlite_fenced_checkpoints(self):
+        self._assert_fenced(CachedStore(SqliteStore('c', 'rs0', path=self.path)),
+                            SqliteStore('c', 'rs0', path=self.path))
+
+    def test_refused_checkpoint_steps_down(self):
+        store = SqliteStore('c', 'rs0', path=self.path)
+        election = LeaderElection(store, owner='a', lease_seconds=10, heartbeat=5)
+        lost = threading.Event()
+        election.start(on_lost=lost.set)
+        self.assertTrue(election.wait(1))
+        self.assertEqual(store.lease_owner, 'a')
+        # the lease was taken over without this instance noticing yet
+        store.release_lease('a')
+        self.assertTrue(SqliteStore('c', 'rs0', path=self.path).acquire_lease('b', 10))
+        with self.assertRaises(LeaseLost):
+            store.save_state(bson_timestamp_to_int(Timestamp(10, 1)), 'conn')
+        self.assertTrue(lost.is_set())
+        self.assertTrue(election.lost)
+        election.stop()
+        self.assertIsNone(store.lease_owner)
+
+    def test_standby_takes_over_from_last_checkpoint(self):
+        leader = LeaderElection(SqliteStore('c', 'rs0', path=self.path), owner='leader', lease_seconds=5,
+                                heartbeat=0.05)
+        leader.start()
+        self.assertTrue(leader.wait(1))
+
+        store = CachedStore(SqliteStore('c', 'rs0', path=self.path))
+        client = _StandbyClient('fake', 27017, 'c', 'rs0', checkpoint_store=store)
+        client.set_leader_election(lease_seconds=5, heartbeat=0.05, owner='standby')
+        result = []
+        thread = threading.Thread(target=lambda: result.append(client.start_tail()))
+        thread.start()
+        time.sleep(0.2)
+        self.assertIsNone(client.tailed_from)
+
+        SqliteStore('c', 'rs0', path=self.path).save_state(bson_timestamp_to_int(Timestamp(20, 1)), 'conn')
+        started = time.monotonic()
+        leader.stop()
+        thread.join(5)
+        self.assertEqual(result, [True])
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(client.tailed_from, Timestamp(20, 1))
+        self.assertEqual(store.read_lease(), (None, None))
+
+    def test_watchdog_steps_down_during_blocked_renewal(self):
+        store = _HangingStore('c', 'rs0', path=self.path)
+        election = LeaderElection(store, owner='a', lease_seconds=0.4, heartbeat=0.1)
+        lost = threading.Event()
+        started = time.monotonic()
+        election.start(on_lost=lost.set)
+        self.assertTrue(election.wait(1))
+        self.assertTrue(lost.wait(1))
+        # before a standby can take the lease
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertTrue(election.lost)
+        store.hang.set()
+        election.stop()
+
+    def test_leader_steps_down(self):
+        store = SqliteStore('c', 'rs0', path=self.path)
+        election = LeaderElection(store, owner='a', lease_seconds=0.3, heartbeat=0.05)
+        lost = threading.Event()
+        election.start(on_lost=lost.set)
+        self.assertTrue(election.wait(1))
+        # another instance took the lease, e.g. after a long pause
+        store.release_lease('a')
+        self.assertTrue(SqliteStore('c', 'rs0', path=self.path).acquire_lease('b', 10))
+        self.assertTrue(lost.wait(1))
+        self.assertFalse(election.is_leader)
+        self.assertTrue(election.lost)
+        election.stop()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from bson import Timestamp
+
+from ..pytails.helpers.bson_utils import bson_timestamp_to_int
+from ..pytails.state.cached_store import CachedStore
+from ..pytails.state.null_store import NullStore
+from ..pytails.state.sqlite_store import SqliteStore
+
+
+class CountingStore(NullStore):
+    def __init__(self):
+        self.reads = 0
+        self.saved = []
+
+    def save_state(self, ldt: int, conn: str, resume_token: dict = None):
+        self.saved.append(ldt)
+
+    def read_state_by_key(self):
+        self.reads += 1
+        return Timestamp(5, 1)
+
+
+class TestSqliteStore(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'state.db')
+            store = SqliteStore('cluster', 'rs0', path=path, sync_interval=0.5)
+            self.assertIsNone(store.read_state_by_key())
+            self.assertIsNone(store.read_resume_token_by_key())
+            store.save_state(bson_timestamp_to_int(Timestamp(10, 2)), 'conn', resume_token={'_data': 'abc'})
+            store.save_state(bson_timestamp_to_int(Timestamp(11, 1)), 'conn')
+            SqliteStore('cluster', 'rs1', path=path).save_state(bson_timestamp_to_int(Timestamp(3, 1)), 'conn')
+            store.close()
+
+            store = SqliteStore('cluster', 'rs0', path=path)
+            self.assertEqual(store.read_state_by_key(), Timestamp(11, 1))
+            # saving without a token keeps the last one
+            self.assertEqual(store.read_resume_token_by_key(), {'_data': 'abc'})
+            items = sorted(store.read_all_state(), key=lambda i: i['replicaset'])
+            self.assertEqual([i['replicaset'] for i in items], ['rs0', 'rs1'])
+            self.assertEqual(items[0]['ldt'], bson_timestamp_to_int(Timestamp(11, 1)))
+            store.close()
+
+
+class TestCachedStore(unittest.TestCase):
+    def test_write_through(self):
+        backend = CountingStore()
+        store = CachedStore(backend)
+        self.assertEqual(store.read_state_by_key(), Timestamp(5, 1))
+        self.assertEqual(store.read_state_by_key(), Timestamp(5, 1))
+        self.assertEqual(backend.reads, 1)
+        store.save_state(bson_timestamp_to_int(Timestamp(6, 1)), 'conn')
+        self.assertEqual(backend.saved, [bson_timestamp_to_int(Timestamp(6, 1))])
+        self.assertEqual(store.read_state_by_key(), Timestamp(6, 1))
+        self.assertEqual(backend.reads, 1)
@@ -0,0 +1,85 @@
+import queue
+import time
+import unittest
+
+from bson import Timestamp
+
+from ..pytails.helpers.bson_utils import bson_timestamp_to_int
+from ..pytails.helpers.codecs import get_codec
+from ..pytails.sinks import Sink
+from ..pytails.sinks.record import Record
+from ..pytails.supervisor import ClusterTimeMerger, MergeQueueSink
+
+
+class _Sink(Sink):
+    def __init__(self, defer_acks: bool = False):
+        super().__init__('test')
+        self.defer_acks = defer_acks
+        self.written = []
+        self.acks = []
+
+    def write_record(self, record, ack=None) -> None:
+        self.written.append(record.doc['n'])
+        if ack and self.defer_acks:
+            self.acks.append(ack)
+        elif ack:
+            ack()
+
+
+def _record(t: int) -> Record:
+    return Record({'n': t}, get_codec('json'), ts=Timestamp(t, 1))
+
+
+def _ts(t: int) -> int:
+    return bson_timestamp_to_int(Timestamp(t, 1))
+
+
+class TestClusterTimeMerger(unittest.TestCase):
+    def test_cluster_time_order(self):
+        sink = _Sink()
+        merger = ClusterTimeMerger(['rs1', 'rs2'], [sink], max_delay=60)
+        for source, t in (('rs1', 1), ('rs1', 4), ('rs1', 6), ('rs2', 2), ('rs2', 3), ('rs2', 5), ('rs2', 7)):
+            merger.add(source, _ts(t), _record(t))
+        # 7 waits for a later record of rs1
+        self.assertEqual(sink.written, [1, 2, 3, 4, 5, 6])
+        merger.emit(force=True)
+        self.assertEqual(sink.written, [1, 2, 3, 4, 5, 6, 7])
+
+    def test_max_delay(self):
+        sink = _Sink()
+        merger = ClusterTimeMerger(['rs1', 'rs2'], [sink], max_delay=0.05)
+        merger.add('rs1', _ts(1), _record(1))
+        merger.emit()
+        self.assertEqual(sink.written, [])
+        time.sleep(0.06)
+        merger.emit()
+        self.assertEqual(sink.written, [1])
+
+    def test_ack_after_every_sink(self):
+        sinks = [_Sink(), _Sink(defer_acks=True)]
+        merger = ClusterTimeMerger(['rs1'], sinks)
+        acked = []
+        merger.add('rs1', _ts(1), _record(1), lambda: acked.append(1))
+        self.assertEqual(acked, [])
+        sinks[1].acks[0]()
+        self.assertEqual(acked, [1])
+
+
+class TestMergeQueueSink(unittest.TestCase):
+    def test_ack_once_delivered(self):
+        merge_queue, ack_queue = queue.Queue(), queue.Queue()
+        sink = MergeQueueSink('test', merge_queue, 'rs1', ack_queue=ack_queue, generation=2, close_timeout=5)
+        acked = []
+        for t in (1, 2):
+            sink.write_record(_record(t), lambda t=t: acked.append(t))
+        items = [merge_queue.get_nowait() for _ in range(2)]
+        self.assertEqual([(source, generation, ts) for source, generation, ts, _, _ in items],
+                         [('rs1', 2, _ts(1)), ('rs1', 2, _ts(2))])
+        time.sleep(0.01)
+        # queued is not delivered
+        self.assertEqual(acked, [])
+        merger = ClusterTimeMerger(['rs1'], [_Sink()])
+        for source, _, ts, seq, record in reversed(items):
+            merger.add(source, ts, record, lambda seq=seq: ack_queue.put(seq))
+        sink.close()
+        self.assertEqual(sorted(acked), [1, 2])
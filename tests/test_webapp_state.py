@@ -0,0 +1,54 @@
+import unittest
+
+from bson import Timestamp
+
+from ..benchmarks.fakes import FakeDynamoTable
+from ..pytails.helpers.bson_utils import bson_timestamp_to_int
+from ..pytails.state.ddb_store import DynamoDbStore
+from ..pytails.state.null_store import NullStore
+from ..webapp.state_cache import StateCache, query_state
+
+
+class ListStore(NullStore):
+    def __init__(self, items):
+        self.items = items
+        self.reads = 0
+
+    def read_all_state(self) -> list:
+        self.reads += 1
+        return self.items
+
+
+class TestStateCache(unittest.TestCase):
+    def test_scan_follows_pages_and_segments(self):
+        table = FakeDynamoTable(page_size=3)
+        for n in range(10):
+            DynamoDbStore('c', f'rs{n}', table=table).save_state(n, 'conn')
+        self.assertEqual(len(DynamoDbStore('', '', table=table).read_all_state()), 10)
+        self.assertEqual(table.scans, 4)
+        items = DynamoDbStore('', '', table=table, scan_segments=3).read_all_state()
+        self.assertEqual(sorted(i['replicaset'] for i in items), [f'rs{n}' for n in range(10)])
+
+    def test_snapshot_is_served_from_memory(self):
+        store = ListStore([dict(cluster='a', replicaset='rs0', ldt=bson_timestamp_to_int(Timestamp(100, 1)))])
+        cache = StateCache(store, ttl=60)
+        try:
+            items, refreshed_at = cache.snapshot(timeout=5)
+            self.assertEqual(items[0]['ldt'], bson_timestamp_to_int(Timestamp(100, 1)))
+            self.assertIsNotNone(refreshed_at)
+            cache.snapshot()
+            self.assertEqual(store.reads, 1)
+        finally:
+            cache.stop()
+
+    def test_query_filters_and_sorts_by_lag(self):
+        items = [dict(cluster='a', replicaset=f'rs{n}', ldt=bson_timestamp_to_int(Timestamp(1000 - n * 100, 1)),
+                      updated_at=None, conn=None) for n in range(4)]
+        items.append(dict(cluster='b', replicaset='rs0', ldt=None, updated_at=None, conn=None))
+        result, total = query_state(items, now=1000)
+        self.assertEqual(total, 5)
+        self.assertEqual([i['lag'] for i in result], [300, 200, 100, 0, None])
+        result, total = query_state(items, now=1000, cluster='a', min_lag=100, descending=False, limit=1)
+        self.assertEqual((total, result[0]['replicaset']), (3, 'rs1'))
+        with self.assertRaises(ValueError):
+            query_state(items, sort='conn')
@@ -1,32 +1,69 @@
+import os
+import threading
 from datetime import datetime
 
-from flask import Flask, render_template
+from flask import Flask, jsonify, render_template, request
 
-from helpers.bson_utils import int_to_bson_timestamp
-from state.ddb_store import DynamoDbStore
+from pytails.state import get_store_class
+from .state_cache import SORT_KEYS, StateCache, query_state
 
 app = Flask(__name__)
 
+_cache = None
+_cache_lock = threading.Lock()
 
-@app.route('/')
-def home():
-    items = get_state()
-    return render_template('index.html', items=items, updat=datetime.utcnow().strftime('%d %b %Y %H:%M:%S %z'))
+
+def get_cache() -> StateCache:
+    """
+    Returns the state cache shared by all requests of this process, creating it on first use.
+
+    The store is picked by `STATE_STORE` (`dynamodb` or `sqlite`, with `STATE_PATH`). `STATE_SCAN_SEGMENTS` sets the
+    parallel DynamoDB scan segments and `STATE_CACHE_TTL` the seconds between refreshes.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            name = os.environ.get('STATE_STORE', 'dynamodb')
+            if name == 'sqlite':
+                store = get_store_class(name)('', '', path=os.environ.get('STATE_PATH', 'pytails_checkpoints.db'))
+            else:
+                store = get_store_class(name)('', '', scan_segments=int(os.environ.get('STATE_SCAN_SEGMENTS', 4)))
+            _cache = StateCache(store, ttl=float(os.environ.get('STATE_CACHE_TTL', 30)))
+        return _cache
 
 
-def get_state():
-    store = DynamoDbStore('','')
-    items = store.read_all_state()
-    return process_state(items)
+def get_state() -> dict:
+    """
+    Returns the cached state filtered, sorted and paged by the request arguments
+    `cluster`, `replicaset`, `min_lag`, `sort`, `order`, `offset` and `limit`.
+    """
+    args = request.args
+    items, refreshed_at = get_cache().snapshot(timeout=60)
+    limit = args.get('limit', type=int)
+    items, total = query_state(items, cluster=args.get('cluster'), replicaset=args.get('replicaset'),
+                               min_lag=args.get('min_lag', type=float), sort=args.get('sort', 'lag'),
+                               descending=args.get('order', 'desc') != 'asc',
+                               offset=args.get('offset', 0, type=int), limit=limit)
+    refreshed = datetime.utcfromtimestamp(refreshed_at).isoformat() if refreshed_at else None
+    return dict(items=items, total=total, refreshed_at=refreshed, error=get_cache().error)
+
+
+@app.route('/')
+def home():
+    try:
+        state = get_state()
+    except ValueError as ex:
+        return str(ex), 400
+    return render_template('index.html', items=state['items'], error=state['error'], sort_keys=SORT_KEYS,
+                           updat=state['refreshed_at'] or 'never')
 
 
-def process_state(state: list):
-    for s in state:
-        try:
-            s['ldt_h'] = datetime.fromtimestamp(int_to_bson_timestamp(int(s['ldt'])).time)
-        except:
-            s['ldt_h'] = s['ldt']
-    return state
+@app.route('/api/state')
+def api_state():
+    try:
+        return jsonify(get_state())
+    except ValueError as ex:
+        return jsonify(error=str(ex)), 400
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from pytails.helpers.bson_utils import int_to_bson_timestamp
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('lag', 'cluster', 'replicaset', 'updated_at')
+
+
+class StateCache:
+    """
+    Serves the checkpoint state store from memory, so page loads and API polls never reach the store.
+
+    A background thread reads the whole store every `ttl` seconds. Requests get the last snapshot; only the first
+    one waits for the initial read. If a refresh fails, the previous snapshot is kept and the error is reported.
+    """
+
+    def __init__(self, store, ttl: float = 30.0):
+        """
+        :param store: StateStore. Store to read with `read_all_state`
+        :param ttl: float. Seconds between refreshes. Default: 30.0
+        """
+        self.store = store
+        self.ttl = ttl
+        self.error = None
+        self._items = None
+        self._refreshed_at = None
+        self._ready = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """
+        Starts the refresh thread. Called by the first `snapshot`.
+        """
+        with self._ready:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='state-cache', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.refresh()
+            self._stopped.wait(self.ttl)
+
+    def refresh(self) -> None:
+        """
+        Reads the store and replaces the snapshot.
+        """
+        try:
+            items = [normalise_item(i) for i in self.store.read_all_state() or []]
+        except Exception as ex:
+            logger.error(extra=dict(Func='Refresh', Op='StateCache', Attributes={'error': str(ex)}), msg='')
+            with self._ready:
+                self.error = str(ex)
+                self._ready.notify_all()
+            return
+        with self._ready:
+            self._items, self._refreshed_at, self.error = items, time.time(), None
+            self._ready.notify_all()
+
+    def snapshot(self, timeout: float = None) -> tuple:
+        """
+        Returns the last read state, waiting for the first read if needed.
+
+        :param timeout: float. Seconds to wait for the first read. Optional. Default: wait until it finished or failed
+        :return: tuple. (list of dict, refresh time as epoch seconds or None)
+        """
+        self.start()
+        with self._ready:
+            if self._items is None and self.error is None:
+                self._ready.wait(timeout)
+            return list(self._items or []), self._refreshed_at
+
+
+def normalise_item(item: dict) -> dict:
+    """
+    Converts a state store item to plain JSON types. The resume token is left out.
+
+    :param item: dict. Item from `read_all_state`
+    :return: dict. `{cluster, replicaset, ldt, updated_at, conn}`
+    """
+    ldt = item.get('ldt')
+    return dict(cluster=item.get('cluster'), replicaset=item.get('replicaset'),
+                ldt=int(ldt) if ldt is not None else None, updated_at=item.get('updated_at'), conn=item.get('conn'))
+
+
+def query_state(items: list, now: float = None, cluster: str = None, replicaset: str = None, min_lag: float = None,
+                sort: str = 'lag', descending: bool = True, offset: int = 0, limit: int = None) -> tuple:
+    """
+    Adds the lag of every checkpoint, then filters, sorts and pages the items.
+
+    :param items: list of dict. See `normalise_item`
+    :param now: float. Epoch seconds the lag is measured to. Default: now
+    :param cluster: str. Only items of this cluster. Optional.
+    :param replicaset: str. Only items of this replica set. Optional.
+    :param min_lag: float. Only items at least this many seconds behind. Optional.
+    :param sort: str. One of `SORT_KEYS`. Default: lag
+    :param descending: bool. Default: True, most lagging first
+    :param offset: int. Items skipped after sorting. Default: 0
+    :param limit: int. Maximum number of items returned. Optional.
+    :return: tuple. (list of dict with `lag` in seconds and `ldt_h`, number of items matching the filters)
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f'Unknown sort key {sort}. Available: {", ".join(SORT_KEYS)}')
+    now = time.time() if now is None else now
+    matched = []
+    for item in items:
+        if cluster and item['cluster'] != cluster or replicaset and item['replicaset'] != replicaset:
+            continue
+        item = dict(item, lag=None, ldt_h=None)
+        if item['ldt'] is not None:
+            seconds = int_to_bson_timestamp(item['ldt']).time
+            item['lag'] = max(0, int(now) - seconds)
+            item['ldt_h'] = datetime.utcfromtimestamp(seconds).isoformat()
+        if min_lag is not None and (item['lag'] is None or item['lag'] < min_lag):
+            continue
+        matched.append(item)
+    # items without a value sort last in either direction
+    present = sorted((i for i in matched if i[sort] is not None), key=lambda i: i[sort], reverse=descending)
+    ordered = present + [i for i in matched if i[sort] is None]
+    end = None if limit is None else offset + limit
+    return ordered[offset:end], len(matched)